@@ -0,0 +1,82 @@
+"""Benchmark: tempo de importação do server.py e custo das bibliotecas sob demanda.
+
+Cada repetição roda num processo Python novo, como um worker recém-criado:
+mede `import server`, confere que nenhuma biblioteca de relatório ou
+importação de arquivos foi carregada junto e quanto cada uma custa no
+primeiro uso (incremental, na ordem abaixo). A soma desses custos é o que
+cada worker pagaria na partida se elas fossem importadas no topo do módulo.
+Se alguma for carregada pelo `import server`, encerra com código 1.
+
+Não conecta ao MongoDB (o cliente só é criado no lifespan do app).
+
+Uso:
+    python benchmarks/bench_importacao.py [--repeticoes 5]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+# Ordem de dependência: o custo de cada uma não inclui o das anteriores
+SOB_DEMANDA = ['numpy', 'pyarrow', 'pyarrow.parquet', 'pandas', 'openpyxl', 'reportlab.pdfgen.canvas', 'xmltodict']
+
+SONDA = """
+import json, sys, time
+inicio = time.perf_counter()
+import server
+importacao = time.perf_counter() - inicio
+carregadas = [m for m in {modulos!r} if m in sys.modules]
+custos = {{}}
+for modulo in {modulos!r}:
+    inicio = time.perf_counter()
+    __import__(modulo)
+    custos[modulo] = time.perf_counter() - inicio
+print(json.dumps({{'importacao': importacao, 'carregadas': carregadas, 'custos': custos}}))
+"""
+
+
+def medir_processo() -> dict:
+    saida = subprocess.run(
+        [sys.executable, '-c', SONDA.format(modulos=SOB_DEMANDA)],
+        cwd=BACKEND, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(saida.strip().splitlines()[-1])
+
+
+def medir(repeticoes: int) -> dict:
+    """Medianas de `repeticoes` processos novos, em segundos"""
+    medidas = [medir_processo() for _ in range(repeticoes)]
+    importacao = [m['importacao'] for m in medidas]
+    return {
+        'server_s': round(statistics.median(importacao), 4),
+        'server_min_s': round(min(importacao), 4),
+        'server_max_s': round(max(importacao), 4),
+        'carregadas': sorted({modulo for m in medidas for modulo in m['carregadas']}),
+        'sob_demanda_s': {
+            modulo: round(statistics.median(m['custos'][modulo] for m in medidas), 4) for modulo in SOB_DEMANDA
+        },
+    }
+
+
+def main(repeticoes: int) -> bool:
+    r = medir(repeticoes)
+    print(f"import server ({repeticoes} processos): mediana={r['server_s']:.3f}s "
+          f"min={r['server_min_s']:.3f}s max={r['server_max_s']:.3f}s")
+    print(f"carregadas junto com server: {', '.join(r['carregadas']) or 'nenhuma'}")
+
+    print(f"\n{'primeiro uso':<26} {'mediana (s)':>12}")
+    for modulo, custo in r['sob_demanda_s'].items():
+        print(f"{modulo:<26} {custo:>12.3f}")
+    print(f"{'total sob demanda':<26} {sum(r['sob_demanda_s'].values()):>12.3f}")
+    return not r['carregadas']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeticoes', type=int, default=5, help="Processos novos medidos")
+    args = parser.parse_args()
+    sys.exit(0 if main(args.repeticoes) else 1)
@@ -0,0 +1,85 @@
+"""Benchmark: motor de impostos (decimal exato, compilado por regime) x cálculo float anterior.
+
+Mede itens/s do cálculo float item a item (implementação anterior, copiada
+abaixo como referência) e do avaliador de cada regime em lotes. A
+equivalência entre os dois (iguais exceto em empates de meio centavo) é
+verificada em tests/test_impostos.py, que reaproveita a referência e o
+gerador de itens daqui.
+
+Não usa banco de dados.
+
+Uso:
+    python benchmarks/bench_impostos.py [--itens 100000] [--lote 1000] [--semente 42]
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+REGIMES = ['Simples Nacional', 'Lucro Presumido', 'Lucro Real']
+ALIQUOTAS = {
+    'aliquota_icms': [0.0, 4.0, 7.0, 12.0, 17.0, 18.0, 19.5, 20.0],
+    'aliquota_pis': [0.0, 0.65, 1.65],
+    'aliquota_cofins': [0.0, 3.0, 7.6],
+    'aliquota_ipi': [0.0, 5.0, 10.0, 15.0],
+}
+
+
+def calcular_impostos_float(item: dict, regime: str) -> dict:
+    """Implementação anterior de `server.calcular_impostos` (float, arredondando cada imposto)"""
+    valor_total_item = item['valor_unitario'] * item['quantidade']
+    icms = valor_total_item * (item.get('aliquota_icms', 18.0) / 100)
+    pis = valor_total_item * (item.get('aliquota_pis', 1.65) / 100)
+    cofins = valor_total_item * (item.get('aliquota_cofins', 7.6) / 100)
+    ipi = valor_total_item * (item.get('aliquota_ipi', 0.0) / 100)
+    if regime == 'Simples Nacional':
+        icms *= 0.7
+    return {
+        'total_item': round(valor_total_item, 2),
+        'icms': round(icms, 2),
+        'pis': round(pis, 2),
+        'cofins': round(cofins, 2),
+        'ipi': round(ipi, 2)
+    }
+
+
+def gerar_itens(n: int, rng: random.Random) -> list:
+    itens = []
+    for _ in range(n):
+        quantidade = rng.randint(1, 500) if rng.random() < 0.7 else round(rng.uniform(0.001, 100), 3)
+        item = {'valor_unitario': round(rng.uniform(0.01, 5000), 2), 'quantidade': quantidade}
+        for campo, valores in ALIQUOTAS.items():
+            if rng.random() < 0.95:
+                item[campo] = rng.choice(valores)
+        itens.append(item)
+    return itens
+
+
+def medir(itens: list, tamanho_lote: int):
+    print(f"{'regime':<17} {'float (itens/s)':>16} {'motor (itens/s)':>16} {'razão':>7}")
+    for regime in REGIMES:
+        inicio = time.perf_counter()
+        for item in itens:
+            calcular_impostos_float(item, regime)
+        antigo = len(itens) / (time.perf_counter() - inicio)
+
+        avaliador = server.motor_impostos.avaliador(regime)
+        inicio = time.perf_counter()
+        for i in range(0, len(itens), tamanho_lote):
+            avaliador(itens[i:i + tamanho_lote])
+        novo = len(itens) / (time.perf_counter() - inicio)
+        print(f"{regime:<17} {antigo:>16,.0f} {novo:>16,.0f} {novo / antigo:>6.2f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--itens', type=int, default=100000)
+    parser.add_argument('--lote', type=int, default=1000, help="Itens por chamada ao avaliador")
+    parser.add_argument('--semente', type=int, default=42)
+    args = parser.parse_args()
+    medir(gerar_itens(args.itens, random.Random(args.semente)), args.lote)
@@ -0,0 +1,84 @@
+"""Teste de carga: latência de outros endpoints durante uma rajada de logins.
+
+Dispara `--logins` logins concorrentes contra o app em processo (httpx +
+ASGITransport, mesmo event loop) enquanto outro cliente consulta
+GET /api/empresas continuamente, e reporta p50/p99 dessas consultas.
+Com `--bloqueante` o bcrypt roda direto no event loop (comportamento antigo),
+para comparação. Usa o MongoDB configurado em backend/.env, num banco descartável.
+
+Uso:
+    python benchmarks/bench_login.py [--logins 50] [--bloqueante]
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import bcrypt
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+async def verificar_senha_bloqueante(senha, senha_hash):
+    return bcrypt.checkpw(senha.encode('utf-8'), senha_hash.encode('utf-8'))
+
+
+async def main(logins, bloqueante):
+    server.conectar_mongo()
+    server.db = server.client[f"bench_login_{uuid.uuid4().hex[:8]}"]
+    if bloqueante:
+        server.verificar_senha = verificar_senha_bloqueante
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        credenciais = {"nome": "Bench", "email": "bench@example.com", "senha": "senha-bench"}
+        resposta = await http.post("/api/auth/register", json=credenciais)
+        headers = {"Authorization": f"Bearer {resposta.json()['token']}"}
+
+        latencias = []
+        fim = asyncio.Event()
+
+        async def sondar():
+            while not fim.is_set():
+                inicio = time.perf_counter()
+                await http.get("/api/empresas", headers=headers)
+                latencias.append((time.perf_counter() - inicio) * 1000)
+                await asyncio.sleep(0.005)
+
+        async def logar():
+            await http.post("/api/auth/login", json={"email": credenciais["email"], "senha": credenciais["senha"]})
+
+        try:
+            sonda = asyncio.create_task(sondar())
+            inicio = time.perf_counter()
+            await asyncio.gather(*[logar() for _ in range(logins)])
+            duracao = time.perf_counter() - inicio
+            fim.set()
+            await sonda
+        finally:
+            await server.client.drop_database(server.db.name)
+
+    modo = "bloqueante" if bloqueante else f"executor ({server.BCRYPT_MAX_CONCURRENCY} threads)"
+    print(f"modo: {modo}, rounds={server.BCRYPT_ROUNDS}")
+    print(f"{logins} logins em {duracao:.2f}s ({logins / duracao:.1f} logins/s)")
+    print(f"GET /api/empresas durante a rajada: n={len(latencias)} "
+          f"p50={statistics.median(latencias):.1f}ms p99={percentil(latencias, 99):.1f}ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=50)
+    parser.add_argument('--bloqueante', action='store_true')
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.bloqueante))
@@ -0,0 +1,76 @@
+"""Benchmark: latência de POST /api/notas em função do número de itens.
+
+Compara a resolução de produtos item a item (uma consulta por item, como era
+feito antes) com a resolução em lote (`carregar_produtos` + `calcular_impostos_lote`).
+Usa o MongoDB configurado em backend/.env, num banco descartável.
+
+Uso:
+    python benchmarks/bench_notas.py [--itens 1,10,100,300,1000] [--repeticoes 5]
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+
+async def resolver_item_a_item(itens, usuario_id, regime):
+    """Caminho antigo: um find_one por item"""
+    resultado = []
+    for item in itens:
+        produto = await server.db.produtos.find_one({"id": item['produto_id'], "usuario_id": usuario_id})
+        item_completo = {**produto, 'quantidade': item['quantidade']}
+        resultado.append(server.calcular_impostos(item_completo, regime))
+    return resultado
+
+
+async def resolver_em_lote(itens, usuario_id, regime):
+    produtos = await server.carregar_produtos([i['produto_id'] for i in itens], usuario_id)
+    return server.montar_itens_nf(itens, produtos, regime)
+
+
+async def medir(fn, itens, usuario_id, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        await fn(itens, usuario_id, 'Simples Nacional')
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tempos)
+
+
+async def main(contagens, repeticoes):
+    server.conectar_mongo()
+    server.db = server.client[f"bench_notas_{uuid.uuid4().hex[:8]}"]
+    usuario_id = str(uuid.uuid4())
+    maior = max(contagens)
+    produtos = [
+        server.Produto(
+            empresa_id='bench', nome=f'Produto {i}', codigo=str(i), categoria='bench',
+            valor_unitario=10 + i * 0.37, usuario_id=usuario_id
+        ).model_dump()
+        for i in range(maior)
+    ]
+    await server.db.produtos.insert_many(produtos)
+    try:
+        print(f"{'itens':>6} {'item a item (ms)':>18} {'lote (ms)':>10} {'ganho':>7}")
+        for n in contagens:
+            itens = [{'produto_id': p['id'], 'quantidade': 2} for p in produtos[:n]]
+            antigo = await medir(resolver_item_a_item, itens, usuario_id, repeticoes)
+            novo = await medir(resolver_em_lote, itens, usuario_id, repeticoes)
+            print(f"{n:>6} {antigo:>18.2f} {novo:>10.2f} {antigo / novo:>6.1f}x")
+    finally:
+        await server.client.drop_database(server.db.name)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--itens', default='1,10,100,300,1000')
+    parser.add_argument('--repeticoes', type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main([int(n) for n in args.itens.split(',')], args.repeticoes))
@@ -0,0 +1,85 @@
+"""Benchmark: tempo e memória do relatório PDF detalhado (notas e itens).
+
+Popula um banco descartável no MongoDB de backend/.env com notas sintéticas
+e gera o PDF com `gerar_pdf` no próprio processo, como faria o worker.
+Mede o pico de memória alocada durante a geração (tracemalloc), que deve
+ficar estável conforme o número de itens cresce.
+
+Uso:
+    python benchmarks/bench_relatorio_pdf.py [--itens 5000,20000,50000] [--itens-por-nota 5]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from pymongo import MongoClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+
+def popular(database, usuario_id, total_itens, itens_por_nota):
+    inicio = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    empresas = [{'id': str(uuid.uuid4()), 'nome': f'Empresa {i}', 'usuario_id': usuario_id} for i in range(3)]
+    database.empresas.insert_many(empresas)
+    lote = []
+    for n in range(total_itens // itens_por_nota):
+        empresa = empresas[n % len(empresas)]
+        itens = [
+            {'produto_id': str(j), 'produto_nome': f'Produto {j:04d}', 'quantidade': 2, 'valor_unitario': 10.0,
+             'total_item': 20.0, 'icms': 3.6, 'pis': 0.33, 'cofins': 1.52, 'ipi': 0.0}
+            for j in range(itens_por_nota)
+        ]
+        lote.append({
+            'id': str(uuid.uuid4()), 'usuario_id': usuario_id, 'empresa_id': empresa['id'],
+            'empresa_nome': empresa['nome'], 'numero_nf': str(n), 'data_emissao': inicio + timedelta(minutes=n),
+            'itens': itens, 'total_valor': 20.0 * itens_por_nota, 'total_icms': 3.6 * itens_por_nota,
+            'total_pis': 0.33 * itens_por_nota, 'total_cofins': 1.52 * itens_por_nota, 'total_ipi': 0.0
+        })
+        if len(lote) >= 1000:
+            database.itens_nf.insert_many(server.separar_itens(lote))
+            database.notas_fiscais.insert_many(lote)
+            lote = []
+    if lote:
+        database.itens_nf.insert_many(server.separar_itens(lote))
+        database.notas_fiscais.insert_many(lote)
+
+
+def main(contagens, itens_por_nota):
+    cliente = MongoClient(server.mongo_url, tz_aware=True)
+    print(f"{'itens':>7} {'tempo (s)':>10} {'itens/s':>9} {'pico (MB)':>10} {'PDF (KB)':>9}")
+    for total_itens in contagens:
+        database = cliente[f"bench_pdf_{uuid.uuid4().hex[:8]}"]
+        usuario_id = str(uuid.uuid4())
+        try:
+            database.notas_fiscais.create_index([("usuario_id", 1), ("data_emissao", -1), ("id", -1)])
+            database.itens_nf.create_index([("nota_id", 1), ("seq", 1)], unique=True)
+            popular(database, usuario_id, total_itens, itens_por_nota)
+            parametros = server.RelatorioParametros(itens=True, data_inicio=datetime(2020, 1, 1, tzinfo=timezone.utc))
+            with tempfile.TemporaryDirectory() as pasta:
+                caminho = os.path.join(pasta, 'relatorio.pdf')
+                tracemalloc.start()
+                inicio = time.perf_counter()
+                server.gerar_pdf(database, usuario_id, parametros, caminho, lambda _: None)
+                duracao = time.perf_counter() - inicio
+                pico = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+                tracemalloc.stop()
+                tamanho = os.path.getsize(caminho) / 1024
+            print(f"{total_itens:>7} {duracao:>10.2f} {total_itens / duracao:>9.0f} {pico:>10.1f} {tamanho:>9.0f}")
+        finally:
+            cliente.drop_database(database.name)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--itens', default='5000,20000,50000')
+    parser.add_argument('--itens-por-nota', type=int, default=5)
+    args = parser.parse_args()
+    main([int(n) for n in args.itens.split(',')], args.itens_por_nota)
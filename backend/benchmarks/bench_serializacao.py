@@ -0,0 +1,82 @@
+"""Benchmark: serialização das respostas de leitura.
+
+Compara o caminho padrão do FastAPI (validação pelo response_model +
+jsonable/json.dumps) com o caminho rápido (`resposta_leitura`: orjson direto
+sobre os documentos do Mongo) para listas de notas e para uma nota com
+muitos itens. Não acessa o banco.
+
+Uso:
+    python benchmarks/bench_serializacao.py [--tamanhos 10,100,1000]
+"""
+import argparse
+import json
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List
+
+from pydantic import TypeAdapter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+
+def item(i):
+    return {
+        'produto_id': str(uuid.uuid4()), 'produto_nome': f'Produto {i}', 'quantidade': 2.0,
+        'valor_unitario': 10.5 + i, 'total_item': 21.0 + 2 * i, 'icms': 3.78, 'pis': 0.35, 'cofins': 1.6, 'ipi': 0.0
+    }
+
+
+def nota(n_itens):
+    agora = datetime.now(timezone.utc)
+    return {
+        'id': str(uuid.uuid4()), 'empresa_id': str(uuid.uuid4()), 'empresa_nome': 'Empresa Bench',
+        'numero_nf': '12345', 'data_emissao': agora, 'itens': [item(i) for i in range(n_itens)],
+        'total_valor': 1000.0, 'total_icms': 180.0, 'total_pis': 16.5, 'total_cofins': 76.0, 'total_ipi': 0.0,
+        'usuario_id': str(uuid.uuid4()), 'created_at': agora
+    }
+
+
+def caminho_pydantic(adapter, docs):
+    """O que o FastAPI faz com response_model: valida, serializa e json.dumps"""
+    conteudo = adapter.dump_python(adapter.validate_python(docs), mode='json')
+    return json.dumps(conteudo, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+
+
+def caminho_rapido(docs):
+    return server.RespostaJSON(docs).body
+
+
+def medir(fn, *args, minimo=0.5):
+    execucoes = 0
+    inicio = time.perf_counter()
+    while time.perf_counter() - inicio < minimo:
+        fn(*args)
+        execucoes += 1
+    return (time.perf_counter() - inicio) / execucoes * 1000
+
+
+def main(tamanhos):
+    cenarios = []
+    for n in tamanhos:
+        resumo = {k: v for k, v in nota(0).items() if k != 'itens'}
+        cenarios.append((f"lista de {n} notas (resumo)", TypeAdapter(List[server.NotaFiscalResumo]), [dict(resumo) for _ in range(n)]))
+        cenarios.append((f"nota com {n} itens", TypeAdapter(server.NotaFiscal), nota(n)))
+
+    print(f"{'payload':<32} {'pydantic (ms)':>14} {'orjson (ms)':>12} {'ganho':>7}")
+    for nome, adapter, docs in cenarios:
+        assert json.loads(caminho_pydantic(adapter, docs)) == json.loads(caminho_rapido(docs))
+        lento = medir(caminho_pydantic, adapter, docs)
+        rapido = medir(caminho_rapido, docs)
+        print(f"{nome:<32} {lento:>14.3f} {rapido:>12.3f} {lento / rapido:>6.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tamanhos', default='10,100,1000')
+    args = parser.parse_args()
+    main([int(n) for n in args.tamanhos.split(',')])
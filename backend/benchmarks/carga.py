@@ -0,0 +1,365 @@
+"""Suíte de benchmark e carga da API completa.
+
+Popula tenants sintéticos (usuário, empresas, produtos e notas) e exercita o
+app FastAPI real em processo (httpx + ASGITransport), cenário a cenário:
+login, criação de nota com N itens, listagem de notas, dashboard e os
+relatórios PDF e Excel. Para cada cenário reporta throughput e latências
+p50/p95/p99, e grava um JSON que pode ser comparado entre commits. O JSON
+traz também o tempo de `import server` em processos novos (bench_importacao).
+
+Backends:
+    --backend mongo     usa o MongoDB de backend/.env, num banco descartável
+    --backend memoria   usa mongomock-motor em processo (pip install mongomock-motor);
+                        operadores não suportados pelo mock aparecem como erros do cenário
+
+Uso:
+    python benchmarks/carga.py [--backend mongo] [--tenants 2] [--empresas 3] [--produtos 50]
+                               [--notas 500] [--itens 5] [--requisicoes 200] [--concorrencia 10]
+                               [--cenarios login,criar_nota,...] [--saida resultado.json]
+    python benchmarks/carga.py --comparar base.json novo.json [--limite 10]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+from bench_importacao import medir as medir_importacao  # noqa: E402
+
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+SENHA = "senha-bench"
+REGIMES = ['Simples Nacional', 'Lucro Presumido', 'Lucro Real']
+
+
+# ============= BACKENDS =============
+
+def usar_memoria():
+    """Troca o banco do app por mongomock, inclusive nos workers de relatório"""
+    try:
+        import mongomock
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        sys.exit("backend 'memoria' requer mongomock-motor: pip install mongomock-motor")
+    from concurrent.futures import ThreadPoolExecutor
+
+    sincrono = mongomock.MongoClient(tz_aware=True)
+    server.client = AsyncMongoMockClient(mock_mongo_client=sincrono)
+    server.db = server.client['bench']
+    # Os processos do pool não enxergam o banco em memória: relatórios rodam em threads
+    pool = ThreadPoolExecutor(max_workers=server.RELATORIO_WORKERS)
+    server.get_relatorio_pool = lambda: pool
+    server._worker_db = lambda: sincrono['bench']
+
+
+async def descartar_indices_parciais():
+    """mongomock ignora partialFilterExpression e aplicaria a unicidade a todos os documentos"""
+    for colecao, indices in server.INDEXES.items():
+        for indice in indices:
+            if 'partialFilterExpression' in indice.document:
+                await server.db[colecao].drop_index(indice.document['name'])
+
+
+def usar_mongo():
+    server.conectar_mongo()
+    server.db = server.client[f"bench_carga_{uuid.uuid4().hex[:8]}"]
+    original = server._worker_db
+    nome = server.db.name
+    server._worker_db = lambda: original().client[nome]
+
+
+# ============= DADOS SINTÉTICOS =============
+
+async def popular(args) -> list:
+    """Insere os tenants diretamente no banco e devolve o contexto de cada um"""
+    senha_hash = await server.hash_senha(SENHA)
+    tenants = []
+    inicio_periodo = datetime.now(timezone.utc) - timedelta(days=365)
+    for t in range(args.tenants):
+        usuario = server.Usuario(nome=f"Tenant {t}", email=f"tenant{t}@bench.example.com")
+        await server.db.usuarios.insert_one({**usuario.model_dump(), 'senha_hash': senha_hash})
+
+        empresas = [
+            server.Empresa(
+                nome=f"Empresa {t}-{e}", cnpj=f"{t:04d}{e:04d}000100", rua="Rua A", numero="1",
+                bairro="Centro", cidade="São Paulo", estado="SP", cep="01000-000",
+                regime_tributario=REGIMES[e % len(REGIMES)], usuario_id=usuario.id
+            ).model_dump()
+            for e in range(args.empresas)
+        ]
+        await server.db.empresas.insert_many(empresas)
+
+        produtos_por_empresa = {}
+        for empresa in empresas:
+            produtos = [
+                server.Produto(
+                    empresa_id=empresa['id'], nome=f"Produto {p}", codigo=f"P{p:05d}",
+                    categoria=f"Categoria {p % 7}", valor_unitario=round(random.uniform(1, 500), 2),
+                    aliquota_ipi=random.choice([0.0, 5.0, 10.0]), usuario_id=usuario.id
+                ).model_dump()
+                for p in range(args.produtos)
+            ]
+            await server.db.produtos.insert_many(produtos)
+            produtos_por_empresa[empresa['id']] = {p['id']: p for p in produtos}
+
+        notas = []
+        for n in range(args.notas):
+            empresa = empresas[n % len(empresas)]
+            catalogo = produtos_por_empresa[empresa['id']]
+            itens = [
+                {'produto_id': pid, 'quantidade': random.randint(1, 20)}
+                for pid in random.sample(list(catalogo), min(args.itens, len(catalogo)))
+            ]
+            itens_nf = server.montar_itens_nf(itens, catalogo, empresa['regime_tributario'])
+            nota = server.NotaFiscal(
+                empresa_id=empresa['id'], empresa_nome=empresa['nome'], numero_nf=f"S{n:07d}",
+                data_emissao=inicio_periodo + timedelta(minutes=random.randint(0, 365 * 24 * 60)),
+                itens=itens_nf,
+                total_valor=round(sum(i.total_item for i in itens_nf), 2),
+                total_icms=round(sum(i.icms for i in itens_nf), 2),
+                total_pis=round(sum(i.pis for i in itens_nf), 2),
+                total_cofins=round(sum(i.cofins for i in itens_nf), 2),
+                total_ipi=round(sum(i.ipi for i in itens_nf), 2),
+                usuario_id=usuario.id
+            ).model_dump()
+            notas.append(nota)
+            if len(notas) >= 1000:
+                await server.inserir_notas(notas)
+                await server.atualizar_resumos(notas)
+                notas = []
+        if notas:
+            await server.inserir_notas(notas)
+            await server.atualizar_resumos(notas)
+
+        tenants.append({
+            'email': usuario.email,
+            'empresas': empresas,
+            'produtos': {eid: list(cat) for eid, cat in produtos_por_empresa.items()},
+            'headers': None
+        })
+    return tenants
+
+
+# ============= CENÁRIOS =============
+
+SEQUENCIA_NF = itertools.count()
+
+
+async def cenario_login(http, tenant, args):
+    return await http.post("/api/auth/login", json={"email": tenant['email'], "senha": SENHA})
+
+
+async def cenario_criar_nota(http, tenant, args):
+    empresa = random.choice(tenant['empresas'])
+    produtos = tenant['produtos'][empresa['id']]
+    itens = [{'produto_id': random.choice(produtos), 'quantidade': random.randint(1, 20)} for _ in range(args.itens_nota)]
+    return await http.post("/api/notas", headers=tenant['headers'], json={
+        "empresa_id": empresa['id'], "numero_nf": f"B{next(SEQUENCIA_NF):08d}", "itens": itens
+    })
+
+
+async def cenario_listar_notas(http, tenant, args):
+    return await http.get("/api/notas", headers=tenant['headers'], params={"limit": 100})
+
+
+async def cenario_dashboard(http, tenant, args):
+    return await http.get("/api/dashboard", headers=tenant['headers'])
+
+
+async def cenario_relatorio_pdf(http, tenant, args):
+    return await http.get("/api/relatorios/pdf", headers=tenant['headers'])
+
+
+async def cenario_relatorio_excel(http, tenant, args):
+    return await http.get("/api/relatorios/excel", headers=tenant['headers'])
+
+
+CENARIOS = {
+    'login': cenario_login,
+    'criar_nota': cenario_criar_nota,
+    'listar_notas': cenario_listar_notas,
+    'dashboard': cenario_dashboard,
+    'relatorio_pdf': cenario_relatorio_pdf,
+    'relatorio_excel': cenario_relatorio_excel,
+}
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+async def executar_cenario(http, nome, tenants, args) -> dict:
+    funcao = CENARIOS[nome]
+    requisicoes = args.requisicoes_relatorio if nome.startswith('relatorio') else args.requisicoes
+    latencias, erros, exemplo_erro = [], 0, None
+    fila = iter(range(requisicoes))
+
+    async def trabalhador():
+        nonlocal erros, exemplo_erro
+        for i in fila:
+            tenant = tenants[i % len(tenants)]
+            inicio = time.perf_counter()
+            try:
+                resposta = await funcao(http, tenant, args)
+                ok = resposta.status_code < 400
+                if not ok and exemplo_erro is None:
+                    exemplo_erro = f"HTTP {resposta.status_code}: {resposta.text[:200]}"
+            except Exception as e:
+                ok = False
+                exemplo_erro = exemplo_erro or f"{type(e).__name__}: {e}"[:200]
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            erros += not ok
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*[trabalhador() for _ in range(args.concorrencia)])
+    duracao = time.perf_counter() - inicio
+    return {
+        "requisicoes": requisicoes,
+        "erros": erros,
+        "exemplo_erro": exemplo_erro,
+        "duracao_s": round(duracao, 3),
+        "throughput_rps": round(requisicoes / duracao, 2),
+        "media_ms": round(statistics.mean(latencias), 2),
+        "p50_ms": round(percentil(latencias, 50), 2),
+        "p95_ms": round(percentil(latencias, 95), 2),
+        "p99_ms": round(percentil(latencias, 99), 2),
+    }
+
+
+def commit_atual() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconhecido"
+
+
+async def executar(args) -> dict:
+    random.seed(args.semente)
+    usar_memoria() if args.backend == 'memoria' else usar_mongo()
+
+    transport = httpx.ASGITransport(app=server.app)
+    # O shutdown do app fecha e descarta o cliente: o banco descartável é removido antes
+    async with server.app.router.lifespan_context(server.app):
+        try:
+            if args.backend == 'memoria':
+                await descartar_indices_parciais()
+            inicio = time.perf_counter()
+            tenants = await popular(args)
+            tempo_carga = time.perf_counter() - inicio
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as http:
+                for tenant in tenants:
+                    resposta = await http.post("/api/auth/login", json={"email": tenant['email'], "senha": SENHA})
+                    tenant['headers'] = {"Authorization": f"Bearer {resposta.json()['token']}"}
+                resultados = {}
+                for nome in args.cenarios:
+                    resultados[nome] = await executar_cenario(http, nome, tenants, args)
+                    r = resultados[nome]
+                    print(f"{nome:<16} {r['throughput_rps']:>9.1f} req/s  p50={r['p50_ms']:.1f}ms "
+                          f"p95={r['p95_ms']:.1f}ms p99={r['p99_ms']:.1f}ms  erros={r['erros']}", file=sys.stderr)
+        finally:
+            if args.backend == 'mongo':
+                await server.client.drop_database(server.db.name)
+
+    return {
+        "commit": commit_atual(),
+        "data": datetime.now(timezone.utc).isoformat(),
+        "backend": args.backend,
+        "configuracao": {
+            k: getattr(args, k) for k in (
+                'tenants', 'empresas', 'produtos', 'notas', 'itens', 'itens_nota',
+                'requisicoes', 'requisicoes_relatorio', 'concorrencia', 'semente'
+            )
+        },
+        "tempo_carga_s": round(tempo_carga, 2),
+        "importacao": medir_importacao(args.repeticoes_importacao),
+        "cenarios": resultados,
+    }
+
+
+# ============= COMPARAÇÃO =============
+
+def comparar(base_arquivo, novo_arquivo, limite) -> int:
+    """Compara dois resultados; devolve 1 se algum p95/throughput piorou além do limite (%)"""
+    base = json.loads(Path(base_arquivo).read_text())
+    novo = json.loads(Path(novo_arquivo).read_text())
+    print(f"base {base['commit']} -> novo {novo['commit']} (limite {limite}%)")
+    print(f"{'cenário':<16} {'métrica':<15} {'base':>10} {'novo':>10} {'variação':>9}")
+    regressoes = 0
+    for nome, r_novo in novo['cenarios'].items():
+        r_base = base['cenarios'].get(nome)
+        if not r_base:
+            continue
+        for metrica, maior_e_melhor in (('throughput_rps', True), ('p50_ms', False), ('p95_ms', False), ('p99_ms', False)):
+            antes, depois = r_base[metrica], r_novo[metrica]
+            variacao = (depois - antes) / antes * 100 if antes else 0.0
+            piorou = -variacao if maior_e_melhor else variacao
+            marca = ''
+            if metrica in ('throughput_rps', 'p95_ms') and piorou > limite:
+                marca = '  REGRESSÃO'
+                regressoes += 1
+            print(f"{nome:<16} {metrica:<15} {antes:>10.2f} {depois:>10.2f} {variacao:>+8.1f}%{marca}")
+    if 'importacao' in base and 'importacao' in novo:
+        antes, depois = base['importacao']['server_s'], novo['importacao']['server_s']
+        variacao = (depois - antes) / antes * 100 if antes else 0.0
+        marca = ''
+        if variacao > limite or novo['importacao']['carregadas']:
+            marca = '  REGRESSÃO'
+            regressoes += 1
+        print(f"{'import server':<16} {'s':<15} {antes:>10.3f} {depois:>10.3f} {variacao:>+8.1f}%{marca}")
+    return 1 if regressoes else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backend', choices=['mongo', 'memoria'], default='mongo')
+    parser.add_argument('--tenants', type=int, default=2)
+    parser.add_argument('--empresas', type=int, default=3, help="Empresas por tenant")
+    parser.add_argument('--produtos', type=int, default=50, help="Produtos por empresa")
+    parser.add_argument('--notas', type=int, default=500, help="Notas por tenant")
+    parser.add_argument('--itens', type=int, default=5, help="Itens por nota na carga inicial")
+    parser.add_argument('--itens-nota', type=int, default=20, help="Itens por nota no cenário criar_nota")
+    parser.add_argument('--requisicoes', type=int, default=200)
+    parser.add_argument('--requisicoes-relatorio', type=int, default=10)
+    parser.add_argument('--concorrencia', type=int, default=10)
+    parser.add_argument('--cenarios', default=','.join(CENARIOS))
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--repeticoes-importacao', type=int, default=5, help="Processos novos medidos no import do server")
+    parser.add_argument('--saida', help="Arquivo JSON de resultado (padrão: stdout)")
+    parser.add_argument('--comparar', nargs=2, metavar=('BASE', 'NOVO'))
+    parser.add_argument('--limite', type=float, default=10.0, help="Piora percentual tolerada na comparação")
+    args = parser.parse_args()
+
+    if args.comparar:
+        sys.exit(comparar(*args.comparar, args.limite))
+
+    args.cenarios = [c for c in args.cenarios.split(',') if c]
+    desconhecidos = set(args.cenarios) - set(CENARIOS)
+    if desconhecidos:
+        parser.error(f"cenários desconhecidos: {', '.join(sorted(desconhecidos))}")
+
+    resultado = json.dumps(asyncio.run(executar(args)), indent=2, ensure_ascii=False)
+    if args.saida:
+        Path(args.saida).write_text(resultado + '\n')
+    else:
+        print(resultado)
+
+
+if __name__ == '__main__':
+    main()
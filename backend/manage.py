@@ -0,0 +1,88 @@
+"""Comandos administrativos do FiscalManager.
+
+Uso:
+    python manage.py indices              # uso dos índices, ausentes e não declarados
+    python manage.py indices --reconciliar
+    python manage.py produtos-duplicados  # (empresa_id, codigo) repetidos que impedem o índice único
+    python manage.py resumos [--usuario ID] [--corrigir]   # divergências dos resumos
+    python manage.py migrar-datas [--lote 1000] [--pausa 0.1]  # datas em texto -> datas BSON
+    python manage.py migrar-itens [--lote 1000] [--pausa 0.1]  # itens embutidos -> itens_nf
+    python manage.py servir [--host 0.0.0.0] [--port 8001] [--workers 4]  # app pré-carregado, workers por fork
+"""
+import argparse
+import asyncio
+import json
+import os
+
+import server
+import servidor
+
+
+async def cmd_indices(args):
+    if args.reconciliar:
+        return await server.reconciliar_indices()
+    return await server.relatorio_indices()
+
+
+async def cmd_produtos_duplicados(args):
+    return await server.produtos_duplicados()
+
+
+async def cmd_resumos(args):
+    return await server.reconciliar_resumos(args.usuario, args.corrigir)
+
+
+async def cmd_migrar_datas(args):
+    return await server.migrar_datas(args.lote, args.pausa)
+
+
+async def cmd_migrar_itens(args):
+    return await server.migrar_itens(args.lote, args.pausa)
+
+
+async def executar(args):
+    server.conectar_mongo()
+    return await args.func(args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comandos administrativos do FiscalManager")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    indices = sub.add_parser("indices", help="Relatório e reconciliação de índices")
+    indices.add_argument("--reconciliar", action="store_true", help="Cria/recria índices declarados")
+    indices.set_defaults(func=cmd_indices)
+
+    duplicados = sub.add_parser("produtos-duplicados", help="Produtos com (empresa_id, codigo) repetido")
+    duplicados.set_defaults(func=cmd_produtos_duplicados)
+
+    resumos = sub.add_parser("resumos", help="Recalcula os resumos a partir das notas e reporta divergências")
+    resumos.add_argument("--usuario", help="Restringe a um usuario_id")
+    resumos.add_argument("--corrigir", action="store_true", help="Regrava os resumos divergentes")
+    resumos.set_defaults(func=cmd_resumos)
+
+    migrar = sub.add_parser("migrar-datas", help="Converte datas gravadas como texto em datas BSON (retomável)")
+    migrar.add_argument("--lote", type=int, default=1000, help="Documentos por lote")
+    migrar.add_argument("--pausa", type=float, default=0.0, help="Pausa em segundos entre lotes")
+    migrar.set_defaults(func=cmd_migrar_datas)
+
+    itens = sub.add_parser("migrar-itens", help="Move itens embutidos nas notas para itens_nf (retomável)")
+    itens.add_argument("--lote", type=int, default=1000, help="Notas por lote")
+    itens.add_argument("--pausa", type=float, default=0.0, help="Pausa em segundos entre lotes")
+    itens.set_defaults(func=cmd_migrar_itens)
+
+    servir = sub.add_parser("servir", help="Sobe a API; com --workers > 1 o app é carregado antes do fork")
+    servir.add_argument("--host", default="0.0.0.0")
+    servir.add_argument("--port", type=int, default=8001)
+    servir.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", 1)),
+                        help="Processos worker (padrão: WEB_CONCURRENCY ou 1)")
+
+    args = parser.parse_args()
+    if args.comando == "servir":
+        return servidor.servir(args.host, args.port, args.workers)
+    resultado = asyncio.run(executar(args))
+    print(json.dumps(resultado, indent=2, ensure_ascii=False, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Query, Request, Response
+from fastapi.responses import FileResponse, ORJSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
@@ -13,33 +13,323 @@ import uuid
 from datetime import datetime, timezone, timedelta
 import bcrypt
 import jwt
-import xmltodict
-import io
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib.units import cm
-import openpyxl
-from openpyxl.styles import Font, Alignment, PatternFill
+import orjson
+import json
+import base64
+import re
+import asyncio
+import zipfile
+import hashlib
+import functools
+import heapq
+import multiprocessing
+import math
+import zlib
+from decimal import Decimal
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pymongo import monitoring, MongoClient, ASCENDING, DESCENDING, IndexModel, UpdateOne, DeleteOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+import unicodedata
+import codecs
+from contextlib import asynccontextmanager
+# pandas/numpy, pyarrow, openpyxl, reportlab e xmltodict são importados dentro
+# das funções de importação e relatório: só quem usa paga o custo de carregá-los
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# Instrumentation
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+EVENT_LOOP_LAG_INTERVAL = float(os.environ.get('EVENT_LOOP_LAG_INTERVAL', 0.5))
+
+# ============= METRICS =============
+
+BUCKETS_LATENCIA = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _formatar_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    pares = []
+    for nome, valor in labels:
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pares.append(f'{nome}="{valor}"')
+    return '{' + ','.join(pares) + '}'
+
+class Contador:
+    """Contador Prometheus; seguro para uso a partir das threads do pymongo"""
+    tipo = 'counter'
+
+    def __init__(self, nome: str, ajuda: str):
+        self.nome, self.ajuda = nome, ajuda
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, valor: float = 1, **labels):
+        chave = tuple(sorted(labels.items()))
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def amostras(self):
+        with self._lock:
+            return [(self.nome, chave, valor) for chave, valor in self._valores.items()]
+
+class Histograma(Contador):
+    tipo = 'histogram'
+
+    def __init__(self, nome: str, ajuda: str, buckets: tuple = BUCKETS_LATENCIA):
+        super().__init__(nome, ajuda)
+        self.buckets = buckets
+
+    def observar(self, valor: float, **labels):
+        chave = tuple(sorted(labels.items()))
+        with self._lock:
+            contagens, soma, total = self._valores.get(chave, ([0] * len(self.buckets), 0.0, 0))
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    contagens[i] += 1
+            self._valores[chave] = (contagens, soma + valor, total + 1)
+
+    def amostras(self):
+        linhas = []
+        with self._lock:
+            for chave, (contagens, soma, total) in self._valores.items():
+                for limite, contagem in zip(self.buckets, contagens):
+                    linhas.append((f"{self.nome}_bucket", chave + (('le', limite),), contagem))
+                linhas.append((f"{self.nome}_bucket", chave + (('le', '+Inf'),), total))
+                linhas.append((f"{self.nome}_sum", chave, soma))
+                linhas.append((f"{self.nome}_count", chave, total))
+        return linhas
+
+class Medidor:
+    """Gauge calculado no momento da coleta"""
+    tipo = 'gauge'
+
+    def __init__(self, nome: str, ajuda: str, coletar):
+        self.nome, self.ajuda, self._coletar = nome, ajuda, coletar
+
+    def amostras(self):
+        return [(self.nome, tuple(sorted(labels.items())), valor) for labels, valor in self._coletar()]
+
+METRICAS = []
+
+def registrar_metrica(metrica):
+    METRICAS.append(metrica)
+    return metrica
+
+def exportar_metricas() -> str:
+    """Todas as métricas no formato texto de exposição do Prometheus"""
+    linhas = []
+    for metrica in METRICAS:
+        linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+        linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+        for nome, labels, valor in metrica.amostras():
+            linhas.append(f"{nome}{_formatar_labels(labels)} {valor}")
+    return '\n'.join(linhas) + '\n'
+
+HTTP_DURACAO = registrar_metrica(Histograma(
+    'http_request_duration_seconds', 'Latência das requisições HTTP por rota'
+))
+MONGO_DURACAO = registrar_metrica(Histograma(
+    'mongo_command_duration_seconds', 'Duração dos comandos MongoDB por coleção'
+))
+MONGO_DOCUMENTOS = registrar_metrica(Contador(
+    'mongo_documents_total', 'Documentos devolvidos (consultas) ou afetados (escritas) por coleção'
+))
+MONGO_LENTOS = registrar_metrica(Contador(
+    'mongo_slow_commands_total', 'Comandos MongoDB acima de SLOW_QUERY_MS'
+))
+EVENT_LOOP_LAG = registrar_metrica(Histograma(
+    'event_loop_lag_seconds', 'Atraso do event loop medido a cada EVENT_LOOP_LAG_INTERVAL'
+))
+
+def _formato_comando(valor):
+    """Forma de um filtro/pipeline sem os valores: campos e operadores ficam, valores viram o nome do tipo.
+
+    Filtros carregam e-mails, CNPJs e IDs de usuário, que não devem ir para o log.
+    """
+    if isinstance(valor, dict):
+        return {chave: _formato_comando(v) for chave, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_formato_comando(v) for v in valor[:5]] + (['...'] if len(valor) > 5 else [])
+    return type(valor).__name__
+
+class MongoMetricasListener(monitoring.CommandListener):
+    """Registra contagem, duração e documentos de cada comando; loga os lentos (sem valores dos filtros)"""
+
+    def __init__(self):
+        self._em_andamento = {}
+
+    def started(self, event):
+        colecao = event.command.get(event.command_name)
+        if event.command_name == 'getMore':
+            colecao = event.command.get('collection')
+        resumo = None
+        if event.command_name in ('find', 'aggregate', 'count', 'update', 'delete', 'findAndModify'):
+            resumo = {
+                k: _formato_comando(event.command[k])
+                for k in ('filter', 'pipeline', 'query', 'updates', 'deletes') if k in event.command
+            }
+        self._em_andamento[(event.connection_id, event.request_id)] = (
+            colecao if isinstance(colecao, str) else '-', resumo
+        )
+
+    def _finalizar(self, event, status: str, reply: Optional[dict] = None):
+        colecao, resumo = self._em_andamento.pop((event.connection_id, event.request_id), ('-', None))
+        duracao = event.duration_micros / 1_000_000
+        MONGO_DURACAO.observar(duracao, collection=colecao, command=event.command_name, status=status)
+        if reply:
+            cursor = reply.get('cursor') or {}
+            documentos = len(cursor.get('firstBatch', cursor.get('nextBatch', []))) if cursor else reply.get('n', 0)
+            if documentos:
+                MONGO_DOCUMENTOS.inc(documentos, collection=colecao, command=event.command_name)
+        if duracao * 1000 >= SLOW_QUERY_MS:
+            MONGO_LENTOS.inc(collection=colecao, command=event.command_name)
+            logging.getLogger(__name__).warning(
+                f"Comando lento ({duracao * 1000:.0f} ms): {event.command_name} {event.database_name}.{colecao} "
+                f"{str(resumo)[:500] if resumo else ''}"
+            )
+
+    def succeeded(self, event):
+        self._finalizar(event, 'ok', event.reply)
+
+    def failed(self, event):
+        self._finalizar(event, 'erro')
+
+class MetricasMiddleware:
+    """Middleware ASGI que mede a latência por rota (template, não o path bruto)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        inicio = time.perf_counter()
+        status_code = 500
+
+        async def send_com_status(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_com_status)
+        finally:
+            rota = getattr(scope.get('route'), 'path', 'desconhecida')
+            HTTP_DURACAO.observar(
+                time.perf_counter() - inicio, method=scope['method'], route=rota, status=status_code
+            )
+
+async def monitorar_event_loop():
+    """Mede quanto um sleep de EVENT_LOOP_LAG_INTERVAL atrasa além do previsto"""
+    loop = asyncio.get_running_loop()
+    while True:
+        inicio = loop.time()
+        await asyncio.sleep(EVENT_LOOP_LAG_INTERVAL)
+        EVENT_LOOP_LAG.observar(max(loop.time() - inicio - EVENT_LOOP_LAG_INTERVAL, 0.0))
+
+# MongoDB connection: created by the app lifespan, so each worker opens its own
+# pool after the fork; scripts call conectar_mongo() themselves
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 100))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 0))
+client: Optional[AsyncIOMotorClient] = None
+db = None
+
+def conectar_mongo():
+    """Cria o cliente MongoDB do processo, se ainda não existir, e devolve o banco"""
+    global client, db
+    if client is None:
+        client = AsyncIOMotorClient(
+            mongo_url, tz_aware=True, maxPoolSize=MONGO_MAX_POOL_SIZE, minPoolSize=MONGO_MIN_POOL_SIZE,
+            event_listeners=[MongoMetricasListener()]
+        )
+        db = client[os.environ['DB_NAME']]
+    return db
 
 # JWT Configuration
 JWT_SECRET = os.environ.get('JWT_SECRET', 'fiscalmanager_secret_key_2025')
 JWT_ALGORITHM = 'HS256'
 JWT_EXPIRATION = 24  # hours
 
+# Password hashing (bcrypt releases the GIL, so a thread pool keeps it off the event loop)
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+BCRYPT_MAX_CONCURRENCY = int(os.environ.get('BCRYPT_MAX_CONCURRENCY', 4))
+
+# Read endpoints serialize trusted Mongo documents with orjson, skipping response_model re-validation
+FAST_JSON_RESPONSES = os.environ.get('FAST_JSON_RESPONSES', 'true').lower() == 'true'
+
+# Pagination
+PAGE_SIZE_DEFAULT = int(os.environ.get('PAGE_SIZE_DEFAULT', 100))
+PAGE_SIZE_MAX = int(os.environ.get('PAGE_SIZE_MAX', 1000))
+
+# Verified token cache and per-user tenant context (token version + empresas)
+TOKEN_CACHE_MAX = int(os.environ.get('TOKEN_CACHE_MAX', 10000))
+CONTEXTO_CACHE_MAX = int(os.environ.get('CONTEXTO_CACHE_MAX', 5000))
+CONTEXTO_CACHE_TTL = float(os.environ.get('CONTEXTO_CACHE_TTL', 30))
+
+# Versioned GET responses (ETag/304 plus in-process cache per usuario_id and URL)
+RESPOSTA_CACHE_MAX = int(os.environ.get('RESPOSTA_CACHE_MAX', 2000))
+RESPOSTA_CACHE_TTL = float(os.environ.get('RESPOSTA_CACHE_TTL', 300))
+RESPOSTA_CACHE_MAX_BYTES = int(os.environ.get('RESPOSTA_CACHE_MAX_BYTES', 1024 * 1024))
+
+# Product catalog cache (per usuario_id, empresa_id)
+CATALOGO_CACHE_MAX = int(os.environ.get('CATALOGO_CACHE_MAX', 1000))
+CATALOGO_CACHE_TTL = float(os.environ.get('CATALOGO_CACHE_TTL', 300))
+CATALOGO_CACHE_MAX_PRODUTOS = int(os.environ.get('CATALOGO_CACHE_MAX_PRODUTOS', 200000))  # across all catalogs
+CATALOGO_MAX_PRODUTOS = int(os.environ.get('CATALOGO_MAX_PRODUTOS', 5000))  # larger catalogs use $in lookups
+
+# Reports
+RELATORIO_BATCH_SIZE = int(os.environ.get('RELATORIO_BATCH_SIZE', 1000))
+RELATORIO_WORKERS = int(os.environ.get('RELATORIO_WORKERS', 2))
+RELATORIO_TTL_SECONDS = int(os.environ.get('RELATORIO_TTL_SECONDS', 3600))
+RELATORIO_LEASE_SECONDS = int(os.environ.get('RELATORIO_LEASE_SECONDS', 60))  # job without heartbeat for this long is orphaned
+RELATORIO_ESPERA_SECONDS = float(os.environ.get('RELATORIO_ESPERA_SECONDS', 120))  # sync routes answer 202 after this
+RELATORIOS_DIR = Path(os.environ.get('RELATORIOS_DIR', ROOT_DIR / 'relatorios_cache'))
+
+# NF-e XML import
+NFE_IMPORT_WORKERS = int(os.environ.get('NFE_IMPORT_WORKERS', os.cpu_count() or 2))
+NFE_IMPORT_BATCH_SIZE = int(os.environ.get('NFE_IMPORT_BATCH_SIZE', 500))
+NFE_MAX_XML_BYTES = int(os.environ.get('NFE_MAX_XML_BYTES', 5 * 1024 * 1024))
+
+# Batch nota creation
+NOTAS_LOTE_MAX = int(os.environ.get('NOTAS_LOTE_MAX', 1000))
+
+# Cascade deletion of empresas (background, batched) and archival of old notas
+EXCLUSAO_BATCH_SIZE = int(os.environ.get('EXCLUSAO_BATCH_SIZE', 1000))
+EXCLUSAO_LEASE_SECONDS = int(os.environ.get('EXCLUSAO_LEASE_SECONDS', 120))
+NOTAS_ARQUIVO_DIAS = int(os.environ.get('NOTAS_ARQUIVO_DIAS', 0))  # 0 disables automatic archival
+NOTAS_ARQUIVO_INTERVALO = int(os.environ.get('NOTAS_ARQUIVO_INTERVALO', 6 * 3600))
+ARQUIVO_BATCH_SIZE = int(os.environ.get('ARQUIVO_BATCH_SIZE', 1000))
+ARQUIVO_LEASE_SECONDS = int(os.environ.get('ARQUIVO_LEASE_SECONDS', 120))  # only the lease holder archives
+
+# Tax rules: JSON file merged over the built-in REGRAS_TRIBUTARIAS
+REGRAS_TRIBUTARIAS_ARQUIVO = os.environ.get('REGRAS_TRIBUTARIAS_ARQUIVO')
+# LRU of combined item rates per regime and tax
+TAXAS_CACHE_MAX = int(os.environ.get('TAXAS_CACHE_MAX', 256))
+
+# Product CSV/XLSX import
+PRODUTO_IMPORT_CHUNK = int(os.environ.get('PRODUTO_IMPORT_CHUNK', 5000))
+
 security = HTTPBearer()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Conexões, índices e tarefas de fundo; ver MIDDLEWARE & STARTUP"""
+    await startup()
+    try:
+        yield
+    finally:
+        await shutdown()
+
 # Create the main app
-app = FastAPI(title="FiscalManager Total API")
+app = FastAPI(title="FiscalManager Total API", lifespan=lifespan)
 api_router = APIRouter(prefix="/api")
 
 # ============= MODELS =============
@@ -141,11 +431,31 @@ class NotaFiscal(BaseModel):
     usuario_id: str
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class NotaFiscalResumo(BaseModel):
+    """Cabeçalho e totais de uma nota, sem os itens (usado nas listagens)"""
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    empresa_id: str
+    empresa_nome: str
+    numero_nf: str
+    data_emissao: datetime
+    total_valor: float
+    total_icms: float
+    total_pis: float
+    total_cofins: float
+    total_ipi: float
+    usuario_id: str
+    created_at: datetime
+
 class NotaFiscalCreate(BaseModel):
     empresa_id: str
     numero_nf: str
     itens: List[dict]
 
+class NotaFiscalLote(BaseModel):
+    notas: List[NotaFiscalCreate]
+    transacao: bool = False
+
 class DashboardStats(BaseModel):
     total_empresas: int
     total_produtos: int
@@ -156,40 +466,369 @@ class DashboardStats(BaseModel):
 
 # ============= AUTHENTICATION =============
 
-def create_token(usuario_id: str, email: str, role: str) -> str:
+class CacheLRU:
+    """LRU limitado em que cada entrada tem seu próprio instante de expiração (epoch, None = sem expiração).
+
+    É o cache em memória de todo o módulo: tokens, contextos, respostas,
+    catálogos de produtos e taxas do motor de impostos. Com `max_peso`, o
+    limite vale também para a soma dos pesos (ex.: produtos dos catálogos).
+    """
+
+    def __init__(self, max_entradas: int, max_peso: Optional[int] = None):
+        self.max_entradas, self.max_peso = max_entradas, max_peso
+        self.peso = 0
+        self._entradas = OrderedDict()
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def obter(self, chave):
+        entrada = self._entradas.get(chave)
+        if entrada is None:
+            return None
+        valor, expira_em, _ = entrada
+        if expira_em is not None and expira_em <= time.time():
+            self.descartar(chave)
+            return None
+        self._entradas.move_to_end(chave)
+        return valor
+
+    def guardar(self, chave, valor, expira_em: Optional[float] = None, peso: int = 1):
+        self.descartar(chave)
+        self._entradas[chave] = (valor, expira_em, peso)
+        self.peso += peso
+        while self._entradas and (
+            len(self._entradas) > self.max_entradas or (self.max_peso is not None and self.peso > self.max_peso)
+        ):
+            self.peso -= self._entradas.popitem(last=False)[1][2]
+
+    def descartar(self, chave):
+        entrada = self._entradas.pop(chave, None)
+        if entrada is not None:
+            self.peso -= entrada[2]
+
+AUTH_CACHE_CONSULTAS = registrar_metrica(Contador(
+    'auth_cache_total', 'Consultas aos caches de autenticação por cache (token, contexto) e resultado (hit, miss)'
+))
+
+# sha256(token) -> payload; a entrada expira junto com o `exp` do próprio token
+_tokens = CacheLRU(TOKEN_CACHE_MAX)
+
+def create_token(usuario_id: str, email: str, role: str, versao: int = 0) -> str:
     payload = {
         'usuario_id': usuario_id,
         'email': email,
         'role': role,
+        'ver': versao,
         'exp': datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION)
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 def verify_token(token: str) -> dict:
+    chave = hashlib.sha256(token.encode('utf-8')).digest()
+    payload = _tokens.obter(chave)
+    AUTH_CACHE_CONSULTAS.inc(cache='token', resultado='miss' if payload is None else 'hit')
+    if payload is not None:
+        return payload
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expirado")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Token inválido")
-
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    token = credentials.credentials
-    payload = verify_token(token)
+    _tokens.guardar(chave, payload, payload['exp'])
     return payload
 
+_hash_executor: Optional[ThreadPoolExecutor] = None
+
+def get_hash_executor() -> ThreadPoolExecutor:
+    """Executor do bcrypt, criado no primeiro uso e descartado no shutdown do app"""
+    global _hash_executor
+    if _hash_executor is None:
+        _hash_executor = ThreadPoolExecutor(max_workers=BCRYPT_MAX_CONCURRENCY, thread_name_prefix='bcrypt')
+    return _hash_executor
+
+async def hash_senha(senha: str) -> str:
+    loop = asyncio.get_running_loop()
+    senha_hash = await loop.run_in_executor(
+        get_hash_executor(), lambda: bcrypt.hashpw(senha.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
+    )
+    return senha_hash.decode('utf-8')
+
+async def verificar_senha(senha: str, senha_hash: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_hash_executor(), bcrypt.checkpw, senha.encode('utf-8'), senha_hash.encode('utf-8')
+    )
+
+def precisa_rehash(senha_hash: str) -> bool:
+    """Indica se o hash foi gerado com um custo diferente de BCRYPT_ROUNDS"""
+    try:
+        return int(senha_hash.split('$')[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+EMPRESA_CONTEXTO_PROJECTION = {"_id": 0, "id": 1, "nome": 1, "cnpj": 1, "regime_tributario": 1}
+
+# usuario_id -> (token_versao, {empresa_id: empresa}, versão de empresas em dados_versoes);
+# válido por CONTEXTO_CACHE_TTL segundos
+_contextos = CacheLRU(CONTEXTO_CACHE_MAX)
+
+registrar_metrica(Medidor(
+    'auth_cache_entradas', 'Entradas mantidas nos caches de autenticação',
+    lambda: [({'cache': 'token'}, len(_tokens)), ({'cache': 'contexto'}, len(_contextos))]
+))
+
+class ContextoTenant:
+    """Usuário autenticado e as empresas dele, resolvidos uma vez por requisição.
+
+    A versão do token e o conjunto de empresas vêm de `_contextos`, recarregado
+    do banco a cada CONTEXTO_CACHE_TTL segundos; escritas neste worker descartam
+    a entrada na hora (`descartar_contexto`). Leituras toleram uma cópia de até
+    TTL segundos, mas escritas passam por `atualizar_empresas`, que compara a
+    versão de empresas em dados_versoes: uma empresa excluída em outro worker
+    não recebe produtos nem notas novas.
+    """
+    __slots__ = ('usuario', 'empresas', 'versao_empresas')
+
+    def __init__(self, usuario: dict, empresas: dict, versao_empresas: int):
+        self.usuario, self.empresas, self.versao_empresas = usuario, empresas, versao_empresas
+
+    @property
+    def usuario_id(self) -> str:
+        return self.usuario['usuario_id']
+
+    async def atualizar_empresas(self):
+        """Recarrega as empresas se alguma foi criada, alterada ou excluída desde a carga"""
+        versao = (await versoes_dados(self.usuario_id)).get('empresas', 0)
+        if versao != self.versao_empresas:
+            descartar_contexto(self.usuario_id)
+            _, self.empresas, self.versao_empresas = await carregar_contexto(self.usuario_id)
+
+    async def exigir_empresa(self, empresa_id: str) -> dict:
+        """Empresa do usuário, conferida contra a versão atual; 404 se não existe mais"""
+        await self.atualizar_empresas()
+        empresa = self.empresas.get(empresa_id)
+        if empresa is None:
+            raise HTTPException(status_code=404, detail="Empresa não encontrada")
+        return empresa
+
+def descartar_contexto(usuario_id: str):
+    """Chamar após escritas em empresas ou revogação de tokens do usuário"""
+    _contextos.descartar(usuario_id)
+
+async def carregar_contexto(usuario_id: str) -> tuple:
+    contexto = _contextos.obter(usuario_id)
+    AUTH_CACHE_CONSULTAS.inc(cache='contexto', resultado='miss' if contexto is None else 'hit')
+    if contexto is None:
+        # Versão lida antes das empresas: uma escrita no meio deixa a cópia já desatualizada
+        versao_empresas = (await versoes_dados(usuario_id)).get('empresas', 0)
+        usuario, empresas = await asyncio.gather(
+            db.usuarios.find_one({"id": usuario_id}, {"_id": 0, "token_versao": 1}),
+            db.empresas.find({"usuario_id": usuario_id}, EMPRESA_CONTEXTO_PROJECTION).to_list(None)
+        )
+        if usuario is None:
+            raise HTTPException(status_code=401, detail="Token inválido")
+        contexto = (usuario.get('token_versao', 0), {e['id']: e for e in empresas}, versao_empresas)
+        _contextos.guardar(usuario_id, contexto, time.time() + CONTEXTO_CACHE_TTL)
+    return contexto
+
+async def get_contexto(credentials: HTTPAuthorizationCredentials = Depends(security)) -> ContextoTenant:
+    payload = verify_token(credentials.credentials)
+    token_versao, empresas, versao_empresas = await carregar_contexto(payload['usuario_id'])
+    if payload.get('ver', 0) != token_versao:
+        raise HTTPException(status_code=401, detail="Token revogado")
+    return ContextoTenant(payload, empresas, versao_empresas)
+
+async def get_current_user(contexto: ContextoTenant = Depends(get_contexto)):
+    return contexto.usuario
+
+async def get_admin_user(current_user: dict = Depends(get_current_user)):
+    if current_user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="Acesso restrito a administradores")
+    return current_user
+
+# ============= SERIALIZATION =============
+
+class RespostaJSON(ORJSONResponse):
+    """JSON via orjson, com datas UTC no formato do Pydantic (sufixo Z)"""
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+
+HEADERS_PAGINACAO = ('X-Total-Count', 'X-Next-Cursor')
+
+def projecao_modelo(modelo) -> dict:
+    """Projeção Mongo com exatamente os campos do modelo de resposta"""
+    return {"_id": 0, **{campo: 1 for campo in modelo.model_fields}}
+
+def resposta_leitura(conteudo, response: Optional[Response] = None):
+    """Resposta dos endpoints de leitura.
+
+    Os documentos já vêm do Mongo projetados nos campos do response_model, então
+    com FAST_JSON_RESPONSES vão direto para o orjson, sem instanciar modelos.
+    Sem a opção, o FastAPI valida e serializa pelo caminho normal.
+    """
+    if not FAST_JSON_RESPONSES:
+        return conteudo
+    headers = {}
+    if response is not None:
+        headers = {h: response.headers[h] for h in HEADERS_PAGINACAO if h in response.headers}
+    return RespostaJSON(conteudo, headers=headers)
+
+# ============= PAGINATION =============
+
+def _cursor_valor(valor):
+    if isinstance(valor, datetime):
+        return {"$dt": valor.isoformat()}
+    return valor
+
+def _valor_cursor(valor):
+    if isinstance(valor, dict) and "$dt" in valor:
+        return datetime.fromisoformat(valor["$dt"])
+    return valor
+
+def encode_cursor(doc: dict, campo: str) -> str:
+    """Cursor opaco com a chave de ordenação e o id do último documento da página"""
+    bruto = json.dumps([_cursor_valor(doc.get(campo)), doc['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(bruto.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        valor, doc_id = json.loads(bruto)
+        return _valor_cursor(valor), str(doc_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+def data_para_filtro(data: datetime) -> datetime:
+    """Normaliza uma data para UTC (datas sem fuso são consideradas UTC)"""
+    if data.tzinfo is None:
+        data = data.replace(tzinfo=timezone.utc)
+    return data.astimezone(timezone.utc)
+
+async def paginar(colecao, query: dict, projection: dict, campo: str, direcao: int,
+                  limit: int, cursor: Optional[str], response: Response) -> List[dict]:
+    """Paginação por keyset sobre (campo, id).
+
+    Devolve a página e preenche os headers X-Total-Count (total do filtro) e
+    X-Next-Cursor (ausente na última página).
+    """
+    filtro = query
+    if cursor:
+        valor, doc_id = decode_cursor(cursor)
+        op = "$lt" if direcao == DESCENDING else "$gt"
+        filtro = {"$and": [query, {"$or": [
+            {campo: {op: valor}},
+            {campo: valor, "id": {op: doc_id}}
+        ]}]}
+    total, docs = await asyncio.gather(
+        colecao.count_documents(query),
+        colecao.find(filtro, projection).sort([(campo, direcao), ("id", direcao)]).limit(limit + 1).to_list(limit + 1)
+    )
+    response.headers['X-Total-Count'] = str(total)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        response.headers['X-Next-Cursor'] = encode_cursor(docs[-1], campo)
+    return docs
+
+# ============= CACHE DE RESPOSTAS =============
+
+RESPOSTAS_CONSULTAS = registrar_metrica(Contador(
+    'respostas_cache_total', 'Leituras versionadas por resultado (nao_modificado, hit, miss)'
+))
+
+# (usuario_id, path, query) -> (etag, corpo, headers)
+_respostas = CacheLRU(RESPOSTA_CACHE_MAX)
+
+registrar_metrica(Medidor(
+    'respostas_cache_entradas', 'Respostas de leitura mantidas em memória', lambda: [({}, len(_respostas))]
+))
+
+async def versoes_dados(usuario_id: str) -> dict:
+    """Versão de cada coleção do usuário (empresas, produtos, notas); ausente vale 0"""
+    doc = await db.dados_versoes.find_one({"usuario_id": usuario_id}, {"_id": 0, "usuario_id": 0})
+    return doc or {}
+
+async def invalidar_leituras(usuario_id: str, *colecoes: str):
+    """Incrementa a versão das coleções alteradas; chamar após qualquer escrita nelas"""
+    await db.dados_versoes.update_one(
+        {"usuario_id": usuario_id}, {"$inc": {c: 1 for c in colecoes}}, upsert=True
+    )
+
+async def invalidar_leituras_usuarios(usuario_ids, *colecoes: str):
+    """`invalidar_leituras` de vários usuários numa única escrita (migrações e jobs em lote)"""
+    operacoes = [
+        UpdateOne({"usuario_id": u}, {"$inc": {c: 1 for c in colecoes}}, upsert=True) for u in set(usuario_ids)
+    ]
+    if operacoes:
+        await db.dados_versoes.bulk_write(operacoes, ordered=False)
+
+def _etag_aceito(etag: str, if_none_match: Optional[str]) -> bool:
+    if not if_none_match:
+        return False
+    candidatos = [t.strip().removeprefix('W/') for t in if_none_match.split(',')]
+    return '*' in candidatos or etag in candidatos
+
+class LeituraVersionada:
+    """GET amarrado às versões das coleções de que a resposta depende.
+
+    Quando nada mudou desde a última resposta, `resposta` já vem pronta (304
+    ou a cópia em cache) e o handler só a devolve; senão ele monta o conteúdo
+    e devolve `responder(conteudo)`, que adiciona o ETag e guarda o corpo.
+    """
+    __slots__ = ('chave', 'etag', 'response', 'resposta')
+
+    def __init__(self, chave: tuple, etag: str, response: Response):
+        self.chave, self.etag, self.response = chave, etag, response
+        self.resposta = None
+
+    def responder(self, conteudo):
+        resposta = resposta_leitura(conteudo, self.response)
+        if not isinstance(resposta, Response):
+            # Sem FAST_JSON_RESPONSES o FastAPI serializa; aproveita só o ETag
+            self.response.headers.update(_headers_etag(self.etag))
+            return resposta
+        resposta.headers.update(_headers_etag(self.etag))
+        if len(resposta.body) <= RESPOSTA_CACHE_MAX_BYTES:
+            _respostas.guardar(
+                self.chave, (self.etag, resposta.body, dict(resposta.headers)), time.time() + RESPOSTA_CACHE_TTL
+            )
+        return resposta
+
+def _headers_etag(etag: str) -> dict:
+    # no-cache: o navegador guarda a resposta, mas revalida com If-None-Match a cada uso
+    return {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+def leitura_versionada(*colecoes: str):
+    """Dependência de GETs cujo conteúdo só muda com escritas em `colecoes`"""
+    async def dependencia(
+        request: Request, response: Response, contexto: ContextoTenant = Depends(get_contexto)
+    ) -> LeituraVersionada:
+        usuario_id = contexto.usuario_id
+        versoes = await versoes_dados(usuario_id)
+        chave = (usuario_id, request.url.path, request.url.query)
+        assinatura = '|'.join([*chave, *(f"{c}:{versoes.get(c, 0)}" for c in colecoes)])
+        etag = '"' + hashlib.sha256(assinatura.encode('utf-8')).hexdigest()[:32] + '"'
+        leitura = LeituraVersionada(chave, etag, response)
+        if _etag_aceito(etag, request.headers.get('if-none-match')):
+            RESPOSTAS_CONSULTAS.inc(resultado='nao_modificado')
+            leitura.resposta = Response(status_code=304, headers=_headers_etag(etag))
+            return leitura
+        guardada = _respostas.obter(chave)
+        if guardada is not None and guardada[0] == etag:
+            RESPOSTAS_CONSULTAS.inc(resultado='hit')
+            leitura.resposta = Response(guardada[1], headers=guardada[2])
+            return leitura
+        RESPOSTAS_CONSULTAS.inc(resultado='miss')
+        return leitura
+    return dependencia
+
 # ============= ROUTES - AUTH =============
 
 @api_router.post("/auth/register", response_model=dict)
 async def register(user: UsuarioCreate):
-    # Check if email exists
-    existing = await db.usuarios.find_one({"email": user.email})
-    if existing:
-        raise HTTPException(status_code=400, detail="Email já cadastrado")
-    
     # Hash password
-    senha_hash = bcrypt.hashpw(user.senha.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    senha_hash = await hash_senha(user.senha)
     
     # Create user
     usuario = Usuario(
@@ -200,9 +839,12 @@ async def register(user: UsuarioCreate):
     
     doc = usuario.model_dump()
     doc['senha_hash'] = senha_hash
-    doc['created_at'] = doc['created_at'].isoformat()
     
-    await db.usuarios.insert_one(doc)
+    # Email uniqueness is enforced by the usuarios.email unique index
+    try:
+        await db.usuarios.insert_one(doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email já cadastrado")
     
     token = create_token(usuario.id, usuario.email, usuario.role)
     
@@ -225,10 +867,15 @@ async def login(credentials: UsuarioLogin):
         raise HTTPException(status_code=401, detail="Credenciais inválidas")
     
     # Verify password
-    if not bcrypt.checkpw(credentials.senha.encode('utf-8'), user['senha_hash'].encode('utf-8')):
+    if not await verificar_senha(credentials.senha, user['senha_hash']):
         raise HTTPException(status_code=401, detail="Credenciais inválidas")
     
-    token = create_token(user['id'], user['email'], user['role'])
+    # Transparently upgrade hashes created with a different work factor
+    if precisa_rehash(user['senha_hash']):
+        novo_hash = await hash_senha(credentials.senha)
+        await db.usuarios.update_one({"id": user['id']}, {"$set": {"senha_hash": novo_hash}})
+    
+    token = create_token(user['id'], user['email'], user['role'], user.get('token_versao', 0))
     
     return {
         "message": "Login realizado com sucesso",
@@ -241,38 +888,59 @@ async def login(credentials: UsuarioLogin):
         }
     }
 
+@api_router.post("/auth/revogar", response_model=dict)
+async def revogar_tokens(current_user: dict = Depends(get_current_user)):
+    """Invalida todos os tokens emitidos até agora para o usuário (logout em todos os dispositivos)"""
+    await db.usuarios.update_one({"id": current_user['usuario_id']}, {"$inc": {"token_versao": 1}})
+    descartar_contexto(current_user['usuario_id'])
+    return {"message": "Tokens revogados com sucesso"}
+
 # ============= ROUTES - EMPRESAS =============
 
+EMPRESA_PROJECTION = projecao_modelo(Empresa)
+
 @api_router.post("/empresas", response_model=Empresa)
 async def create_empresa(empresa: EmpresaCreate, current_user: dict = Depends(get_current_user)):
-    # Check if CNPJ already exists for this user
-    existing = await db.empresas.find_one({"cnpj": empresa.cnpj, "usuario_id": current_user['usuario_id']})
-    if existing:
-        raise HTTPException(status_code=400, detail="CNPJ já cadastrado")
-    
     empresa_obj = Empresa(**empresa.model_dump(), usuario_id=current_user['usuario_id'])
     doc = empresa_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     
-    await db.empresas.insert_one(doc)
+    # CNPJ uniqueness per user is enforced by the (usuario_id, cnpj) unique index
+    try:
+        await db.empresas.insert_one(doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="CNPJ já cadastrado")
+    descartar_contexto(current_user['usuario_id'])
+    await invalidar_leituras(current_user['usuario_id'], 'empresas')
     return empresa_obj
 
 @api_router.get("/empresas", response_model=List[Empresa])
-async def list_empresas(current_user: dict = Depends(get_current_user)):
-    empresas = await db.empresas.find({"usuario_id": current_user['usuario_id']}, {"_id": 0}).to_list(1000)
-    for e in empresas:
-        if isinstance(e['created_at'], str):
-            e['created_at'] = datetime.fromisoformat(e['created_at'])
-    return empresas
+async def list_empresas(
+    response: Response,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    leitura: LeituraVersionada = Depends(leitura_versionada('empresas')),
+    current_user: dict = Depends(get_current_user)
+):
+    if leitura.resposta:
+        return leitura.resposta
+    empresas = await paginar(
+        db.empresas, {"usuario_id": current_user['usuario_id']}, EMPRESA_PROJECTION,
+        "created_at", ASCENDING, limit, cursor, response
+    )
+    return leitura.responder(empresas)
 
 @api_router.get("/empresas/{empresa_id}", response_model=Empresa)
-async def get_empresa(empresa_id: str, current_user: dict = Depends(get_current_user)):
-    empresa = await db.empresas.find_one({"id": empresa_id, "usuario_id": current_user['usuario_id']}, {"_id": 0})
+async def get_empresa(
+    empresa_id: str,
+    leitura: LeituraVersionada = Depends(leitura_versionada('empresas')),
+    current_user: dict = Depends(get_current_user)
+):
+    if leitura.resposta:
+        return leitura.resposta
+    empresa = await db.empresas.find_one({"id": empresa_id, "usuario_id": current_user['usuario_id']}, EMPRESA_PROJECTION)
     if not empresa:
         raise HTTPException(status_code=404, detail="Empresa não encontrada")
-    if isinstance(empresa['created_at'], str):
-        empresa['created_at'] = datetime.fromisoformat(empresa['created_at'])
-    return empresa
+    return leitura.responder(empresa)
 
 @api_router.put("/empresas/{empresa_id}", response_model=Empresa)
 async def update_empresa(empresa_id: str, empresa_data: EmpresaCreate, current_user: dict = Depends(get_current_user)):
@@ -281,349 +949,3094 @@ async def update_empresa(empresa_id: str, empresa_data: EmpresaCreate, current_u
         raise HTTPException(status_code=404, detail="Empresa não encontrada")
     
     update_data = empresa_data.model_dump()
-    await db.empresas.update_one({"id": empresa_id}, {"$set": update_data})
+    try:
+        await db.empresas.update_one({"id": empresa_id}, {"$set": update_data})
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="CNPJ já cadastrado")
+    descartar_contexto(current_user['usuario_id'])
+    await invalidar_leituras(current_user['usuario_id'], 'empresas')
     
     updated = await db.empresas.find_one({"id": empresa_id}, {"_id": 0})
-    if isinstance(updated['created_at'], str):
-        updated['created_at'] = datetime.fromisoformat(updated['created_at'])
     return updated
 
 @api_router.delete("/empresas/{empresa_id}")
 async def delete_empresa(empresa_id: str, current_user: dict = Depends(get_current_user)):
+    """Exclui a empresa; produtos, notas e resumos dela são removidos em segundo plano"""
     result = await db.empresas.delete_one({"id": empresa_id, "usuario_id": current_user['usuario_id']})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Empresa não encontrada")
-    return {"message": "Empresa excluída com sucesso"}
+    descartar_contexto(current_user['usuario_id'])
+    await invalidar_leituras(current_user['usuario_id'], 'empresas')
+    exclusao = await agendar_exclusao(current_user['usuario_id'], empresa_id)
+    return {"message": "Empresa excluída com sucesso", "exclusao_id": exclusao['id']}
+
+# ============= CACHE DE CATÁLOGO =============
+
+PRODUTO_IMPOSTOS_PROJECTION = {
+    "_id": 0, "id": 1, "nome": 1, "valor_unitario": 1,
+    "aliquota_icms": 1, "aliquota_pis": 1, "aliquota_cofins": 1, "aliquota_ipi": 1
+}
+CAMPOS_NUMERICOS_PRODUTO = ['valor_unitario', 'aliquota_icms', 'aliquota_pis', 'aliquota_cofins', 'aliquota_ipi']
+
+def _finito(valor) -> bool:
+    return isinstance(valor, (int, float)) and math.isfinite(valor)
+
+def exigir_valores_finitos(produto: BaseModel):
+    """400 para NaN/Infinity: o json do Python os aceita e o cálculo dos impostos não"""
+    invalidos = [c for c in CAMPOS_NUMERICOS_PRODUTO
+                 if getattr(produto, c) is not None and not _finito(getattr(produto, c))]
+    if invalidos:
+        raise HTTPException(status_code=400, detail=f"Valor inválido em {', '.join(invalidos)}")
+
+CATALOGO_CONSULTAS = registrar_metrica(Contador(
+    'catalogo_cache_total', 'Consultas ao cache de catálogos de produtos por resultado (hit, miss, stale)'
+))
+
+# (usuario_id, empresa_id) -> (versão em `catalogo_versoes` lida na carga, {id: produto});
+# válido por CATALOGO_CACHE_TTL segundos. Como toda escrita em produtos incrementa
+# essa versão no banco, uma cópia de outro worker é descartada na leitura seguinte.
+# O peso de cada entrada é o número de produtos; catálogos acima de
+# CATALOGO_MAX_PRODUTOS ficam só marcados (produtos None) e são consultados com $in.
+_catalogos = CacheLRU(CATALOGO_CACHE_MAX, CATALOGO_CACHE_MAX_PRODUTOS)
+
+registrar_metrica(Medidor(
+    'catalogo_cache_entradas', 'Catálogos de produtos mantidos em memória', lambda: [({}, len(_catalogos))]
+))
+registrar_metrica(Medidor(
+    'catalogo_cache_produtos', 'Produtos nos catálogos mantidos em memória', lambda: [({}, _catalogos.peso)]
+))
+
+async def versao_catalogo(usuario_id: str, empresa_id: str) -> int:
+    doc = await db.catalogo_versoes.find_one(
+        {"usuario_id": usuario_id, "empresa_id": empresa_id}, {"_id": 0, "versao": 1}
+    )
+    return doc['versao'] if doc else 0
+
+async def invalidar_catalogo(usuario_id: str, *empresa_ids: str):
+    """Incrementa a versão dos catálogos afetados; chamar após qualquer escrita em produtos"""
+    empresa_ids = {e for e in empresa_ids if e}
+    if not empresa_ids:
+        return
+    for empresa_id in empresa_ids:
+        _catalogos.descartar((usuario_id, empresa_id))
+    await db.catalogo_versoes.bulk_write([
+        UpdateOne({"usuario_id": usuario_id, "empresa_id": empresa_id}, {"$inc": {"versao": 1}}, upsert=True)
+        for empresa_id in empresa_ids
+    ], ordered=False)
+
+async def obter_catalogo(usuario_id: str, empresa_id: str) -> Optional[dict]:
+    """Catálogo `id -> produto` (campos usados no cálculo de impostos) de uma empresa.
+
+    None se a empresa tem mais de CATALOGO_MAX_PRODUTOS produtos: carregar o
+    catálogo inteiro para precificar poucos itens não compensa.
+    """
+    chave = (usuario_id, empresa_id)
+    # Versão lida antes dos produtos: se uma escrita ocorrer no meio, a cópia já nasce desatualizada
+    versao = await versao_catalogo(usuario_id, empresa_id)
+    entrada = _catalogos.obter(chave)
+    if entrada is not None and entrada[0] == versao:
+        CATALOGO_CONSULTAS.inc(resultado='hit')
+        return entrada[1]
+    CATALOGO_CONSULTAS.inc(resultado='miss' if entrada is None else 'stale')
+    cursor = db.produtos.find({"usuario_id": usuario_id, "empresa_id": empresa_id}, PRODUTO_IMPOSTOS_PROJECTION) \
+        .limit(CATALOGO_MAX_PRODUTOS + 1)
+    produtos = {p['id']: p async for p in cursor}
+    if len(produtos) > CATALOGO_MAX_PRODUTOS:
+        produtos = None
+    _catalogos.guardar(chave, (versao, produtos), time.time() + CATALOGO_CACHE_TTL, peso=len(produtos or ()) or 1)
+    return produtos
 
 # ============= ROUTES - PRODUTOS =============
 
+PRODUTO_PROJECTION = projecao_modelo(Produto)
+CODIGO_DUPLICADO = "Já existe um produto com este código na empresa"
+
 @api_router.post("/produtos", response_model=Produto)
-async def create_produto(produto: ProdutoCreate, current_user: dict = Depends(get_current_user)):
-    # Verify empresa belongs to user
-    empresa = await db.empresas.find_one({"id": produto.empresa_id, "usuario_id": current_user['usuario_id']})
-    if not empresa:
-        raise HTTPException(status_code=404, detail="Empresa não encontrada")
+async def create_produto(produto: ProdutoCreate, contexto: ContextoTenant = Depends(get_contexto)):
+    current_user = contexto.usuario
+    exigir_valores_finitos(produto)
+    await contexto.exigir_empresa(produto.empresa_id)
     
     produto_obj = Produto(**produto.model_dump(), usuario_id=current_user['usuario_id'])
     doc = produto_obj.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     
-    await db.produtos.insert_one(doc)
+    # (empresa_id, codigo) é único: a importação de planilhas faz upsert por esse par
+    try:
+        await db.produtos.insert_one(doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail=CODIGO_DUPLICADO)
+    await invalidar_catalogo(current_user['usuario_id'], produto.empresa_id)
+    await invalidar_leituras(current_user['usuario_id'], 'produtos')
     return produto_obj
 
 @api_router.get("/produtos", response_model=List[Produto])
-async def list_produtos(empresa_id: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+async def list_produtos(
+    response: Response,
+    empresa_id: Optional[str] = None,
+    categoria: Optional[str] = None,
+    codigo: Optional[str] = None,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    leitura: LeituraVersionada = Depends(leitura_versionada('produtos')),
+    current_user: dict = Depends(get_current_user)
+):
+    if leitura.resposta:
+        return leitura.resposta
     query = {"usuario_id": current_user['usuario_id']}
     if empresa_id:
         query["empresa_id"] = empresa_id
+    if categoria:
+        query["categoria"] = categoria
+    if codigo:
+        query["codigo"] = codigo
     
-    produtos = await db.produtos.find(query, {"_id": 0}).to_list(1000)
-    for p in produtos:
-        if isinstance(p['created_at'], str):
-            p['created_at'] = datetime.fromisoformat(p['created_at'])
-    return produtos
+    produtos = await paginar(db.produtos, query, PRODUTO_PROJECTION, "created_at", ASCENDING, limit, cursor, response)
+    return leitura.responder(produtos)
 
 @api_router.get("/produtos/{produto_id}", response_model=Produto)
-async def get_produto(produto_id: str, current_user: dict = Depends(get_current_user)):
-    produto = await db.produtos.find_one({"id": produto_id, "usuario_id": current_user['usuario_id']}, {"_id": 0})
+async def get_produto(
+    produto_id: str,
+    leitura: LeituraVersionada = Depends(leitura_versionada('produtos')),
+    current_user: dict = Depends(get_current_user)
+):
+    if leitura.resposta:
+        return leitura.resposta
+    produto = await db.produtos.find_one({"id": produto_id, "usuario_id": current_user['usuario_id']}, PRODUTO_PROJECTION)
     if not produto:
         raise HTTPException(status_code=404, detail="Produto não encontrado")
-    if isinstance(produto['created_at'], str):
-        produto['created_at'] = datetime.fromisoformat(produto['created_at'])
-    return produto
+    return leitura.responder(produto)
 
 @api_router.put("/produtos/{produto_id}", response_model=Produto)
-async def update_produto(produto_id: str, produto_data: ProdutoCreate, current_user: dict = Depends(get_current_user)):
+async def update_produto(produto_id: str, produto_data: ProdutoCreate, contexto: ContextoTenant = Depends(get_contexto)):
+    current_user = contexto.usuario
+    exigir_valores_finitos(produto_data)
     existing = await db.produtos.find_one({"id": produto_id, "usuario_id": current_user['usuario_id']})
     if not existing:
         raise HTTPException(status_code=404, detail="Produto não encontrado")
+    if produto_data.empresa_id != existing['empresa_id']:
+        await contexto.exigir_empresa(produto_data.empresa_id)
     
     update_data = produto_data.model_dump()
-    await db.produtos.update_one({"id": produto_id}, {"$set": update_data})
+    try:
+        await db.produtos.update_one({"id": produto_id}, {"$set": update_data})
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail=CODIGO_DUPLICADO)
+    await invalidar_catalogo(current_user['usuario_id'], existing['empresa_id'], produto_data.empresa_id)
+    await invalidar_leituras(current_user['usuario_id'], 'produtos')
     
     updated = await db.produtos.find_one({"id": produto_id}, {"_id": 0})
-    if isinstance(updated['created_at'], str):
-        updated['created_at'] = datetime.fromisoformat(updated['created_at'])
     return updated
 
 @api_router.delete("/produtos/{produto_id}")
 async def delete_produto(produto_id: str, current_user: dict = Depends(get_current_user)):
-    result = await db.produtos.delete_one({"id": produto_id, "usuario_id": current_user['usuario_id']})
-    if result.deleted_count == 0:
+    produto = await db.produtos.find_one_and_delete(
+        {"id": produto_id, "usuario_id": current_user['usuario_id']}, {"_id": 0, "empresa_id": 1}
+    )
+    if not produto:
         raise HTTPException(status_code=404, detail="Produto não encontrado")
+    await invalidar_catalogo(current_user['usuario_id'], produto['empresa_id'])
+    await invalidar_leituras(current_user['usuario_id'], 'produtos')
     return {"message": "Produto excluído com sucesso"}
 
-# ============= ROUTES - NOTAS FISCAIS =============
+# ============= ROUTES - IMPORTAÇÃO DE PRODUTOS =============
 
-def calcular_impostos(item: dict, regime: str) -> dict:
-    """Calcula impostos de um item"""
-    valor_total_item = item['valor_unitario'] * item['quantidade']
-    
-    icms = valor_total_item * (item.get('aliquota_icms', 18.0) / 100)
-    pis = valor_total_item * (item.get('aliquota_pis', 1.65) / 100)
-    cofins = valor_total_item * (item.get('aliquota_cofins', 7.6) / 100)
-    ipi = valor_total_item * (item.get('aliquota_ipi', 0.0) / 100)
-    
-    # Simples Nacional tem redução de ICMS
-    if regime == 'Simples Nacional':
-        icms *= 0.7  # 30% de redução
-    
-    return {
-        'icms': round(icms, 2),
-        'pis': round(pis, 2),
-        'cofins': round(cofins, 2),
-        'ipi': round(ipi, 2)
-    }
+COLUNAS_TEXTO_PRODUTO = ['nome', 'codigo', 'categoria']
+# Alíquota -> padrão aplicado quando a célula está vazia (mesmos padrões de ProdutoCreate)
+ALIQUOTAS_PRODUTO = {'aliquota_icms': 18.0, 'aliquota_pis': 1.65, 'aliquota_cofins': 7.6, 'aliquota_ipi': 0.0}
+CODIGO_MAX = 60  # tamanho de cProd na NF-e
 
-@api_router.post("/notas", response_model=NotaFiscal)
-async def create_nota(nota: NotaFiscalCreate, current_user: dict = Depends(get_current_user)):
-    # Verify empresa
-    empresa = await db.empresas.find_one({"id": nota.empresa_id, "usuario_id": current_user['usuario_id']})
-    if not empresa:
-        raise HTTPException(status_code=404, detail="Empresa não encontrada")
-    
-    # Calculate taxes for each item
-    itens_calculados = []
-    total_valor = 0
-    total_icms = 0
-    total_pis = 0
-    total_cofins = 0
-    total_ipi = 0
-    
-    for item_data in nota.itens:
-        # Get produto details
-        produto = await db.produtos.find_one({"id": item_data['produto_id'], "usuario_id": current_user['usuario_id']})
-        if not produto:
-            raise HTTPException(status_code=404, detail=f"Produto {item_data['produto_id']} não encontrado")
-        
-        # Merge produto data with item data
-        item_completo = {
-            'produto_id': produto['id'],
-            'produto_nome': produto['nome'],
-            'quantidade': item_data['quantidade'],
-            'valor_unitario': produto['valor_unitario'],
-            'aliquota_icms': produto['aliquota_icms'],
-            'aliquota_pis': produto['aliquota_pis'],
-            'aliquota_cofins': produto['aliquota_cofins'],
-            'aliquota_ipi': produto['aliquota_ipi']
-        }
-        
-        # Calculate
-        impostos = calcular_impostos(item_completo, empresa['regime_tributario'])
-        total_item = item_completo['valor_unitario'] * item_completo['quantidade']
-        
-        item_nf = ItemNF(
-            produto_id=item_completo['produto_id'],
-            produto_nome=item_completo['produto_nome'],
-            quantidade=item_completo['quantidade'],
-            valor_unitario=item_completo['valor_unitario'],
-            total_item=round(total_item, 2),
-            icms=impostos['icms'],
-            pis=impostos['pis'],
-            cofins=impostos['cofins'],
-            ipi=impostos['ipi']
-        )
-        
-        itens_calculados.append(item_nf)
-        total_valor += item_nf.total_item
-        total_icms += item_nf.icms
-        total_pis += item_nf.pis
-        total_cofins += item_nf.cofins
-        total_ipi += item_nf.ipi
-    
-    # Create nota fiscal
-    nota_fiscal = NotaFiscal(
-        empresa_id=nota.empresa_id,
-        empresa_nome=empresa['nome'],
-        numero_nf=nota.numero_nf,
-        itens=itens_calculados,
-        total_valor=round(total_valor, 2),
-        total_icms=round(total_icms, 2),
-        total_pis=round(total_pis, 2),
-        total_cofins=round(total_cofins, 2),
-        total_ipi=round(total_ipi, 2),
-        usuario_id=current_user['usuario_id']
-    )
-    
-    doc = nota_fiscal.model_dump()
-    doc['data_emissao'] = doc['data_emissao'].isoformat()
-    doc['created_at'] = doc['created_at'].isoformat()
-    doc['itens'] = [item.model_dump() for item in nota_fiscal.itens]
-    
-    await db.notas_fiscais.insert_one(doc)
-    return nota_fiscal
+def _normalizar_coluna(nome) -> str:
+    """'Valor Unitário' -> 'valor_unitario'"""
+    sem_acento = unicodedata.normalize('NFKD', str(nome)).encode('ascii', 'ignore').decode()
+    return re.sub(r'\W+', '_', sem_acento.strip().lower()).strip('_')
 
-@api_router.get("/notas", response_model=List[NotaFiscal])
-async def list_notas(empresa_id: Optional[str] = None, current_user: dict = Depends(get_current_user)):
-    query = {"usuario_id": current_user['usuario_id']}
-    if empresa_id:
-        query["empresa_id"] = empresa_id
-    
-    notas = await db.notas_fiscais.find(query, {"_id": 0}).to_list(1000)
-    for n in notas:
-        if isinstance(n['data_emissao'], str):
-            n['data_emissao'] = datetime.fromisoformat(n['data_emissao'])
-        if isinstance(n['created_at'], str):
-            n['created_at'] = datetime.fromisoformat(n['created_at'])
-    return notas
+def _numero(coluna: 'pd.Series') -> 'pd.Series':
+    """Converte texto em float aceitando decimal com vírgula ('1.234,56'); inválidos viram NaN"""
+    import pandas as pd
+    texto = coluna.str.strip()
+    virgula = texto.str.contains(',', regex=False, na=False)
+    texto = texto.where(~virgula, texto.str.replace('.', '', regex=False).str.replace(',', '.', regex=False))
+    return pd.to_numeric(texto, errors='coerce')
 
-@api_router.get("/notas/{nota_id}", response_model=NotaFiscal)
-async def get_nota(nota_id: str, current_user: dict = Depends(get_current_user)):
-    nota = await db.notas_fiscais.find_one({"id": nota_id, "usuario_id": current_user['usuario_id']}, {"_id": 0})
-    if not nota:
-        raise HTTPException(status_code=404, detail="Nota fiscal não encontrada")
-    if isinstance(nota['data_emissao'], str):
-        nota['data_emissao'] = datetime.fromisoformat(nota['data_emissao'])
-    if isinstance(nota['created_at'], str):
-        nota['created_at'] = datetime.fromisoformat(nota['created_at'])
-    return nota
+def erros_planilha() -> tuple:
+    """Exceções de arquivo malformado na importação de produtos.
 
-@api_router.delete("/notas/{nota_id}")
-async def delete_nota(nota_id: str, current_user: dict = Depends(get_current_user)):
-    result = await db.notas_fiscais.delete_one({"id": nota_id, "usuario_id": current_user['usuario_id']})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Nota fiscal não encontrada")
-    return {"message": "Nota fiscal excluída com sucesso"}
+    Importa pandas e openpyxl: na primeira chamada deve rodar fora do event loop.
+    """
+    import pandas as pd
+    from openpyxl.utils.exceptions import InvalidFileException
+    return ValueError, UnicodeDecodeError, pd.errors.ParserError, zipfile.BadZipFile, InvalidFileException
 
-# ============= ROUTES - DASHBOARD =============
+def ler_planilha_produtos(arquivo: UploadFile, encoding: str):
+    """Gera DataFrames de até PRODUTO_IMPORT_CHUNK linhas, todas as células como texto"""
+    import openpyxl
+    import pandas as pd
+    nome = (arquivo.filename or '').lower()
+    arquivo.file.seek(0)
+    if nome.endswith(('.xlsx', '.xlsm')):
+        planilha = openpyxl.load_workbook(arquivo.file, read_only=True, data_only=True).active
+        linhas = planilha.iter_rows(values_only=True)
+        cabecalho = next(linhas, None) or ()
+        lote = []
+        for linha in linhas:
+            linha = tuple(linha[:len(cabecalho)]) + (None,) * (len(cabecalho) - len(linha))
+            lote.append(['' if v is None else str(v) for v in linha])
+            if len(lote) >= PRODUTO_IMPORT_CHUNK:
+                yield pd.DataFrame(lote, columns=cabecalho)
+                lote = []
+        if lote:
+            yield pd.DataFrame(lote, columns=cabecalho)
+        return
 
-@api_router.get("/dashboard", response_model=DashboardStats)
-async def get_dashboard(current_user: dict = Depends(get_current_user)):
-    # Count totals
-    total_empresas = await db.empresas.count_documents({"usuario_id": current_user['usuario_id']})
-    total_produtos = await db.produtos.count_documents({"usuario_id": current_user['usuario_id']})
-    total_notas = await db.notas_fiscais.count_documents({"usuario_id": current_user['usuario_id']})
-    
-    # Sum totals from notas
-    notas = await db.notas_fiscais.find({"usuario_id": current_user['usuario_id']}, {"_id": 0}).to_list(1000)
-    
-    total_valor_notas = sum(n.get('total_valor', 0) for n in notas)
-    total_impostos = {
-        'icms': sum(n.get('total_icms', 0) for n in notas),
-        'pis': sum(n.get('total_pis', 0) for n in notas),
-        'cofins': sum(n.get('total_cofins', 0) for n in notas),
-        'ipi': sum(n.get('total_ipi', 0) for n in notas)
-    }
-    
-    # Get recent notas
-    notas_recentes = sorted(notas, key=lambda x: x.get('data_emissao', ''), reverse=True)[:5]
-    
-    return DashboardStats(
-        total_empresas=total_empresas,
-        total_produtos=total_produtos,
-        total_notas=total_notas,
-        total_valor_notas=round(total_valor_notas, 2),
-        total_impostos=total_impostos,
-        notas_recentes=notas_recentes
+    # CSV: separador detectado pelo cabeçalho (planilhas em pt-BR costumam exportar com ';')
+    cabecalho = arquivo.file.readline().decode(encoding, errors='replace')
+    separador = ';' if cabecalho.count(';') > cabecalho.count(',') else ','
+    arquivo.file.seek(0)
+    yield from pd.read_csv(
+        arquivo.file, sep=separador, dtype=str, keep_default_na=False,
+        encoding=encoding, chunksize=PRODUTO_IMPORT_CHUNK, skip_blank_lines=False
     )
 
-# ============= ROUTES - RELATÓRIOS =============
+def validar_lote_produtos(df: 'pd.DataFrame', primeira_linha: int, empresas: dict,
+                          empresa_padrao: Optional[str], vistos: dict):
+    """Valida um lote de linhas de forma vetorizada.
 
-@api_router.get("/relatorios/pdf")
-async def gerar_relatorio_pdf(current_user: dict = Depends(get_current_user)):
-    notas = await db.notas_fiscais.find({"usuario_id": current_user['usuario_id']}, {"_id": 0}).to_list(1000)
-    
-    # Create PDF
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Title
-    title = Paragraph("<b>Relatório Fiscal - FiscalManager Total</b>", styles['Title'])
-    elements.append(title)
-    elements.append(Spacer(1, 0.5*cm))
-    
-    # Summary
-    total_valor = sum(n.get('total_valor', 0) for n in notas)
-    total_icms = sum(n.get('total_icms', 0) for n in notas)
-    total_pis = sum(n.get('total_pis', 0) for n in notas)
-    total_cofins = sum(n.get('total_cofins', 0) for n in notas)
-    total_ipi = sum(n.get('total_ipi', 0) for n in notas)
-    
-    summary_data = [
-        ['Total de Notas', str(len(notas))],
-        ['Valor Total', f'R$ {total_valor:,.2f}'],
-        ['ICMS', f'R$ {total_icms:,.2f}'],
-        ['PIS', f'R$ {total_pis:,.2f}'],
-        ['COFINS', f'R$ {total_cofins:,.2f}'],
-        ['IPI', f'R$ {total_ipi:,.2f}']
+    `empresas` mapeia id e CNPJ (só dígitos) para o id da empresa; `vistos`
+    guarda (empresa_id, codigo) -> linha entre lotes para detectar códigos
+    repetidos no arquivo. Retorna (linhas válidas como dicts, erros por linha).
+    """
+    import numpy as np
+    import pandas as pd
+    df = df.rename(columns=_normalizar_coluna)
+    df = df.loc[:, ~df.columns.duplicated()]
+    linhas = pd.Series(np.arange(primeira_linha, primeira_linha + len(df)), index=df.index)
+    # Linhas totalmente em branco são ignoradas, mas mantêm a numeração das seguintes
+    df = df[(df.apply(lambda coluna: coluna.str.strip()) != '').any(axis=1)]
+    linhas = linhas[df.index]
+    n = len(df)
+    if not n:
+        return [], []
+    vazio = pd.Series('', index=df.index)
+    erros = pd.Series([[] for _ in range(n)], index=df.index, dtype=object)
+
+    def marcar(mascara: pd.Series, mensagem):
+        for i in mascara[mascara].index:
+            erros[i].append(mensagem if isinstance(mensagem, str) else mensagem(i))
+
+    # Empresa: coluna empresa_id, coluna cnpj ou a empresa informada na requisição
+    if 'empresa_id' in df:
+        referencia = df['empresa_id'].str.strip()
+    elif 'cnpj' in df:
+        referencia = df['cnpj'].str.replace(r'\D', '', regex=True)
+    else:
+        referencia = vazio
+    if empresa_padrao:
+        referencia = referencia.mask(referencia == '', empresa_padrao)
+    empresa_id = referencia.map(empresas)
+    marcar(referencia == '', "Empresa não informada (coluna empresa_id ou cnpj)")
+    marcar((referencia != '') & empresa_id.isna(), lambda i: f"Empresa {referencia[i]} não encontrada")
+
+    textos = {}
+    for coluna in COLUNAS_TEXTO_PRODUTO:
+        textos[coluna] = df[coluna].str.strip() if coluna in df else vazio
+        marcar(textos[coluna] == '', f"Campo {coluna} obrigatório")
+    marcar(textos['codigo'].str.len() > CODIGO_MAX, f"Código excede {CODIGO_MAX} caracteres")
+
+    valor_texto = df['valor_unitario'] if 'valor_unitario' in df else vazio
+    valor = _numero(valor_texto)
+    marcar(valor_texto.str.strip() == '', "Campo valor_unitario obrigatório")
+    marcar((valor_texto.str.strip() != '') & (valor.isna() | (valor < 0)), "valor_unitario inválido")
+
+    aliquotas = {}
+    for coluna, padrao in ALIQUOTAS_PRODUTO.items():
+        texto = df[coluna] if coluna in df else vazio
+        aliquota = _numero(texto)
+        marcar((texto.str.strip() != '') & (aliquota.isna() | (aliquota < 0) | (aliquota > 100)),
+               f"{coluna} deve estar entre 0 e 100")
+        aliquotas[coluna] = aliquota.fillna(padrao)
+
+    # Código repetido (no lote ou em lotes anteriores) para a mesma empresa
+    chave = empresa_id.fillna('') + '\x00' + textos['codigo']
+    repetida = chave.duplicated() & empresa_id.notna() & (textos['codigo'] != '')
+    anteriores = chave.map(vistos)
+    marcar(repetida | anteriores.notna(), lambda i: "Código repetido no arquivo")
+    for i, k in chave[~chave.duplicated() & anteriores.isna()].items():
+        vistos[k] = int(linhas[i])
+
+    com_erro = erros.map(bool)
+    relatorio_erros = [
+        {"linha": int(linhas[i]), "codigo": textos['codigo'][i], "erros": erros[i]}
+        for i in com_erro[com_erro].index
     ]
-    
-    summary_table = Table(summary_data, colWidths=[10*cm, 6*cm])
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    elements.append(summary_table)
-    
-    doc.build(elements)
-    buffer.seek(0)
-    
-    return StreamingResponse(buffer, media_type="application/pdf", headers={
-        "Content-Disposition": "attachment; filename=relatorio_fiscal.pdf"
-    })
+    validas = pd.DataFrame({
+        'linha': linhas, 'empresa_id': empresa_id, **textos, 'valor_unitario': valor, **aliquotas
+    })[~com_erro]
+    return validas.to_dict('records'), relatorio_erros
 
-@api_router.get("/relatorios/excel")
-async def gerar_relatorio_excel(current_user: dict = Depends(get_current_user)):
-    notas = await db.notas_fiscais.find({"usuario_id": current_user['usuario_id']}, {"_id": 0}).to_list(1000)
+async def _gravar_lote_produtos(validas: List[dict], usuario_id: str, erros: List[dict]) -> tuple:
+    """Upsert por (empresa_id, codigo) com bulk_write; retorna (inseridos, atualizados)"""
+    if not validas:
+        return 0, 0
+    agora = datetime.now(timezone.utc)
+    operacoes = [
+        UpdateOne(
+            {"empresa_id": linha['empresa_id'], "codigo": linha['codigo']},
+            {
+                "$set": {
+                    "nome": linha['nome'], "categoria": linha['categoria'],
+                    "valor_unitario": linha['valor_unitario'],
+                    **{coluna: linha[coluna] for coluna in ALIQUOTAS_PRODUTO}
+                },
+                "$setOnInsert": {"id": str(uuid.uuid4()), "usuario_id": usuario_id, "created_at": agora}
+            },
+            upsert=True
+        )
+        for linha in validas
+    ]
+    try:
+        resultado = await db.produtos.bulk_write(operacoes, ordered=False)
+        detalhes = resultado.bulk_api_result
+    except BulkWriteError as e:
+        detalhes = e.details
+        for erro in detalhes.get('writeErrors', []):
+            linha = validas[erro['index']]
+            erros.append({"linha": linha['linha'], "codigo": linha['codigo'], "erros": [erro.get('errmsg', 'Erro ao gravar')]})
+    return detalhes.get('nUpserted', 0), detalhes.get('nMatched', 0)
+
+@api_router.post("/produtos/importar", response_model=dict)
+async def importar_produtos(
+    arquivo: UploadFile = File(...),
+    empresa_id: Optional[str] = None,
+    encoding: str = 'utf-8-sig',
+    contexto: ContextoTenant = Depends(get_contexto)
+):
+    """Importa produtos de um CSV ou XLSX, com upsert por (empresa_id, codigo).
+
+    Colunas: nome, codigo, categoria, valor_unitario e, opcionalmente,
+    aliquota_icms/pis/cofins/ipi e empresa_id ou cnpj (senão vale o
+    `empresa_id` da requisição). O arquivo é lido e validado em lotes de
+    PRODUTO_IMPORT_CHUNK linhas; linhas inválidas são reportadas e puladas.
+    """
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        raise HTTPException(status_code=400, detail=f"Encoding desconhecido: {encoding}")
+    usuario_id = contexto.usuario_id
+    if empresa_id:
+        await contexto.exigir_empresa(empresa_id)
+    else:
+        await contexto.atualizar_empresas()
+    empresas = {}
+    for e in contexto.empresas.values():
+        empresas[e['id']] = e['id']
+        empresas[_somente_digitos(e['cnpj'])] = e['id']
+
+    erros, vistos = [], {}
+    total = inseridos = atualizados = 0
+    proxima_linha = 2  # linha 1 é o cabeçalho
+    empresas_afetadas = set()
+    erros_arquivo = await asyncio.to_thread(erros_planilha)
+    leitor = ler_planilha_produtos(arquivo, encoding)
+    try:
+        while True:
+            # Leitura e validação são CPU-bound: rodam fora do event loop
+            lote = await asyncio.to_thread(next, leitor, None)
+            if lote is None:
+                break
+            validas, erros_lote = await asyncio.to_thread(
+                validar_lote_produtos, lote, proxima_linha, empresas, empresa_id, vistos
+            )
+            proxima_linha += len(lote)
+            total += len(validas) + len(erros_lote)
+            erros.extend(erros_lote)
+            novos, existentes = await _gravar_lote_produtos(validas, usuario_id, erros)
+            inseridos += novos
+            atualizados += existentes
+            empresas_afetadas.update(linha['empresa_id'] for linha in validas)
+    except erros_arquivo as e:
+        raise HTTPException(status_code=400, detail=f"Arquivo inválido: {e}")
+    finally:
+        leitor.close()
+        await invalidar_catalogo(usuario_id, *empresas_afetadas)
+        if empresas_afetadas:
+            await invalidar_leituras(usuario_id, 'produtos')
+
+    erros.sort(key=lambda erro: erro['linha'])
+    return {
+        "total": total,
+        "inseridos": inseridos,
+        "atualizados": atualizados,
+        "erros": len(erros),
+        "linhas_com_erro": erros
+    }
+
+# ============= RESUMOS (ROLLUPS) =============
+
+# Campos de nota somados nos resumos por (usuario_id, empresa_id, mes)
+CAMPOS_RESUMO = ['total_valor', 'total_icms', 'total_pis', 'total_cofins', 'total_ipi']
+TOLERANCIA_RESUMO = 0.005
+
+def mes_referencia(data_emissao) -> str:
+    """Mês de referência (AAAA-MM) de uma data de emissão"""
+    if isinstance(data_emissao, datetime):
+        return data_emissao.astimezone(timezone.utc).strftime('%Y-%m')
+    return str(data_emissao)[:7]
+
+async def atualizar_resumos(notas: List[dict], sinal: int = 1, session=None):
+    """Aplica (sinal=1) ou desfaz (sinal=-1) notas nos resumos com $inc atômico.
+
+    Notas do mesmo empresa/mês são somadas antes, gerando um único upsert por
+    resumo afetado.
+    """
+    incrementos = {}
+    for nota in notas:
+        chave = (nota['usuario_id'], nota['empresa_id'], mes_referencia(nota['data_emissao']))
+        inc = incrementos.setdefault(chave, dict.fromkeys(['total_notas'] + CAMPOS_RESUMO, 0))
+        inc['total_notas'] += sinal
+        for campo in CAMPOS_RESUMO:
+            inc[campo] += sinal * nota.get(campo, 0)
+    if not incrementos:
+        return
+    await db.resumos.bulk_write([
+        UpdateOne(
+            {"usuario_id": usuario_id, "empresa_id": empresa_id, "mes": mes},
+            {"$inc": inc},
+            upsert=True
+        )
+        for (usuario_id, empresa_id, mes), inc in incrementos.items()
+    ], ordered=False, session=session)
+
+def pipeline_totais(match: dict, contagem: dict = None, agrupamento=None) -> List[dict]:
+    """Soma os campos de valor; sobre resumos a contagem é $total_notas, sobre notas é 1"""
+    contagem = {"$sum": "$total_notas"} if contagem is None else contagem
+    return [
+        {"$match": match},
+        {"$group": {"_id": agrupamento, "total_notas": contagem, **{c: {"$sum": f"${c}"} for c in CAMPOS_RESUMO}}}
+    ]
+
+def formatar_totais(resultado: List[dict]) -> dict:
+    totais = resultado[0] if resultado else {}
+    return {
+        'total_notas': totais.get('total_notas', 0),
+        **{campo: round(totais.get(campo, 0), 2) for campo in CAMPOS_RESUMO}
+    }
+
+def somar_grupos(*resultados: List[dict]) -> List[dict]:
+    """Junta resultados de `pipeline_totais` de coleções diferentes somando os grupos de mesmo _id"""
+    grupos = {}
+    for grupo in (g for resultado in resultados for g in resultado):
+        acumulado = grupos.setdefault(
+            grupo['_id'], {'_id': grupo['_id'], 'total_notas': 0, **dict.fromkeys(CAMPOS_RESUMO, 0)}
+        )
+        for campo in ['total_notas'] + CAMPOS_RESUMO:
+            acumulado[campo] += grupo.get(campo) or 0
+    return list(grupos.values())
+
+async def totais_resumos(usuario_id: str, empresa_id: Optional[str] = None) -> dict:
+    """Totais do usuário (ou de uma empresa) somando os resumos mensais"""
+    match = {"usuario_id": usuario_id}
+    if empresa_id:
+        match["empresa_id"] = empresa_id
+    return formatar_totais(await db.resumos.aggregate(pipeline_totais(match)).to_list(1))
+
+async def reconciliar_resumos(usuario_id: Optional[str] = None, corrigir: bool = False) -> dict:
+    """Recalcula os resumos a partir das notas (inclusive arquivadas) e reporta divergências.
+
+    Com `corrigir=True` os resumos divergentes são substituídos pelos valores
+    recalculados e resumos sem notas correspondentes são removidos.
+    """
+    match = {"usuario_id": usuario_id} if usuario_id else {}
+    esperados = {}
+    pipeline = [
+        {"$match": match},
+        # Notas arquivadas continuam contando nos resumos
+        {"$unionWith": {"coll": "notas_arquivo", "pipeline": [{"$match": match}, {"$project": {"itens_z": 0}}]}},
+        {"$group": {
+            "_id": {
+                "usuario_id": "$usuario_id",
+                "empresa_id": "$empresa_id",
+                "mes": {"$dateToString": {"format": "%Y-%m", "date": {"$toDate": "$data_emissao"}}}
+            },
+            "total_notas": {"$sum": 1},
+            **{c: {"$sum": f"${c}"} for c in CAMPOS_RESUMO}
+        }}
+    ]
+    async for grupo in db.notas_fiscais.aggregate(pipeline, allowDiskUse=True):
+        chave = (grupo['_id']['usuario_id'], grupo['_id']['empresa_id'], grupo['_id']['mes'])
+        esperados[chave] = {c: grupo[c] for c in ['total_notas'] + CAMPOS_RESUMO}
+
+    divergencias = []
+    vistos = set()
+    async for resumo in db.resumos.find(match, {"_id": 0}):
+        chave = (resumo['usuario_id'], resumo['empresa_id'], resumo['mes'])
+        vistos.add(chave)
+        esperado = esperados.get(chave, dict.fromkeys(['total_notas'] + CAMPOS_RESUMO, 0))
+        diferencas = {
+            c: {"resumo": resumo.get(c, 0), "notas": esperado[c]}
+            for c in ['total_notas'] + CAMPOS_RESUMO
+            if abs(resumo.get(c, 0) - esperado[c]) > TOLERANCIA_RESUMO
+        }
+        if diferencas:
+            divergencias.append({"usuario_id": chave[0], "empresa_id": chave[1], "mes": chave[2], "diferencas": diferencas})
+    for chave, esperado in esperados.items():
+        if chave not in vistos:
+            divergencias.append({
+                "usuario_id": chave[0], "empresa_id": chave[1], "mes": chave[2],
+                "diferencas": {c: {"resumo": 0, "notas": esperado[c]} for c in ['total_notas'] + CAMPOS_RESUMO}
+            })
+
+    if corrigir and divergencias:
+        operacoes = []
+        for d in divergencias:
+            filtro = {"usuario_id": d['usuario_id'], "empresa_id": d['empresa_id'], "mes": d['mes']}
+            esperado = esperados.get((d['usuario_id'], d['empresa_id'], d['mes']))
+            if esperado:
+                operacoes.append(UpdateOne(filtro, {"$set": esperado}, upsert=True))
+            else:
+                operacoes.append(DeleteOne(filtro))
+        await db.resumos.bulk_write(operacoes, ordered=False)
+        # O dashboard lê os resumos: invalida as respostas dos usuários corrigidos
+        await asyncio.gather(*(invalidar_leituras(u, 'notas') for u in {d['usuario_id'] for d in divergencias}))
+
+    return {
+        "resumos_esperados": len(esperados),
+        "divergencias": divergencias,
+        "corrigido": corrigir and bool(divergencias)
+    }
+
+# ============= ITENS DAS NOTAS =============
+
+# Os itens ficam em itens_nf, uma linha por item com nota_id e seq, e o
+# cabeçalho da nota guarda só totais e qtd_itens: listagens e dashboard não
+# trazem itens e notas com milhares de linhas ficam longe do limite de 16 MB.
+# Notas gravadas antes da separação ainda podem ter `itens` embutidos (ver
+# `migrar_itens`); os leitores abaixo aceitam os dois formatos.
+
+ITEM_NF_PROJECTION = {"_id": 0, "nota_id": 1, **{campo: 1 for campo in ItemNF.model_fields}}
+
+def separar_itens(notas: List[dict]) -> List[dict]:
+    """Tira `itens` dos documentos de nota (no próprio dict) e devolve as linhas de itens_nf"""
+    linhas = []
+    for nota in notas:
+        itens = nota.pop('itens', None) or []
+        nota['qtd_itens'] = len(itens)
+        for seq, item in enumerate(itens):
+            linhas.append({
+                **(item.model_dump() if isinstance(item, BaseModel) else item),
+                'nota_id': nota['id'], 'seq': seq, 'usuario_id': nota['usuario_id'],
+                'empresa_id': nota['empresa_id'], 'data_emissao': nota['data_emissao']
+            })
+    return linhas
+
+async def inserir_notas(notas: List[dict], ordered: bool = False, session=None):
+    """insert_many de notas com os itens em itens_nf.
+
+    Os itens são gravados antes dos cabeçalhos, então uma nota visível sempre
+    tem os itens completos; os itens de notas rejeitadas são removidos e o
+    BulkWriteError é repassado a quem chamou.
+    """
+    linhas = separar_itens(notas)
+    if linhas:
+        await db.itens_nf.insert_many(linhas, ordered=False, session=session)
+    try:
+        await db.notas_fiscais.insert_many(notas, ordered=ordered, session=session)
+    except BulkWriteError as e:
+        if session is None:
+            rejeitadas = {erro['index'] for erro in e.details.get('writeErrors', [])}
+            if ordered and rejeitadas:
+                rejeitadas.update(range(min(rejeitadas), len(notas)))
+            await db.itens_nf.delete_many({"nota_id": {"$in": [notas[i]['id'] for i in rejeitadas]}})
+        raise
+
+def _agrupar_itens(linhas) -> dict:
+    itens = {}
+    for linha in linhas:
+        itens.setdefault(linha.pop('nota_id'), []).append(linha)
+    return itens
+
+async def anexar_itens(notas: List[dict]) -> List[dict]:
+    """Preenche `itens` das notas que não os têm embutidos, numa consulta a itens_nf"""
+    ids = [n['id'] for n in notas if 'itens' not in n]
+    if ids:
+        cursor = db.itens_nf.find({"nota_id": {"$in": ids}}, ITEM_NF_PROJECTION).sort([("nota_id", ASCENDING), ("seq", ASCENDING)])
+        itens = _agrupar_itens(await cursor.to_list(None))
+        for nota in notas:
+            if 'itens' not in nota:
+                nota['itens'] = itens.get(nota['id'], [])
+    return notas
+
+def com_itens(database, notas, limite_itens: int = RELATORIO_BATCH_SIZE):
+    """Versão síncrona (workers de relatório) de `anexar_itens` sobre um cursor de notas.
+
+    As notas são agrupadas em blocos de até `limite_itens` itens (pela
+    qtd_itens do cabeçalho), com uma consulta a itens_nf por bloco; a
+    memória fica limitada ao bloco, ou à maior nota.
+    """
+    def anexar(bloco):
+        ids = [n['id'] for n in bloco if 'itens' not in n]
+        itens = _agrupar_itens(
+            database.itens_nf.find({"nota_id": {"$in": ids}}, ITEM_NF_PROJECTION)
+            .sort([("nota_id", ASCENDING), ("seq", ASCENDING)])
+        ) if ids else {}
+        for nota in bloco:
+            if 'itens' not in nota:
+                nota['itens'] = itens.get(nota['id'], [])
+        return bloco
+
+    bloco, itens_bloco = [], 0
+    for nota in notas:
+        bloco.append(nota)
+        itens_bloco += len(nota['itens']) if 'itens' in nota else nota.get('qtd_itens', 1)
+        if itens_bloco >= limite_itens:
+            yield from anexar(bloco)
+            bloco, itens_bloco = [], 0
+    if bloco:
+        yield from anexar(bloco)
+
+def _comparar_ordem(ordem: List[tuple]):
+    def comparar(a: dict, b: dict) -> int:
+        for campo, direcao in ordem:
+            x, y = a.get(campo), b.get(campo)
+            if x != y:
+                return (-1 if x < y else 1) * (1 if direcao == ASCENDING else -1)
+        return 0
+    return functools.cmp_to_key(comparar)
+
+def _descomprimir_itens(nota: dict) -> dict:
+    nota['itens'] = orjson.loads(zlib.decompress(nota.pop('itens_z')))
+    return nota
+
+def notas_relatorio(database, query: dict, projection: dict, ordem: List[tuple], itens: bool = False):
+    """Notas de notas_fiscais e notas_arquivo numa única sequência em `ordem` (síncrona, workers de relatório).
+
+    Cada coleção é lida por um cursor ordenado e os dois são intercalados,
+    então a memória continua limitada aos lotes. Com `itens`, as notas quentes
+    recebem os itens via com_itens e as arquivadas os descomprimidos de itens_z.
+    """
+    projection = {**projection, **{campo: 1 for campo, _ in ordem}}
+    projecao_arquivo = {c: v for c, v in projection.items() if c not in ('itens', 'qtd_itens')}
+    if itens:
+        projection.update(id=1, qtd_itens=1, itens=1)
+        projecao_arquivo['itens_z'] = 1
+    quentes = database.notas_fiscais.find(query, projection).sort(ordem).batch_size(RELATORIO_BATCH_SIZE)
+    arquivadas = database.notas_arquivo.find(query, projecao_arquivo).sort(ordem).batch_size(RELATORIO_BATCH_SIZE)
+    if itens:
+        quentes = com_itens(database, quentes)
+        arquivadas = map(_descomprimir_itens, arquivadas)
+    return heapq.merge(quentes, arquivadas, key=_comparar_ordem(ordem))
+
+# ============= MOTOR DE IMPOSTOS =============
+
+# Regras por regime tributário. Cada imposto usa a alíquota do item
+# (`aliquota_<imposto>`, em %; `aliquota_padrao` quando ausente) e aplica
+# `reducao`, em % do imposto. '*' é a base de todos os regimes e vale para
+# regimes sem regra própria. Valores em texto para serem lidos como Decimal.
+REGRAS_TRIBUTARIAS = {
+    "*": {
+        "icms": {"aliquota_padrao": "18"},
+        "pis": {"aliquota_padrao": "1.65"},
+        "cofins": {"aliquota_padrao": "7.6"},
+        "ipi": {"aliquota_padrao": "0"},
+    },
+    "Simples Nacional": {"icms": {"reducao": "30"}},
+    "Lucro Presumido": {},
+    "Lucro Real": {},
+}
+IMPOSTOS = ('icms', 'pis', 'cofins', 'ipi')
+CAMPOS_REGRA = {'aliquota_padrao', 'reducao'}
+# Potências de 10 usadas para arredondar mantissas inteiras a centavos
+POTENCIAS_10 = [10 ** i for i in range(64)]
+
+def _decimal(valor) -> tuple:
+    """Valor como (mantissa, expoente) inteiros, exato na representação decimal mais curta do float.
+
+    10.1 vira (101, -1), não o binário 10.0999...; valor = mantissa * 10**expoente.
+    """
+    texto = repr(valor) if isinstance(valor, float) else str(valor)
+    inteiro, ponto, fracao = texto.partition('.')
+    if 'e' in texto or 'E' in texto or not (inteiro.lstrip('-').isdigit() and (not ponto or fracao.isdigit())):
+        decimal = Decimal(texto)
+        if not decimal.is_finite():
+            raise ValueError(f"Valor não numérico: {texto}")
+        sinal, digitos, expoente = decimal.as_tuple()
+        mantissa = int(''.join(map(str, digitos)))
+        return (-mantissa if sinal else mantissa), expoente
+    return int(inteiro + fracao), -len(fracao)
+
+def _centavos(mantissa: int, expoente: int) -> float:
+    """mantissa * 10**expoente em reais com duas casas, arredondado uma única vez.
+
+    Meio centavo vai para o par (ABNT NBR 5891); a conta é toda em inteiros.
+    """
+    expoente += 2
+    if expoente >= 0:
+        return mantissa * POTENCIAS_10[expoente] / 100
+    divisor = POTENCIAS_10[-expoente]
+    # divmod arredonda para baixo também em negativos; o resto fica em [0, divisor)
+    centavos, resto = divmod(mantissa, divisor)
+    resto *= 2
+    if resto > divisor or (resto == divisor and centavos & 1):
+        centavos += 1
+    return centavos / 100
+
+class AvaliadorRegime:
+    """Regras de um regime compiladas em tuplas (imposto, campo da alíquota, alíquota padrão, fator).
+
+    Alíquotas e fatores ficam como (mantissa, expoente); o fator junta a
+    redução e a divisão por 100 da alíquota. Cada alíquota vista é combinada
+    com o fator uma única vez, então cada imposto do item custa uma
+    multiplicação inteira exata e um arredondamento. As alíquotas vêm dos
+    produtos, então as combinações ficam num CacheLRU de TAXAS_CACHE_MAX
+    entradas por imposto; dentro de uma chamada, num dict local.
+    """
+    __slots__ = ('regime', 'regras', '_taxas')
+
+    def __init__(self, regime: str, regras: dict):
+        self.regime = regime
+        self.regras = tuple(
+            (imposto, f"aliquota_{imposto}", _decimal(regra.get('aliquota_padrao', '0')),
+             _decimal(str((100 - Decimal(regra.get('reducao', '0'))) / 10000)))
+            for imposto, regra in regras.items()
+        )
+        # Por imposto: alíquota do item -> alíquota x fator; None é a alíquota padrão
+        self._taxas = tuple(CacheLRU(TAXAS_CACHE_MAX) for _ in self.regras)
+
+    def _taxa(self, indice: int, aliquota, locais: dict) -> tuple:
+        taxa = self._taxas[indice].obter(aliquota)
+        if taxa is None:
+            _, _, padrao, (fator, expoente_fator) = self.regras[indice]
+            mantissa, expoente = padrao if aliquota is None else _decimal(aliquota)
+            taxa = (mantissa * fator, expoente + expoente_fator)
+            self._taxas[indice].guardar(aliquota, taxa)
+        locais[aliquota] = taxa
+        return taxa
+
+    def __call__(self, itens: List[dict]) -> List[dict]:
+        """total_item e impostos de cada item, em reais com duas casas"""
+        # Taxas já usadas nesta chamada: o LRU é consultado uma vez por alíquota distinta
+        impostos = tuple(
+            (indice, imposto, campo, {})
+            for indice, (imposto, campo, _, _) in enumerate(self.regras)
+        )
+        potencias = POTENCIAS_10
+        resultados = []
+        for item in itens:
+            valor, expoente_valor = _decimal(item['valor_unitario'])
+            quantidade, expoente_quantidade = _decimal(item['quantidade'])
+            total, expoente_total = valor * quantidade, expoente_valor + expoente_quantidade
+            resultado = {'total_item': _centavos(total, expoente_total)}
+            for indice, imposto, campo, taxas in impostos:
+                aliquota = item.get(campo)
+                taxa, expoente = taxas.get(aliquota) or self._taxa(indice, aliquota, taxas)
+                # _centavos em linha: é o trecho mais quente do cálculo
+                expoente += expoente_total + 2
+                if expoente >= 0:
+                    resultado[imposto] = total * taxa * potencias[expoente] / 100
+                    continue
+                divisor = potencias[-expoente]
+                centavos, resto = divmod(total * taxa, divisor)
+                resto *= 2
+                if resto > divisor or (resto == divisor and centavos & 1):
+                    centavos += 1
+                resultado[imposto] = centavos / 100
+            resultados.append(resultado)
+        return resultados
+
+class MotorImpostos:
+    """Avaliadores de todos os regimes, compilados uma vez a partir das regras"""
+
+    def __init__(self, regras: dict):
+        base = regras.get('*', {})
+        self.avaliadores = {
+            regime: AvaliadorRegime(regime, self._mesclar(regime, base, regra)) for regime, regra in regras.items()
+        }
+        self.padrao = self.avaliadores.get('*') or AvaliadorRegime('*', self._mesclar('*', {}, {}))
+
+    @staticmethod
+    def _mesclar(regime: str, base: dict, regra: dict) -> dict:
+        for imposto, campos in {**base, **regra}.items():
+            if imposto not in IMPOSTOS or not set(campos) <= CAMPOS_REGRA:
+                raise ValueError(f"Regra tributária inválida para {regime}: {imposto} {campos}")
+        return {imposto: {**base.get(imposto, {}), **regra.get(imposto, {})} for imposto in IMPOSTOS}
+
+    def avaliador(self, regime: str) -> AvaliadorRegime:
+        return self.avaliadores.get(regime, self.padrao)
+
+def carregar_regras() -> dict:
+    """REGRAS_TRIBUTARIAS com o JSON de REGRAS_TRIBUTARIAS_ARQUIVO mesclado por regime e imposto"""
+    regras = {regime: {imposto: dict(campos) for imposto, campos in regra.items()}
+              for regime, regra in REGRAS_TRIBUTARIAS.items()}
+    if REGRAS_TRIBUTARIAS_ARQUIVO:
+        with open(REGRAS_TRIBUTARIAS_ARQUIVO, encoding='utf-8') as f:
+            for regime, regra in json.load(f).items():
+                for imposto, campos in regra.items():
+                    regras.setdefault(regime, {}).setdefault(imposto, {}).update(
+                        {campo: str(valor) for campo, valor in campos.items()}
+                    )
+    return regras
+
+motor_impostos = MotorImpostos(carregar_regras())
+
+def calcular_impostos(item: dict, regime: str) -> dict:
+    """Calcula impostos de um item"""
+    resultado = motor_impostos.avaliador(regime)([item])[0]
+    del resultado['total_item']
+    return resultado
+
+def calcular_impostos_lote(itens: List[dict], regime: str) -> List[dict]:
+    """Calcula impostos de uma lista de itens com o avaliador do regime, numa única passada.
+
+    Cada resultado traz também `total_item`.
+    """
+    return motor_impostos.avaliador(regime)(itens)
+
+# ============= ROUTES - NOTAS FISCAIS =============
+
+async def buscar_produtos(produto_ids: List[str], usuario_id: str, empresa_ids: List[str] = ()) -> dict:
+    """Produtos referenciados como dict `id -> produto`, omitindo os inexistentes.
+
+    Os produtos vêm dos catálogos em cache das `empresa_ids`; só os IDs
+    ausentes deles (ex.: produto de outra empresa do usuário ou de um
+    catálogo grande demais para o cache) são buscados com uma única consulta `$in`.
+    """
+    ids_unicos = list(dict.fromkeys(produto_ids))
+    produtos = {}
+    for catalogo in await asyncio.gather(*[obter_catalogo(usuario_id, e) for e in dict.fromkeys(empresa_ids)]):
+        if catalogo is None:
+            continue
+        produtos.update((pid, catalogo[pid]) for pid in ids_unicos if pid in catalogo)
+    faltantes = [pid for pid in ids_unicos if pid not in produtos]
+    if faltantes:
+        cursor = db.produtos.find(
+            {"id": {"$in": faltantes}, "usuario_id": usuario_id},
+            PRODUTO_IMPOSTOS_PROJECTION
+        )
+        produtos.update({p['id']: p async for p in cursor})
+    return produtos
+
+async def carregar_produtos(produto_ids: List[str], usuario_id: str, empresa_id: Optional[str] = None) -> dict:
+    """Como `buscar_produtos` para uma nota; levanta 404 para o primeiro ID
+    ausente, na mesma ordem em que aparece nos itens.
+    """
+    ids_unicos = list(dict.fromkeys(produto_ids))
+    produtos = await buscar_produtos(ids_unicos, usuario_id, [empresa_id] if empresa_id else [])
+    for produto_id in ids_unicos:
+        if produto_id not in produtos:
+            raise HTTPException(status_code=404, detail=f"Produto {produto_id} não encontrado")
+    return produtos
+
+def montar_itens_nf(itens_data: List[dict], produtos: dict, regime: str) -> List[ItemNF]:
+    """Combina os itens enviados com os dados dos produtos e calcula os impostos"""
+    itens_completos = []
+    for item_data in itens_data:
+        produto = produtos[item_data['produto_id']]
+        itens_completos.append({
+            'produto_id': produto['id'],
+            'produto_nome': produto['nome'],
+            'quantidade': item_data['quantidade'],
+            'valor_unitario': produto['valor_unitario'],
+            'aliquota_icms': produto['aliquota_icms'],
+            'aliquota_pis': produto['aliquota_pis'],
+            'aliquota_cofins': produto['aliquota_cofins'],
+            'aliquota_ipi': produto['aliquota_ipi']
+        })
+
+    try:
+        impostos = calcular_impostos_lote(itens_completos, regime)
+    except (ValueError, ArithmeticError) as e:
+        raise HTTPException(status_code=400, detail=f"Item com valor inválido: {e}")
+    return [
+        ItemNF(
+            produto_id=item['produto_id'],
+            produto_nome=item['produto_nome'],
+            quantidade=item['quantidade'],
+            valor_unitario=item['valor_unitario'],
+            **calculo
+        )
+        for item, calculo in zip(itens_completos, impostos)
+    ]
+
+@api_router.post("/notas", response_model=NotaFiscal)
+async def create_nota(nota: NotaFiscalCreate, contexto: ContextoTenant = Depends(get_contexto)):
+    current_user = contexto.usuario
+    empresa = await contexto.exigir_empresa(nota.empresa_id)
     
-    # Create Excel
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Relatório Fiscal"
+    # Produtos come from the empresa's cached catalog, then taxes are calculated in one pass
+    produtos = await carregar_produtos(
+        [i['produto_id'] for i in nota.itens], current_user['usuario_id'], nota.empresa_id
+    )
+    itens_calculados = montar_itens_nf(nota.itens, produtos, empresa['regime_tributario'])
     
-    # Headers
-    headers = ['Número NF', 'Empresa', 'Data Emissão', 'Valor Total', 'ICMS', 'PIS', 'COFINS', 'IPI']
-    ws.append(headers)
+    total_valor = 0
+    total_icms = 0
+    total_pis = 0
+    total_cofins = 0
+    total_ipi = 0
+    for item_nf in itens_calculados:
+        total_valor += item_nf.total_item
+        total_icms += item_nf.icms
+        total_pis += item_nf.pis
+        total_cofins += item_nf.cofins
+        total_ipi += item_nf.ipi
+    
+    # Create nota fiscal
+    nota_fiscal = NotaFiscal(
+        empresa_id=nota.empresa_id,
+        empresa_nome=empresa['nome'],
+        numero_nf=nota.numero_nf,
+        itens=itens_calculados,
+        total_valor=round(total_valor, 2),
+        total_icms=round(total_icms, 2),
+        total_pis=round(total_pis, 2),
+        total_cofins=round(total_cofins, 2),
+        total_ipi=round(total_ipi, 2),
+        usuario_id=current_user['usuario_id']
+    )
+    
+    doc = nota_fiscal.model_dump()
+    
+    await inserir_notas([doc])
+    await atualizar_resumos([doc])
+    await invalidar_leituras(current_user['usuario_id'], 'notas')
+    return nota_fiscal
+
+def _erro_itens(itens: List[dict], produtos: dict) -> Optional[str]:
+    """Mensagem do primeiro item inválido de uma nota do lote, ou None"""
+    if not itens:
+        return "Nota sem itens"
+    for posicao, item in enumerate(itens, 1):
+        if item.get('produto_id') not in produtos:
+            return f"Item {posicao}: produto {item.get('produto_id')} não encontrado"
+        if not isinstance(item.get('quantidade'), (int, float)) or isinstance(item['quantidade'], bool) \
+                or not math.isfinite(item['quantidade']):
+            return f"Item {posicao}: quantidade inválida"
+        produto = produtos[item['produto_id']]
+        # Alíquota ausente usa a padrão do regime; valor_unitario é obrigatório
+        invalidos = [
+            c for c in CAMPOS_NUMERICOS_PRODUTO
+            if not _finito(produto.get(c)) and (c == 'valor_unitario' or produto.get(c) is not None)
+        ]
+        if invalidos:
+            return f"Item {posicao}: produto {item['produto_id']} com {', '.join(invalidos)} inválido"
+    return None
+
+async def _gravar_notas_lote(docs: List[dict], transacao: bool) -> dict:
+    """Grava as notas com insert_many; retorna `indice -> erro` das que falharam.
+
+    Em transação, notas e resumos são gravados juntos ou nada é gravado.
+    Fora dela, a gravação é não ordenada e cada nota falha sozinha.
+    """
+    if transacao:
+        try:
+            async with await client.start_session() as session:
+                async with session.start_transaction():
+                    await inserir_notas(docs, session=session)
+                    await atualizar_resumos(docs, session=session)
+        except OperationFailure as e:
+            if e.code == 20 or 'replica set' in str(e):
+                raise HTTPException(status_code=400, detail="Transações exigem MongoDB em replica set")
+            if isinstance(e, BulkWriteError):
+                return {i: "Lote revertido: " + (e.details.get('writeErrors') or [{}])[0].get('errmsg', str(e))
+                        for i in range(len(docs))}
+            raise
+        return {}
+
+    falhas = {}
+    try:
+        await inserir_notas(docs)
+    except BulkWriteError as e:
+        for erro in e.details.get('writeErrors', []):
+            falhas[erro['index']] = 'existente' if erro.get('code') == 11000 else erro.get('errmsg', 'Erro ao gravar nota')
+    await atualizar_resumos([doc for i, doc in enumerate(docs) if i not in falhas])
+    return falhas
+
+@api_router.post("/notas/lote", response_model=dict)
+async def create_notas_lote(lote: NotaFiscalLote, contexto: ContextoTenant = Depends(get_contexto)):
+    """Cria várias notas numa requisição, com status individual por nota.
+
+    Empresas, notas já existentes e produtos são resolvidos com poucas
+    consultas para o lote inteiro e os impostos são calculados numa passada
+    por regime. O par (empresa_id, numero_nf) é a chave de idempotência:
+    reenviar uma nota já gravada devolve `existente` com o ID original.
+    """
+    if len(lote.notas) > NOTAS_LOTE_MAX:
+        raise HTTPException(status_code=400, detail=f"Máximo de {NOTAS_LOTE_MAX} notas por lote")
+    usuario_id = contexto.usuario_id
+    resultado = [
+        {"indice": i, "empresa_id": nota.empresa_id, "numero_nf": nota.numero_nf}
+        for i, nota in enumerate(lote.notas)
+    ]
+
+    empresa_ids = list({nota.empresa_id for nota in lote.notas})
+    numeros = list({nota.numero_nf for nota in lote.notas})
+    filtro_existentes = {"usuario_id": usuario_id, "empresa_id": {"$in": empresa_ids}, "numero_nf": {"$in": numeros}}
+    projecao_existentes = {"_id": 0, "id": 1, "empresa_id": 1, "numero_nf": 1}
+    # Empresas conferidas contra a versão atual: criadas ou excluídas em outro worker já contam.
+    # Notas já arquivadas também valem como existentes, senão um reenvio as duplicaria
+    _, quentes, arquivadas = await asyncio.gather(
+        contexto.atualizar_empresas(),
+        db.notas_fiscais.find(filtro_existentes, projecao_existentes).to_list(None),
+        db.notas_arquivo.find(filtro_existentes, projecao_existentes).to_list(None)
+    )
+    empresas = {e: contexto.empresas[e] for e in empresa_ids if e in contexto.empresas}
+    existentes = {(n['empresa_id'], n['numero_nf']): n['id'] for n in quentes + arquivadas}
+    produtos = await buscar_produtos(
+        [item.get('produto_id') for nota in lote.notas for item in nota.itens], usuario_id, list(empresas)
+    )
+
+    # Valida cada nota e agrupa os itens das válidas por regime para um único cálculo
+    vistas = set()
+    por_regime = {}
+    for i, nota in enumerate(lote.notas):
+        chave = (nota.empresa_id, nota.numero_nf)
+        if chave in existentes:
+            resultado[i].update(status="existente", nota_id=existentes[chave])
+        elif chave in vistas:
+            resultado[i].update(status="erro", erro="numero_nf repetido no lote para a mesma empresa")
+        elif nota.empresa_id not in empresas:
+            resultado[i].update(status="erro", erro="Empresa não encontrada")
+        elif erro := _erro_itens(nota.itens, produtos):
+            resultado[i].update(status="erro", erro=erro)
+        else:
+            por_regime.setdefault(empresas[nota.empresa_id]['regime_tributario'], []).append(i)
+        vistas.add(chave)
+
+    docs, indices = [], []
+    for regime, posicoes in por_regime.items():
+        itens = montar_itens_nf([item for i in posicoes for item in lote.notas[i].itens], produtos, regime)
+        inicio = 0
+        for i in posicoes:
+            nota = lote.notas[i]
+            itens_nota = itens[inicio:inicio + len(nota.itens)]
+            inicio += len(nota.itens)
+            totais = dict.fromkeys(CAMPOS_RESUMO, 0)
+            for item_nf in itens_nota:
+                totais['total_valor'] += item_nf.total_item
+                totais['total_icms'] += item_nf.icms
+                totais['total_pis'] += item_nf.pis
+                totais['total_cofins'] += item_nf.cofins
+                totais['total_ipi'] += item_nf.ipi
+            nota_fiscal = NotaFiscal(
+                empresa_id=nota.empresa_id,
+                empresa_nome=empresas[nota.empresa_id]['nome'],
+                numero_nf=nota.numero_nf,
+                itens=itens_nota,
+                usuario_id=usuario_id,
+                **{campo: round(valor, 2) for campo, valor in totais.items()}
+            )
+            # chave_idempotencia só existe em notas do lote e importadas de XML; é única por (usuario, empresa)
+            docs.append({**nota_fiscal.model_dump(), 'chave_idempotencia': nota.numero_nf})
+            indices.append(i)
+
+    falhas = await _gravar_notas_lote(docs, lote.transacao) if docs else {}
+    corridas = []
+    for posicao, (i, doc) in enumerate(zip(indices, docs)):
+        if posicao not in falhas:
+            resultado[i].update(status="criada", nota_id=doc['id'])
+        elif falhas[posicao] == 'existente':
+            corridas.append(i)
+        else:
+            resultado[i].update(status="erro", erro=falhas[posicao])
+
+    # Retentativas concorrentes: a nota foi gravada por outra requisição entre a consulta e o insert
+    if corridas:
+        cursor = db.notas_fiscais.find(
+            {"usuario_id": usuario_id, "chave_idempotencia": {"$in": [lote.notas[i].numero_nf for i in corridas]}},
+            {"_id": 0, "id": 1, "empresa_id": 1, "chave_idempotencia": 1}
+        )
+        gravadas = {(n['empresa_id'], n['chave_idempotencia']): n['id'] async for n in cursor}
+        for i in corridas:
+            resultado[i].update(status="existente", nota_id=gravadas.get((lote.notas[i].empresa_id, lote.notas[i].numero_nf)))
+
+    contagem = {status: sum(1 for r in resultado if r['status'] == status) for status in ("criada", "existente", "erro")}
+    if contagem["criada"]:
+        await invalidar_leituras(usuario_id, 'notas')
+    return {
+        "total": len(resultado),
+        "criadas": contagem["criada"],
+        "existentes": contagem["existente"],
+        "erros": contagem["erro"],
+        "notas": resultado
+    }
+
+NOTA_RESUMO_PROJECTION = projecao_modelo(NotaFiscalResumo)
+NOTA_PROJECTION = projecao_modelo(NotaFiscal)
+
+def filtro_notas(usuario_id: str, empresa_id: Optional[str] = None, numero_nf: Optional[str] = None,
+                 data_inicio: Optional[datetime] = None, data_fim: Optional[datetime] = None,
+                 valor_min: Optional[float] = None, valor_max: Optional[float] = None) -> dict:
+    """Monta o filtro de notas_fiscais usado pelas listagens e relatórios"""
+    query = {"usuario_id": usuario_id}
+    if empresa_id:
+        query["empresa_id"] = empresa_id
+    if numero_nf:
+        query["numero_nf"] = numero_nf
+    if data_inicio or data_fim:
+        query["data_emissao"] = {}
+        if data_inicio:
+            query["data_emissao"]["$gte"] = data_para_filtro(data_inicio)
+        if data_fim:
+            query["data_emissao"]["$lte"] = data_para_filtro(data_fim)
+    if valor_min is not None or valor_max is not None:
+        query["total_valor"] = {}
+        if valor_min is not None:
+            query["total_valor"]["$gte"] = valor_min
+        if valor_max is not None:
+            query["total_valor"]["$lte"] = valor_max
+    return query
+
+@api_router.get("/notas", response_model=List[NotaFiscalResumo])
+async def list_notas(
+    response: Response,
+    empresa_id: Optional[str] = None,
+    numero_nf: Optional[str] = None,
+    data_inicio: Optional[datetime] = None,
+    data_fim: Optional[datetime] = None,
+    valor_min: Optional[float] = None,
+    valor_max: Optional[float] = None,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    arquivadas: bool = False,
+    leitura: LeituraVersionada = Depends(leitura_versionada('notas')),
+    current_user: dict = Depends(get_current_user)
+):
+    """Lista cabeçalhos de notas (sem itens), da mais recente para a mais antiga.
+
+    Com `arquivadas=true` a listagem é feita sobre as notas já arquivadas.
+    """
+    if leitura.resposta:
+        return leitura.resposta
+    query = filtro_notas(
+        current_user['usuario_id'], empresa_id=empresa_id, numero_nf=numero_nf,
+        data_inicio=data_inicio, data_fim=data_fim, valor_min=valor_min, valor_max=valor_max
+    )
+    
+    colecao = db.notas_arquivo if arquivadas else db.notas_fiscais
+    notas = await paginar(
+        colecao, query, NOTA_RESUMO_PROJECTION, "data_emissao", DESCENDING, limit, cursor, response
+    )
+    return leitura.responder(notas)
+
+@api_router.get("/notas/{nota_id}", response_model=NotaFiscal)
+async def get_nota(
+    nota_id: str,
+    leitura: LeituraVersionada = Depends(leitura_versionada('notas')),
+    current_user: dict = Depends(get_current_user)
+):
+    if leitura.resposta:
+        return leitura.resposta
+    nota = await db.notas_fiscais.find_one({"id": nota_id, "usuario_id": current_user['usuario_id']}, NOTA_PROJECTION)
+    if nota:
+        await anexar_itens([nota])
+    else:
+        nota = await buscar_nota_arquivada(nota_id, current_user['usuario_id'])
+    if not nota:
+        raise HTTPException(status_code=404, detail="Nota fiscal não encontrada")
+    return leitura.responder(nota)
+
+@api_router.delete("/notas/{nota_id}")
+async def delete_nota(nota_id: str, current_user: dict = Depends(get_current_user)):
+    filtro = {"id": nota_id, "usuario_id": current_user['usuario_id']}
+    removida = await db.notas_fiscais.find_one_and_delete(filtro, projection={"_id": 0, "itens": 0})
+    if removida:
+        await db.itens_nf.delete_many({"nota_id": nota_id})
+    else:
+        removida = await db.notas_arquivo.find_one_and_delete(filtro, projection={"_id": 0, "itens_z": 0})
+    if not removida:
+        raise HTTPException(status_code=404, detail="Nota fiscal não encontrada")
+    await atualizar_resumos([removida], sinal=-1)
+    await invalidar_leituras(current_user['usuario_id'], 'notas')
+    return {"message": "Nota fiscal excluída com sucesso"}
+
+# ============= ROUTES - IMPORTAÇÃO NF-e =============
+
+_nfe_pool: Optional[ProcessPoolExecutor] = None
+
+def _contexto_pool():
+    """Pools de processos usam spawn: o worker web já tem threads (Motor, executores)
+    quando cria o pool, e fork a partir daí pode herdar locks presos"""
+    return multiprocessing.get_context('spawn')
+
+def get_nfe_pool() -> ProcessPoolExecutor:
+    global _nfe_pool
+    if _nfe_pool is None:
+        _nfe_pool = ProcessPoolExecutor(max_workers=NFE_IMPORT_WORKERS, mp_context=_contexto_pool())
+    return _nfe_pool
+
+def _somente_digitos(valor) -> str:
+    return re.sub(r'\D', '', valor or '')
+
+def _valor_grupo(grupo: Optional[dict], campo: str) -> float:
+    """Lê `campo` do único subgrupo de um imposto (ex.: ICMS/ICMS00/vICMS)"""
+    if not grupo:
+        return 0.0
+    for subgrupo in grupo.values():
+        if isinstance(subgrupo, dict) and campo in subgrupo:
+            return float(subgrupo[campo])
+    return 0.0
+
+def parse_nfe_xml(conteudo: bytes) -> dict:
+    """Extrai cabeçalho, itens e totais de um XML de NF-e (nfeProc ou NFe).
+
+    Executada em processos do pool de importação; levanta ValueError com uma
+    mensagem legível quando o arquivo não é uma NF-e válida.
+    """
+    import xmltodict
+    try:
+        documento = xmltodict.parse(conteudo, force_list=('det',), disable_entities=True)
+    except Exception as e:
+        raise ValueError(f"XML inválido: {e}")
+
+    raiz = documento.get('nfeProc', documento)
+    inf_nfe = (raiz.get('NFe') or {}).get('infNFe')
+    if not inf_nfe:
+        raise ValueError("Arquivo não contém uma NF-e (infNFe ausente)")
+
+    ide = inf_nfe.get('ide', {})
+    numero_nf = ide.get('nNF')
+    data_emissao = ide.get('dhEmi') or ide.get('dEmi')
+    if not numero_nf or not data_emissao:
+        raise ValueError("NF-e sem número ou data de emissão")
+
+    itens = []
+    for det in inf_nfe.get('det', []):
+        prod = det.get('prod', {})
+        imposto = det.get('imposto', {})
+        itens.append({
+            'codigo': prod.get('cProd', ''),
+            'produto_nome': prod.get('xProd', ''),
+            'quantidade': float(prod.get('qCom', 0)),
+            'valor_unitario': float(prod.get('vUnCom', 0)),
+            'total_item': round(float(prod.get('vProd', 0)), 2),
+            'icms': round(_valor_grupo(imposto.get('ICMS'), 'vICMS'), 2),
+            'pis': round(_valor_grupo(imposto.get('PIS'), 'vPIS'), 2),
+            'cofins': round(_valor_grupo(imposto.get('COFINS'), 'vCOFINS'), 2),
+            'ipi': round(_valor_grupo(imposto.get('IPI'), 'vIPI'), 2)
+        })
+    if not itens:
+        raise ValueError("NF-e sem itens")
+
+    totais = (inf_nfe.get('total') or {}).get('ICMSTot', {})
+    return {
+        'numero_nf': numero_nf,
+        'data_emissao': data_para_filtro(datetime.fromisoformat(data_emissao)),
+        'cnpj_emitente': _somente_digitos((inf_nfe.get('emit') or {}).get('CNPJ')),
+        'cnpj_destinatario': _somente_digitos((inf_nfe.get('dest') or {}).get('CNPJ')),
+        'itens': itens,
+        'total_valor': round(float(totais.get('vNF', sum(i['total_item'] for i in itens))), 2),
+        'total_icms': round(float(totais.get('vICMS', sum(i['icms'] for i in itens))), 2),
+        'total_pis': round(float(totais.get('vPIS', sum(i['pis'] for i in itens))), 2),
+        'total_cofins': round(float(totais.get('vCOFINS', sum(i['cofins'] for i in itens))), 2),
+        'total_ipi': round(float(totais.get('vIPI', sum(i['ipi'] for i in itens))), 2)
+    }
+
+async def iterar_xmls(arquivos: List[UploadFile]):
+    """Gera (nome, conteúdo) um XML por vez, abrindo ZIPs membro a membro.
+
+    A leitura e a descompressão rodam em threads para que um ZIP grande não
+    bloqueie o event loop.
+    """
+    for arquivo in arquivos:
+        nome = arquivo.filename or 'arquivo'
+        if await asyncio.to_thread(zipfile.is_zipfile, arquivo.file):
+            arquivo.file.seek(0)
+            zf = await asyncio.to_thread(zipfile.ZipFile, arquivo.file)
+            with zf:
+                for info in zf.infolist():
+                    if info.is_dir() or not info.filename.lower().endswith('.xml'):
+                        continue
+                    membro = f"{nome}/{info.filename}"
+                    if info.file_size > NFE_MAX_XML_BYTES:
+                        yield membro, None
+                        continue
+                    yield membro, await asyncio.to_thread(zf.read, info)
+        else:
+            arquivo.file.seek(0)
+            conteudo = await asyncio.to_thread(arquivo.file.read, NFE_MAX_XML_BYTES + 1)
+            yield nome, (conteudo if len(conteudo) <= NFE_MAX_XML_BYTES else None)
+
+async def _gravar_lote_notas(lote: List[tuple], relatorio: List[dict], ordered: bool):
+    """Insere um lote de (posição no relatório, documento) com insert_many"""
+    if not lote:
+        return
+    docs = [doc for _, doc in lote]
+    falhas = {}
+    try:
+        await inserir_notas(docs, ordered=ordered)
+    except BulkWriteError as e:
+        for erro in e.details.get('writeErrors', []):
+            falhas[erro['index']] = 'existente' if erro.get('code') == 11000 else erro.get('errmsg', 'Erro ao gravar nota')
+        if ordered:
+            # Em modo ordenado o MongoDB interrompe no primeiro erro
+            primeiro = min(falhas) if falhas else 0
+            for i in range(primeiro + 1, len(lote)):
+                falhas.setdefault(i, "Não gravada: lote interrompido por erro anterior")
+    gravadas, corridas = [], []
+    for i, (posicao, doc) in enumerate(lote):
+        if falhas.get(i) == 'existente':
+            corridas.append((posicao, doc))
+        elif i in falhas:
+            relatorio[posicao].update(status="erro", erro=falhas[i])
+        else:
+            relatorio[posicao].update(status="importada", nota_id=doc['id'])
+            gravadas.append(doc)
+    await atualizar_resumos(gravadas)
+
+    # Importação concorrente do mesmo XML: a nota foi gravada entre a consulta e o insert
+    if corridas:
+        cursor = db.notas_fiscais.find(
+            {"usuario_id": corridas[0][1]['usuario_id'],
+             "chave_idempotencia": {"$in": [doc['chave_idempotencia'] for _, doc in corridas]}},
+            {"_id": 0, "id": 1, "empresa_id": 1, "chave_idempotencia": 1}
+        )
+        existentes = {(n['empresa_id'], n['chave_idempotencia']): n['id'] async for n in cursor}
+        for posicao, doc in corridas:
+            relatorio[posicao].update(
+                status="existente", nota_id=existentes.get((doc['empresa_id'], doc['chave_idempotencia']))
+            )
+    lote.clear()
+
+async def _converter_notas_xml(janela: List[tuple], empresas: dict, usuario_id: str,
+                               relatorio: List[dict], lote: List[tuple], vistas: dict):
+    """Faz o parse de uma janela de XMLs no pool e monta os documentos de nota.
+
+    Como no lote, (empresa_id, numero_nf) identifica a nota: XMLs de notas já
+    gravadas (inclusive arquivadas) ou repetidos na mesma importação saem como
+    `existente`. `vistas` acumula essas chaves entre as janelas; contra
+    importações simultâneas vale o índice único de chave_idempotencia.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_nfe_pool()
+    resultados = await asyncio.gather(
+        *[loop.run_in_executor(pool, parse_nfe_xml, conteudo) for _, conteudo in janela],
+        return_exceptions=True
+    )
+
+    # Resolve os produtos de toda a janela com uma única consulta por código
+    codigos = {item['codigo'] for r in resultados if isinstance(r, dict) for item in r['itens']}
+    produtos = {}
+    if codigos:
+        cursor = db.produtos.find(
+            {"usuario_id": usuario_id, "codigo": {"$in": list(codigos)}},
+            {"_id": 0, "id": 1, "empresa_id": 1, "codigo": 1}
+        )
+        produtos = {(p['empresa_id'], p['codigo']): p['id'] async for p in cursor}
+
+    # Notas já gravadas com os números desta janela, numa consulta por coleção
+    numeros = list({r['numero_nf'] for r in resultados if isinstance(r, dict)})
+    if numeros:
+        filtro = {"usuario_id": usuario_id, "numero_nf": {"$in": numeros}}
+        projecao = {"_id": 0, "id": 1, "empresa_id": 1, "numero_nf": 1}
+        for gravadas in await asyncio.gather(
+            db.notas_fiscais.find(filtro, projecao).to_list(None),
+            db.notas_arquivo.find(filtro, projecao).to_list(None)
+        ):
+            for n in gravadas:
+                vistas.setdefault((n['empresa_id'], n['numero_nf']), n['id'])
+
+    for (posicao, _), resultado in zip(janela, resultados):
+        if isinstance(resultado, Exception):
+            relatorio[posicao].update(status="erro", erro=str(resultado))
+            continue
+        empresa = empresas.get(resultado['cnpj_destinatario']) or empresas.get(resultado['cnpj_emitente'])
+        if not empresa:
+            relatorio[posicao].update(
+                status="erro",
+                erro=f"Nenhuma empresa cadastrada com CNPJ {resultado['cnpj_destinatario'] or resultado['cnpj_emitente']}"
+            )
+            continue
+        chave = (empresa['id'], resultado['numero_nf'])
+        if chave in vistas:
+            relatorio[posicao].update(status="existente", numero_nf=resultado['numero_nf'], nota_id=vistas[chave])
+            continue
+        itens = [
+            ItemNF(
+                produto_id=produtos.get((empresa['id'], item['codigo']), item['codigo']),
+                **{k: v for k, v in item.items() if k != 'codigo'}
+            )
+            for item in resultado['itens']
+        ]
+        nota_fiscal = NotaFiscal(
+            empresa_id=empresa['id'],
+            empresa_nome=empresa['nome'],
+            numero_nf=resultado['numero_nf'],
+            data_emissao=resultado['data_emissao'],
+            itens=itens,
+            total_valor=resultado['total_valor'],
+            total_icms=resultado['total_icms'],
+            total_pis=resultado['total_pis'],
+            total_cofins=resultado['total_cofins'],
+            total_ipi=resultado['total_ipi'],
+            usuario_id=usuario_id
+        )
+        doc = {**nota_fiscal.model_dump(), 'chave_idempotencia': nota_fiscal.numero_nf}
+        relatorio[posicao]['numero_nf'] = nota_fiscal.numero_nf
+        vistas[chave] = nota_fiscal.id
+        lote.append((posicao, doc))
+
+@api_router.post("/notas/importar", response_model=dict)
+async def importar_notas_xml(
+    arquivos: List[UploadFile] = File(...),
+    ordered: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """Importa NF-e a partir de vários XMLs e/ou arquivos ZIP contendo XMLs.
+
+    Os arquivos são lidos um a um, o parse roda num pool de processos em
+    janelas limitadas e as notas são gravadas com insert_many em lotes de
+    NFE_IMPORT_BATCH_SIZE. Notas já gravadas não são duplicadas: o XML
+    sai como `existente` com o ID original. Retorna o resultado de cada arquivo.
+    """
+    usuario_id = current_user['usuario_id']
+    empresas = {
+        _somente_digitos(e['cnpj']): e
+        async for e in db.empresas.find({"usuario_id": usuario_id}, {"_id": 0, "id": 1, "nome": 1, "cnpj": 1})
+    }
+
+    relatorio = []
+    janela = []
+    lote = []
+    vistas = {}
+    tamanho_janela = NFE_IMPORT_WORKERS * 4
+
+    async for nome, conteudo in iterar_xmls(arquivos):
+        relatorio.append({"arquivo": nome})
+        if conteudo is None:
+            relatorio[-1].update(status="erro", erro=f"Arquivo excede {NFE_MAX_XML_BYTES} bytes")
+            continue
+        janela.append((len(relatorio) - 1, conteudo))
+        if len(janela) >= tamanho_janela:
+            await _converter_notas_xml(janela, empresas, usuario_id, relatorio, lote, vistas)
+            janela.clear()
+        if len(lote) >= NFE_IMPORT_BATCH_SIZE:
+            await _gravar_lote_notas(lote, relatorio, ordered)
+
+    if janela:
+        await _converter_notas_xml(janela, empresas, usuario_id, relatorio, lote, vistas)
+    await _gravar_lote_notas(lote, relatorio, ordered)
+
+    importadas = sum(1 for r in relatorio if r.get('status') == 'importada')
+    existentes = sum(1 for r in relatorio if r.get('status') == 'existente')
+    if importadas:
+        await invalidar_leituras(usuario_id, 'notas')
+    return {
+        "total": len(relatorio),
+        "importadas": importadas,
+        "existentes": existentes,
+        "erros": len(relatorio) - importadas - existentes,
+        "arquivos": relatorio
+    }
+
+# ============= ROUTES - DASHBOARD =============
+
+@api_router.get("/dashboard", response_model=DashboardStats)
+async def get_dashboard(
+    leitura: LeituraVersionada = Depends(leitura_versionada('empresas', 'produtos', 'notas')),
+    current_user: dict = Depends(get_current_user)
+):
+    if leitura.resposta:
+        return leitura.resposta
+    usuario_id = current_user['usuario_id']
+    # Totals come from the monthly rollups; recent notas use the (usuario_id, data_emissao) index
+    total_empresas, total_produtos, totais, notas_recentes = await asyncio.gather(
+        db.empresas.count_documents({"usuario_id": usuario_id}),
+        db.produtos.count_documents({"usuario_id": usuario_id}),
+        totais_resumos(usuario_id),
+        db.notas_fiscais.find({"usuario_id": usuario_id}, NOTA_RESUMO_PROJECTION)
+            .sort([("data_emissao", DESCENDING), ("id", DESCENDING)]).limit(5).to_list(5)
+    )
     
-    # Style headers
-    for cell in ws[1]:
+    return leitura.responder(dict(
+        total_empresas=total_empresas,
+        total_produtos=total_produtos,
+        total_notas=totais['total_notas'],
+        total_valor_notas=totais['total_valor'],
+        total_impostos={
+            'icms': totais['total_icms'],
+            'pis': totais['total_pis'],
+            'cofins': totais['total_cofins'],
+            'ipi': totais['total_ipi']
+        },
+        notas_recentes=notas_recentes
+    ))
+
+# ============= RELATÓRIOS - GERAÇÃO =============
+
+# As funções desta seção são síncronas e rodam nos processos do pool de
+# relatórios, com um cliente pymongo próprio de cada processo.
+
+class RelatorioParametros(BaseModel):
+    empresa_id: Optional[str] = None
+    data_inicio: Optional[datetime] = None
+    data_fim: Optional[datetime] = None
+    itens: bool = False
+    desde: Optional[datetime] = None  # marca d'água em created_at (exportação colunar)
+
+class RelatorioJobCreate(RelatorioParametros):
+    tipo: str  # pdf, excel, parquet, arrow
+
+class RelatorioJob(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    tipo: str
+    parametros: dict
+    status: str  # pendente, processando, concluido, erro
+    progresso: int = 0
+    erro: Optional[str] = None
+    criado_em: datetime
+    expira_em: datetime
+
+def totais_relatorio(database, usuario_id: str, parametros: RelatorioParametros) -> dict:
+    """Totais do relatório: dos resumos quando não há período, senão das notas (inclusive arquivadas)"""
+    if parametros.data_inicio or parametros.data_fim:
+        query = filtro_notas(usuario_id, empresa_id=parametros.empresa_id,
+                             data_inicio=parametros.data_inicio, data_fim=parametros.data_fim)
+        pipeline = pipeline_totais(query, {"$sum": 1})
+        return formatar_totais(somar_grupos(
+            list(database.notas_fiscais.aggregate(pipeline)), list(database.notas_arquivo.aggregate(pipeline))
+        ))
+    match = {"usuario_id": usuario_id}
+    if parametros.empresa_id:
+        match["empresa_id"] = parametros.empresa_id
+    return formatar_totais(list(database.resumos.aggregate(pipeline_totais(match))))
+
+def totais_por_empresa(database, usuario_id: str, parametros: RelatorioParametros) -> List[dict]:
+    """Totais agrupados por empresa, com o nome da empresa, ordenados pelo nome"""
+    if parametros.data_inicio or parametros.data_fim:
+        query = filtro_notas(usuario_id, empresa_id=parametros.empresa_id,
+                             data_inicio=parametros.data_inicio, data_fim=parametros.data_fim)
+        pipeline = pipeline_totais(query, {"$sum": 1}, "$empresa_id")
+        # Os resumos já contam as notas arquivadas; com período elas são somadas à parte
+        grupos = somar_grupos(
+            list(database.notas_fiscais.aggregate(pipeline)), list(database.notas_arquivo.aggregate(pipeline))
+        )
+    else:
+        match = {"usuario_id": usuario_id}
+        if parametros.empresa_id:
+            match["empresa_id"] = parametros.empresa_id
+        grupos = list(database.resumos.aggregate(pipeline_totais(match, agrupamento="$empresa_id")))
+    nomes = {
+        e['id']: e['nome']
+        for e in database.empresas.find({"id": {"$in": [g['_id'] for g in grupos]}}, {"_id": 0, "id": 1, "nome": 1})
+    }
+    linhas = [{'empresa_nome': nomes.get(g['_id'], g['_id']), **formatar_totais([g])} for g in grupos]
+    return sorted(linhas, key=lambda linha: str(linha['empresa_nome']).lower())
+
+@functools.lru_cache(maxsize=65536)
+def _ajustar_texto(texto: str, largura: float, fonte: str, tamanho: float) -> tuple:
+    """Texto truncado com reticências para caber em `largura`, e sua largura final.
+
+    Em cache: nomes de produto e valores se repetem muito entre as linhas e
+    medir o texto é a parte mais cara de desenhar uma linha.
+    """
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    medida = stringWidth(texto, fonte, tamanho)
+    if medida <= largura:
+        return texto, medida
+    while texto and stringWidth(texto + '…', fonte, tamanho) > largura:
+        texto = texto[:-1]
+    return texto + '…', stringWidth(texto + '…', fonte, tamanho)
+
+class PaginadorPdf:
+    """Desenha o PDF direto no canvas, página a página.
+
+    Nada é acumulado além da página corrente (o reportlab só guarda o
+    conteúdo já comprimido das anteriores), então a memória não cresce com
+    o número de linhas como aconteceria com os flowables do platypus.
+    """
+    CM = 72 / 2.54  # pontos por centímetro, como reportlab.lib.units.cm
+    MARGEM = 1.5 * CM
+    ALTURA_LINHA = 11
+    FONTE = 'Helvetica'
+    FONTE_NEGRITO = 'Helvetica-Bold'
+    TAMANHO = 7.5
+
+    def __init__(self, caminho: str, titulo: str):
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen import canvas as pdf_canvas
+        self.canvas = pdf_canvas.Canvas(caminho, pagesize=A4, pageCompression=1)
+        self.canvas.setTitle(titulo)
+        self.largura, self.altura = A4
+        self.titulo = titulo
+        self.pagina = 0
+        self.colunas = None
+        self._nova_pagina()
+
+    def _nova_pagina(self):
+        if self.pagina:
+            self.canvas.showPage()
+        self.pagina += 1
+        self.y = self.altura - self.MARGEM
+        self.canvas.setFont(self.FONTE, 7)
+        self.canvas.setFillColor('grey')
+        self.canvas.drawString(self.MARGEM, self.MARGEM / 2, self.titulo)
+        self.canvas.drawRightString(self.largura - self.MARGEM, self.MARGEM / 2, f"Página {self.pagina}")
+        self.canvas.setFillColor('black')
+        if self.colunas:
+            self._cabecalho_tabela()
+
+    def garantir(self, linhas: int = 1):
+        """Quebra a página se não couberem `linhas` linhas de tabela"""
+        if self.y - linhas * self.ALTURA_LINHA < self.MARGEM:
+            self._nova_pagina()
+
+
+    def _faixa(self, cor):
+        self.canvas.setFillColor(cor)
+        self.canvas.rect(self.MARGEM, self.y - self.ALTURA_LINHA + 2.5, self.largura - 2 * self.MARGEM,
+                         self.ALTURA_LINHA, stroke=0, fill=1)
+        self.canvas.setFillColor('black')
+
+    def titulo_documento(self, subtitulo: str = ''):
+        self.canvas.setFont(self.FONTE_NEGRITO, 16)
+        self.canvas.drawString(self.MARGEM, self.y - 16, self.titulo)
+        self.y -= 24
+        if subtitulo:
+            self.canvas.setFont(self.FONTE, 9)
+            self.canvas.drawString(self.MARGEM, self.y - 9, subtitulo)
+            self.y -= 15
+
+    def secao(self, titulo: str):
+        self.colunas = None
+        self.garantir(4)
+        self.y -= 8
+        self.canvas.setFont(self.FONTE_NEGRITO, 11)
+        self.canvas.drawString(self.MARGEM, self.y - 11, titulo)
+        self.y -= 17
+
+    def tabela(self, colunas: List[tuple]):
+        """Define as colunas (título, largura em cm, 'E' ou 'D') e desenha o cabeçalho"""
+        self.colunas = []
+        x = self.MARGEM
+        for titulo, largura, alinhamento in colunas:
+            self.colunas.append((titulo, x, largura * self.CM, alinhamento))
+            x += largura * self.CM
+        self.garantir(2)
+        self._cabecalho_tabela()
+
+    def _cabecalho_tabela(self):
+        self._faixa('#4472C4')
+        self.canvas.setFillColor('white')
+        self._escrever([titulo for titulo, *_ in self.colunas], self.FONTE_NEGRITO)
+        self.canvas.setFillColor('black')
+
+    def _escrever(self, valores: list, fonte: str):
+        self.canvas.setFont(fonte, self.TAMANHO)
+        base = self.y - self.ALTURA_LINHA + 5
+        for valor, (_, x, largura, alinhamento) in zip(valores, self.colunas):
+            texto, largura_texto = _ajustar_texto(str(valor), largura - 4, fonte, self.TAMANHO)
+            if alinhamento == 'D':
+                self.canvas.drawString(x + largura - 2 - largura_texto, base, texto)
+            else:
+                self.canvas.drawString(x + 2, base, texto)
+        self.y -= self.ALTURA_LINHA
+
+    def linha(self, valores: list, negrito: bool = False):
+        self.garantir()
+        self._escrever(valores, self.FONTE_NEGRITO if negrito else self.FONTE)
+
+    def destaque(self, esquerda: str, direita: str = ''):
+        """Linha em negrito e com fundo ocupando a largura toda da tabela"""
+        self.garantir()
+        self._faixa('#E7ECF6')
+        self.canvas.setFont(self.FONTE_NEGRITO, self.TAMANHO)
+        base = self.y - self.ALTURA_LINHA + 5
+        largura_direita = self.canvas.stringWidth(direita, self.FONTE_NEGRITO, self.TAMANHO)
+        largura_util = self.largura - 2 * self.MARGEM - largura_direita - 12
+        self.canvas.drawString(self.MARGEM + 2, base, _ajustar_texto(esquerda, largura_util, self.FONTE_NEGRITO, self.TAMANHO)[0])
+        self.canvas.drawRightString(self.largura - self.MARGEM - 2, base, direita)
+        self.y -= self.ALTURA_LINHA
+
+    def salvar(self):
+        self.canvas.save()
+
+def _moeda(valor) -> str:
+    return f"{valor or 0:,.2f}"
+
+def _data_pdf(valor) -> str:
+    if isinstance(valor, datetime):
+        return valor.astimezone(timezone.utc).strftime('%d/%m/%Y')
+    return str(valor or '')[:10]
+
+PDF_COLUNAS_TOTAIS = [('ICMS', 2.3, 'D'), ('PIS', 2.0, 'D'), ('COFINS', 2.2, 'D'), ('IPI', 2.0, 'D')]
+PDF_COLUNAS_EMPRESAS = [('Empresa', 4.6, 'E'), ('Notas', 1.5, 'D'), ('Valor Total', 3.4, 'D'), *PDF_COLUNAS_TOTAIS]
+PDF_COLUNAS_ITENS = [
+    ('Produto', 5.2, 'E'), ('Qtd', 1.4, 'D'), ('Vl. Unit.', 1.8, 'D'), ('Total', 2.0, 'D'),
+    ('ICMS', 1.6, 'D'), ('PIS', 1.4, 'D'), ('COFINS', 1.6, 'D'), ('IPI', 1.0, 'D')
+]
+
+def gerar_pdf(database, usuario_id: str, parametros: RelatorioParametros, caminho: str, progresso):
+    """Relatório em PDF com resumo e totais por empresa; com `parametros.itens`,
+    também cada nota do período com seus itens.
+
+    As notas (quentes e arquivadas, como nos totais) vêm ordenadas por
+    emissão, lidas em lotes de RELATORIO_BATCH_SIZE, e cada linha vai direto
+    para o canvas.
+    """
+    totais = totais_relatorio(database, usuario_id, parametros)
+    por_empresa = totais_por_empresa(database, usuario_id, parametros)
+    progresso(5)
+
+    periodo = ''
+    if parametros.data_inicio or parametros.data_fim:
+        periodo = f"Período: {_data_pdf(parametros.data_inicio) or 'início'} a {_data_pdf(parametros.data_fim) or 'hoje'}"
+    pdf = PaginadorPdf(caminho, "Relatório Fiscal - FiscalManager Total")
+    pdf.titulo_documento(periodo)
+
+    pdf.secao("Resumo")
+    pdf.tabela([('Indicador', 8.0, 'E'), ('Valor', 6.0, 'D')])
+    pdf.linha(['Total de Notas', str(totais['total_notas'])])
+    pdf.linha(['Valor Total', f"R$ {totais['total_valor']:,.2f}"])
+    pdf.linha(['ICMS', f"R$ {totais['total_icms']:,.2f}"])
+    pdf.linha(['PIS', f"R$ {totais['total_pis']:,.2f}"])
+    pdf.linha(['COFINS', f"R$ {totais['total_cofins']:,.2f}"])
+    pdf.linha(['IPI', f"R$ {totais['total_ipi']:,.2f}"])
+
+    pdf.secao("Por empresa")
+    pdf.tabela(PDF_COLUNAS_EMPRESAS)
+    for linha in por_empresa:
+        pdf.linha([linha['empresa_nome'], linha['total_notas'], *(_moeda(linha[c]) for c in CAMPOS_RESUMO)])
+    pdf.linha(['Total', totais['total_notas'], *(_moeda(totais[c]) for c in CAMPOS_RESUMO)], negrito=True)
+
+    if parametros.itens:
+        pdf.secao("Notas e itens")
+        pdf.tabela(PDF_COLUNAS_ITENS)
+        query = filtro_notas(usuario_id, empresa_id=parametros.empresa_id,
+                             data_inicio=parametros.data_inicio, data_fim=parametros.data_fim)
+        # Mesmo conjunto dos totais: notas quentes e arquivadas, intercaladas por emissão
+        notas = notas_relatorio(
+            database, query, {"_id": 0, "numero_nf": 1, "empresa_nome": 1, "total_valor": 1},
+            [("data_emissao", ASCENDING), ("id", ASCENDING)], itens=True
+        )
+        for escritas, nota in enumerate(notas, 1):
+            pdf.garantir(2)  # cabeçalho da nota nunca fica sozinho no fim da página
+            pdf.destaque(
+                f"NF {nota.get('numero_nf', '')} · {nota.get('empresa_nome', '')} · {_data_pdf(nota.get('data_emissao'))}",
+                f"Total R$ {_moeda(nota.get('total_valor'))}"
+            )
+            for item in nota.get('itens', []):
+                pdf.linha([
+                    item.get('produto_nome', ''),
+                    f"{item.get('quantidade', 0):g}",
+                    *(_moeda(item.get(c)) for c in ('valor_unitario', 'total_item', 'icms', 'pis', 'cofins', 'ipi'))
+                ])
+            if escritas % RELATORIO_BATCH_SIZE == 0:
+                progresso(5 + int(90 * escritas / max(totais['total_notas'], 1)))
+
+    pdf.salvar()
+
+EXCEL_COLUNAS_NOTAS = ['Número NF', 'Empresa', 'Data Emissão', 'Valor Total', 'ICMS', 'PIS', 'COFINS', 'IPI']
+EXCEL_COLUNAS_ITENS = [
+    'Número NF', 'Data Emissão', 'Produto', 'Quantidade', 'Valor Unitário', 'Total Item', 'ICMS', 'PIS', 'COFINS', 'IPI'
+]
+CAMPOS_VALOR_NOTA = ['total_valor', 'total_icms', 'total_pis', 'total_cofins', 'total_ipi']
+CAMPOS_VALOR_ITEM = ['quantidade', 'valor_unitario', 'total_item', 'icms', 'pis', 'cofins', 'ipi']
+
+def pipeline_larguras_excel(query: dict, incluir_itens: bool) -> List[dict]:
+    """Larguras das colunas calculadas no banco, numa única agregação.
+
+    Planilhas write-only gravam <cols> antes da primeira linha, então as
+    larguras precisam ser conhecidas antes de começar a escrever.
+    """
+    def max_len(expr):
+        return {"$max": {"$strLenCP": {"$ifNull": [{"$toString": expr}, ""]}}}
+
+    grupo = {
+        "_id": None,
+        "total": {"$sum": 1},
+        "numero_nf": max_len("$numero_nf"),
+        "empresa_nome": max_len("$empresa_nome"),
+        "data_emissao": max_len("$data_emissao"),
+        **{c: {"$max": {"$abs": f"${c}"}} for c in CAMPOS_VALOR_NOTA}
+    }
+    if incluir_itens:
+        # Só notas antigas, com itens embutidos; as demais ficam para pipeline_larguras_itens
+        itens = {"$ifNull": ["$itens", []]}
+        grupo["produto_nome"] = {"$max": {"$max": {"$map": {
+            "input": itens, "in": {"$strLenCP": {"$ifNull": ["$$this.produto_nome", ""]}}
+        }}}}
+        for c in CAMPOS_VALOR_ITEM:
+            grupo[f"item_{c}"] = {"$max": {"$max": {"$map": {"input": itens, "in": {"$abs": f"$$this.{c}"}}}}}
+    return [{"$match": query}, {"$group": grupo}]
+
+def pipeline_larguras_itens(query: dict) -> List[dict]:
+    """Larguras das colunas de itens a partir de itens_nf (mesmo filtro de empresa e período)"""
+    match = {campo: query[campo] for campo in ('usuario_id', 'empresa_id', 'data_emissao') if campo in query}
+    return [{"$match": match}, {"$group": {
+        "_id": None,
+        "produto_nome": {"$max": {"$strLenCP": {"$ifNull": ["$produto_nome", ""]}}},
+        **{f"item_{c}": {"$max": {"$abs": f"${c}"}} for c in CAMPOS_VALOR_ITEM}
+    }}]
+
+def pipeline_larguras_arquivo(query: dict, incluir_itens: bool) -> List[dict]:
+    """Larguras das notas arquivadas, cujos itens estão comprimidos em itens_z.
+
+    Os valores de item vêm de itens_produto: a soma por produto limita o
+    valor de cada item, então a coluna nunca fica estreita demais.
+    """
+    pipeline = pipeline_larguras_excel(query, False)
+    if incluir_itens:
+        somas = {"$ifNull": ["$itens_produto", []]}
+        for c in VALORES_ITEM.values():
+            pipeline[-1]["$group"][f"item_{c}"] = {
+                "$max": {"$max": {"$map": {"input": somas, "in": {"$abs": f"$$this.{c}"}}}}
+            }
+    return pipeline
+
+def _largura(titulo: str, valor, numerico: bool = False) -> int:
+    if numerico:
+        comprimento = len(str(round(valor or 0, 2))) + 1
+    else:
+        comprimento = valor or 0
+    return max(len(titulo), comprimento) + 2
+
+def _nova_planilha(wb, titulo: str, colunas: List[str], larguras: List[int]):
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, Alignment, PatternFill
+    from openpyxl.utils import get_column_letter
+    ws = wb.create_sheet(titulo)
+    for i, largura in enumerate(larguras, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = largura
+    cabecalho = []
+    for coluna in colunas:
+        cell = WriteOnlyCell(ws, value=coluna)
         cell.font = Font(bold=True, color="FFFFFF")
         cell.fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
         cell.alignment = Alignment(horizontal="center")
-    
-    # Data
+        cabecalho.append(cell)
+    ws.append(cabecalho)
+    return ws
+
+def _data_excel(valor):
+    """Excel não armazena fuso horário: grava datas como UTC sem tzinfo"""
+    if isinstance(valor, datetime) and valor.tzinfo is not None:
+        return valor.astimezone(timezone.utc).replace(tzinfo=None)
+    return valor
+
+def _escrever_lote_excel(ws_notas, ws_itens, notas: List[dict]):
+    """Escreve um lote de notas (e seus itens) nas planilhas write-only"""
     for nota in notas:
-        ws.append([
+        data_emissao = _data_excel(nota.get('data_emissao', ''))
+        ws_notas.append([
             nota.get('numero_nf', ''),
             nota.get('empresa_nome', ''),
-            nota.get('data_emissao', ''),
+            data_emissao,
             nota.get('total_valor', 0),
             nota.get('total_icms', 0),
             nota.get('total_pis', 0),
             nota.get('total_cofins', 0),
             nota.get('total_ipi', 0)
         ])
+        if ws_itens is not None:
+            for item in nota.get('itens', []):
+                ws_itens.append([
+                    nota.get('numero_nf', ''),
+                    data_emissao,
+                    item.get('produto_nome', ''),
+                    *(item.get(c, 0) for c in CAMPOS_VALOR_ITEM)
+                ])
+
+def gerar_excel(database, usuario_id: str, parametros: RelatorioParametros, caminho: str, progresso):
+    """Exporta as notas (quentes e arquivadas) para .xlsx em modo write-only, lendo os cursores em lotes.
+
+    Com `parametros.itens` inclui uma planilha com cada ItemNF.
+    """
+    query = filtro_notas(usuario_id, empresa_id=parametros.empresa_id,
+                         data_inicio=parametros.data_inicio, data_fim=parametros.data_fim)
+    resultado = list(database.notas_fiscais.aggregate(pipeline_larguras_excel(query, parametros.itens)))
+    maximos = resultado[0] if resultado else {}
+    parciais = [database.notas_arquivo.aggregate(pipeline_larguras_arquivo(query, parametros.itens))]
+    if parametros.itens:
+        parciais.append(database.itens_nf.aggregate(pipeline_larguras_itens(query)))
+    for parcial in parciais:
+        for campo, valor in next(parcial, {}).items():
+            if campo == 'total':
+                maximos['total'] = maximos.get('total', 0) + valor
+            elif campo != '_id' and valor is not None:
+                maximos[campo] = max(maximos.get(campo) or 0, valor)
+    total = maximos.get('total', 0)
     
-    # Auto-adjust column widths
-    for column in ws.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(cell.value)
-            except:
-                pass
-        adjusted_width = (max_length + 2)
-        ws.column_dimensions[column_letter].width = adjusted_width
+    import openpyxl
+    wb = openpyxl.Workbook(write_only=True)
+    ws_notas = _nova_planilha(wb, "Relatório Fiscal", EXCEL_COLUNAS_NOTAS, [
+        _largura('Número NF', maximos.get('numero_nf')),
+        _largura('Empresa', maximos.get('empresa_nome')),
+        _largura('Data Emissão', maximos.get('data_emissao')),
+        *(_largura(t, maximos.get(c), numerico=True) for t, c in zip(EXCEL_COLUNAS_NOTAS[3:], CAMPOS_VALOR_NOTA))
+    ])
+    ws_itens = None
+    if parametros.itens:
+        ws_itens = _nova_planilha(wb, "Itens", EXCEL_COLUNAS_ITENS, [
+            _largura('Número NF', maximos.get('numero_nf')),
+            _largura('Data Emissão', maximos.get('data_emissao')),
+            _largura('Produto', maximos.get('produto_nome')),
+            *(_largura(t, maximos.get(f"item_{c}"), numerico=True) for t, c in zip(EXCEL_COLUNAS_ITENS[3:], CAMPOS_VALOR_ITEM))
+        ])
+    
+    projection = {"_id": 0, "numero_nf": 1, "empresa_nome": 1, **{c: 1 for c in CAMPOS_VALOR_NOTA}}
+    cursor = notas_relatorio(
+        database, query, projection, [("data_emissao", DESCENDING), ("id", DESCENDING)], itens=parametros.itens
+    )
+    
+    lote = []
+    escritas = 0
+    for nota in cursor:
+        lote.append(nota)
+        if len(lote) >= RELATORIO_BATCH_SIZE:
+            _escrever_lote_excel(ws_notas, ws_itens, lote)
+            escritas += len(lote)
+            lote = []
+            progresso(int(95 * escritas / max(total, 1)))
+    if lote:
+        _escrever_lote_excel(ws_notas, ws_itens, lote)
+    
+    wb.save(caminho)
+
+@functools.cache
+def schema_colunar():
+    """Uma linha por item, com os campos da nota repetidos (formato "largo" para BI)"""
+    import pyarrow as pa
+    return pa.schema([
+        ('nota_id', pa.string()),
+        ('numero_nf', pa.string()),
+        ('empresa_id', pa.string()),
+        ('empresa_nome', pa.string()),
+        ('data_emissao', pa.timestamp('ms', tz='UTC')),
+        ('created_at', pa.timestamp('ms', tz='UTC')),
+        *((c, pa.float64()) for c in CAMPOS_VALOR_NOTA),
+        ('item_indice', pa.int32()),
+        ('produto_id', pa.string()),
+        ('produto_nome', pa.string()),
+        *((f"item_{c}", pa.float64()) for c in CAMPOS_VALOR_ITEM),
+    ])
+
+class _ParticaoColunar:
+    """Arquivo de uma partição (empresa, mês) sendo escrito em record batches"""
+
+    def __init__(self, pasta: str, empresa_id: str, mes: str, formato: str):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.relativo = f"empresa_id={empresa_id}/mes={mes}/part-0.{formato}"
+        self.caminho = os.path.join(pasta, self.relativo)
+        os.makedirs(os.path.dirname(self.caminho), exist_ok=True)
+        self.schema = schema_colunar()
+        if formato == 'parquet':
+            self.escritor = pq.ParquetWriter(self.caminho, self.schema, compression='zstd')
+        else:
+            self.escritor = pa.ipc.new_file(
+                self.caminho, self.schema, options=pa.ipc.IpcWriteOptions(compression='zstd')
+            )
+        self.colunas = {nome: [] for nome in self.schema.names}
+        self.linhas = 0
+
+    def adicionar(self, nota: dict):
+        for indice, item in enumerate(nota.get('itens') or []):
+            self.colunas['nota_id'].append(nota['id'])
+            self.colunas['numero_nf'].append(nota.get('numero_nf'))
+            self.colunas['empresa_id'].append(nota['empresa_id'])
+            self.colunas['empresa_nome'].append(nota.get('empresa_nome'))
+            self.colunas['data_emissao'].append(nota.get('data_emissao'))
+            self.colunas['created_at'].append(nota.get('created_at'))
+            for c in CAMPOS_VALOR_NOTA:
+                self.colunas[c].append(nota.get(c))
+            self.colunas['item_indice'].append(indice)
+            self.colunas['produto_id'].append(item.get('produto_id'))
+            self.colunas['produto_nome'].append(item.get('produto_nome'))
+            for c in CAMPOS_VALOR_ITEM:
+                self.colunas[f"item_{c}"].append(item.get(c))
+        if len(self.colunas['nota_id']) >= RELATORIO_BATCH_SIZE:
+            self.descarregar()
+
+    def descarregar(self):
+        import pyarrow as pa
+        if self.colunas['nota_id']:
+            self.linhas += len(self.colunas['nota_id'])
+            self.escritor.write_batch(pa.RecordBatch.from_pydict(self.colunas, schema=self.schema))
+            self.colunas = {nome: [] for nome in self.schema.names}
+
+    def fechar(self):
+        self.descarregar()
+        self.escritor.close()
+
+def gerar_colunar(database, usuario_id: str, parametros: RelatorioParametros, caminho: str, progresso,
+                  formato: str = 'parquet'):
+    """Exporta notas e itens achatados em Parquet ou Arrow IPC, particionados por empresa e mês.
+
+    Notas quentes e arquivadas vêm intercaladas em ordem de (empresa_id,
+    data_emissao), então só uma partição fica aberta por vez e cada uma é
+    escrita em record batches de RELATORIO_BATCH_SIZE linhas. O artefato é um ZIP com layout Hive
+    (empresa_id=.../mes=.../part-0.parquet) e um _manifesto.json com a marca
+    d'água a usar como `desde` na próxima exportação incremental.
+    """
+    query = filtro_notas(usuario_id, empresa_id=parametros.empresa_id,
+                         data_inicio=parametros.data_inicio, data_fim=parametros.data_fim)
+    if parametros.desde:
+        query["created_at"] = {"$gt": data_para_filtro(parametros.desde)}
+    total = database.notas_fiscais.count_documents(query) + database.notas_arquivo.count_documents(query)
+    projection = {
+        "_id": 0, "numero_nf": 1, "empresa_nome": 1, "created_at": 1, **{c: 1 for c in CAMPOS_VALOR_NOTA}
+    }
+    cursor = notas_relatorio(
+        database, query, projection,
+        [("empresa_id", ASCENDING), ("data_emissao", DESCENDING), ("id", DESCENDING)], itens=True
+    )
+
+    particoes = []
+    marca_dagua = data_para_filtro(parametros.desde) if parametros.desde else None
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(caminho)) as pasta, \
+            zipfile.ZipFile(caminho, 'w', zipfile.ZIP_STORED) as arquivo_zip:
+        # Parquet e Arrow já vêm comprimidos (zstd): o ZIP só agrupa os arquivos
+
+        def concluir(particao: _ParticaoColunar):
+            particao.fechar()
+            arquivo_zip.write(particao.caminho, particao.relativo)
+            os.remove(particao.caminho)
+            particoes.append({"arquivo": particao.relativo, "linhas": particao.linhas})
+
+        atual, chave_atual = None, None
+        for lidas, nota in enumerate(cursor, 1):
+            chave = (nota['empresa_id'], mes_referencia(nota.get('data_emissao')))
+            if chave != chave_atual:
+                if atual:
+                    concluir(atual)
+                atual, chave_atual = _ParticaoColunar(pasta, *chave, formato), chave
+            atual.adicionar(nota)
+            criado = data_para_filtro(nota['created_at']) if nota.get('created_at') else None
+            if criado and (marca_dagua is None or criado > marca_dagua):
+                marca_dagua = criado
+            if lidas % RELATORIO_BATCH_SIZE == 0:
+                progresso(int(95 * lidas / max(total, 1)))
+        if atual:
+            concluir(atual)
+
+        arquivo_zip.writestr('_manifesto.json', json.dumps({
+            "formato": formato,
+            "notas": total,
+            "linhas": sum(p['linhas'] for p in particoes),
+            "desde": data_para_filtro(parametros.desde).isoformat() if parametros.desde else None,
+            "marca_dagua": marca_dagua.isoformat() if marca_dagua else None,
+            "particoes": particoes
+        }, ensure_ascii=False, indent=2))
+
+GERADORES_RELATORIO = {
+    'pdf': (gerar_pdf, 'application/pdf', 'relatorio_fiscal.pdf'),
+    'excel': (gerar_excel, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'relatorio_fiscal.xlsx'),
+    'parquet': (functools.partial(gerar_colunar, formato='parquet'), 'application/zip', 'notas_parquet.zip'),
+    'arrow': (functools.partial(gerar_colunar, formato='arrow'), 'application/zip', 'notas_arrow.zip'),
+}
+
+_worker_client: Optional[MongoClient] = None
+
+def _worker_db():
+    """Cliente pymongo do processo do pool de relatórios (um por processo)"""
+    global _worker_client
+    if _worker_client is None:
+        _worker_client = MongoClient(mongo_url, tz_aware=True)
+    return _worker_client[os.environ['DB_NAME']]
+
+def executar_relatorio(job_id: str, tipo: str, usuario_id: str, parametros: dict, caminho: str):
+    """Ponto de entrada do worker: gera o artefato em `caminho` reportando progresso"""
+    database = _worker_db()
     
-    # Save to buffer
-    buffer = io.BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
+    def progresso(percentual: int):
+        database.relatorios_jobs.update_one({"id": job_id}, {"$set": {"progresso": percentual}})
     
-    return StreamingResponse(buffer, media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", headers={
-        "Content-Disposition": "attachment; filename=relatorio_fiscal.xlsx"
+    gerador = GERADORES_RELATORIO[tipo][0]
+    temporario = f"{caminho}.tmp"
+    gerador(database, usuario_id, RelatorioParametros(**parametros), temporario, progresso)
+    os.replace(temporario, caminho)
+
+# ============= ROUTES - RELATÓRIOS =============
+
+_relatorio_pool: Optional[ProcessPoolExecutor] = None
+_jobs_locais = {}
+
+def get_relatorio_pool() -> ProcessPoolExecutor:
+    global _relatorio_pool
+    if _relatorio_pool is None:
+        _relatorio_pool = ProcessPoolExecutor(max_workers=RELATORIO_WORKERS, mp_context=_contexto_pool())
+    return _relatorio_pool
+
+async def versao_dados_relatorio(usuario_id: str) -> str:
+    """Impressão digital dos dados do usuário, derivada dos resumos mensais.
+
+    Qualquer nota criada, importada ou excluída altera algum resumo, o que
+    invalida os artefatos gerados antes. O arquivamento não muda os resumos
+    nem as linhas (os relatórios leem também notas_arquivo), mas a versão de
+    notas em dados_versoes entra na impressão para cobrir migrações que
+    alteram notas sem tocar nos resumos.
+    """
+    resumos, versoes = await asyncio.gather(
+        db.resumos.find({"usuario_id": usuario_id}, {"_id": 0})
+        .sort([("empresa_id", ASCENDING), ("mes", ASCENDING)]).to_list(None),
+        versoes_dados(usuario_id)
+    )
+    impressao = {"resumos": resumos, "notas": versoes.get('notas', 0)}
+    return hashlib.sha256(json.dumps(impressao, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def limpar_artefatos_expirados():
+    limite = datetime.now(timezone.utc).timestamp() - RELATORIO_TTL_SECONDS
+    for arquivo in RELATORIOS_DIR.glob('*'):
+        try:
+            if arquivo.stat().st_mtime < limite:
+                arquivo.unlink()
+        except FileNotFoundError:
+            pass
+
+def _utc(data: datetime) -> datetime:
+    return data.replace(tzinfo=timezone.utc) if data.tzinfo is None else data
+
+def _job_abandonado(job: dict) -> bool:
+    """Job pendente/processando cujo worker parou de renovar o heartbeat (caiu ou foi reiniciado)"""
+    if job['status'] not in ('pendente', 'processando'):
+        return False
+    heartbeat = job.get('heartbeat')
+    limite = datetime.now(timezone.utc) - timedelta(seconds=RELATORIO_LEASE_SECONDS)
+    return heartbeat is None or _utc(heartbeat) < limite
+
+def _job_reaproveitavel(job: dict) -> bool:
+    if job['status'] == 'erro' or _utc(job['expira_em']) <= datetime.now(timezone.utc):
+        return False
+    if job['status'] == 'concluido':
+        return Path(job['arquivo']).exists()
+    return not _job_abandonado(job)
+
+async def obter_ou_criar_job(tipo: str, usuario_id: str, parametros: RelatorioParametros) -> dict:
+    """Devolve o job existente para o mesmo pedido e dados, ou cria e agenda um novo"""
+    if tipo not in GERADORES_RELATORIO:
+        raise HTTPException(status_code=400, detail="Tipo de relatório inválido")
+    parametros_json = parametros.model_dump(mode='json')
+    versao = await versao_dados_relatorio(usuario_id)
+    chave = hashlib.sha256(
+        json.dumps([usuario_id, tipo, parametros_json, versao], sort_keys=True).encode('utf-8')
+    ).hexdigest()
+    
+    existente = await db.relatorios_jobs.find_one({"chave": chave}, {"_id": 0})
+    if existente and _job_reaproveitavel(existente):
+        return existente
+    if existente:
+        # Expirado, com erro ou órfão: o pedido recomeça num job novo
+        await db.relatorios_jobs.delete_one({"chave": chave, "id": existente['id']})
+    
+    RELATORIOS_DIR.mkdir(parents=True, exist_ok=True)
+    await asyncio.to_thread(limpar_artefatos_expirados)
+    agora = datetime.now(timezone.utc)
+    job_id = str(uuid.uuid4())
+    job = {
+        "id": job_id,
+        "chave": chave,
+        "usuario_id": usuario_id,
+        "tipo": tipo,
+        "parametros": parametros_json,
+        "status": "pendente",
+        "progresso": 0,
+        "erro": None,
+        "arquivo": str(RELATORIOS_DIR / f"{job_id}{Path(GERADORES_RELATORIO[tipo][2]).suffix}"),
+        "criado_em": agora,
+        "heartbeat": agora,
+        "expira_em": agora + timedelta(seconds=RELATORIO_TTL_SECONDS)
+    }
+    try:
+        await db.relatorios_jobs.insert_one(job)
+    except DuplicateKeyError:
+        # Pedido idêntico criado em paralelo (outro request ou worker)
+        return await db.relatorios_jobs.find_one({"chave": chave}, {"_id": 0})
+    job.pop('_id', None)
+    
+    loop = asyncio.get_running_loop()
+    futuro = loop.run_in_executor(
+        get_relatorio_pool(), executar_relatorio, job_id, tipo, usuario_id, parametros_json, job['arquivo']
+    )
+    _jobs_locais[job_id] = asyncio.ensure_future(_acompanhar_job(job_id, futuro))
+    return job
+
+async def _acompanhar_job(job_id: str, futuro):
+    """Registra o resultado do worker e renova o heartbeat enquanto ele trabalha"""
+    await db.relatorios_jobs.update_one(
+        {"id": job_id}, {"$set": {"status": "processando", "heartbeat": datetime.now(timezone.utc)}}
+    )
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(asyncio.shield(futuro), RELATORIO_LEASE_SECONDS / 3)
+                break
+            except asyncio.TimeoutError:
+                await db.relatorios_jobs.update_one(
+                    {"id": job_id}, {"$set": {"heartbeat": datetime.now(timezone.utc)}}
+                )
+        await db.relatorios_jobs.update_one({"id": job_id}, {"$set": {"status": "concluido", "progresso": 100}})
+    except Exception as e:
+        logger.exception(f"Falha ao gerar relatório {job_id}")
+        await db.relatorios_jobs.update_one({"id": job_id}, {"$set": {"status": "erro", "erro": str(e)}})
+    finally:
+        _jobs_locais.pop(job_id, None)
+
+async def aguardar_job(job: dict, espera: float) -> dict:
+    """Espera o job terminar por até `espera` segundos e devolve seu estado.
+
+    Acompanha pelo banco quando ele roda em outro worker; se esse worker
+    morreu (heartbeat vencido), o job é recriado aqui e a espera continua.
+    """
+    limite = time.monotonic() + espera
+    while True:
+        tarefa = _jobs_locais.get(job['id'])
+        if tarefa is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(tarefa), max(limite - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                pass
+        atual = await db.relatorios_jobs.find_one({"id": job['id']}, {"_id": 0})
+        if atual is None:
+            raise HTTPException(status_code=404, detail="Relatório não encontrado")
+        if atual['status'] in ('concluido', 'erro') or time.monotonic() >= limite:
+            return atual
+        if _job_abandonado(atual):
+            job = await obter_ou_criar_job(atual['tipo'], atual['usuario_id'], RelatorioParametros(**atual['parametros']))
+            continue
+        await asyncio.sleep(0.25)
+
+def resposta_artefato(job: dict) -> FileResponse:
+    if job['status'] == 'erro':
+        raise HTTPException(status_code=500, detail=f"Falha ao gerar relatório: {job['erro']}")
+    if job['status'] != 'concluido':
+        raise HTTPException(status_code=409, detail="Relatório ainda em processamento")
+    if not Path(job['arquivo']).exists():
+        raise HTTPException(status_code=410, detail="Relatório expirado")
+    _, media_type, filename = GERADORES_RELATORIO[job['tipo']]
+    return FileResponse(job['arquivo'], media_type=media_type, filename=filename)
+
+async def responder_relatorio(job: dict):
+    """Artefato do job; se não ficar pronto a tempo, 202 com o job para acompanhar em /relatorios/jobs"""
+    job = await aguardar_job(job, RELATORIO_ESPERA_SECONDS)
+    if job['status'] in ('pendente', 'processando'):
+        return RespostaJSON(
+            RelatorioJob(**job).model_dump(mode='json'),
+            status_code=202,
+            headers={"Location": f"/api/relatorios/jobs/{job['id']}"}
+        )
+    return resposta_artefato(job)
+
+@api_router.post("/relatorios/jobs", response_model=RelatorioJob)
+async def criar_relatorio_job(pedido: RelatorioJobCreate, current_user: dict = Depends(get_current_user)):
+    """Agenda a geração de um relatório; pedidos idênticos reaproveitam o mesmo job"""
+    parametros = RelatorioParametros(**pedido.model_dump(exclude={'tipo'}))
+    return await obter_ou_criar_job(pedido.tipo, current_user['usuario_id'], parametros)
+
+@api_router.get("/relatorios/jobs/{job_id}", response_model=RelatorioJob)
+async def get_relatorio_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    job = await db.relatorios_jobs.find_one({"id": job_id, "usuario_id": current_user['usuario_id']}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Relatório não encontrado")
+    return job
+
+@api_router.get("/relatorios/jobs/{job_id}/download")
+async def download_relatorio_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    job = await db.relatorios_jobs.find_one({"id": job_id, "usuario_id": current_user['usuario_id']}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Relatório não encontrado")
+    return resposta_artefato(job)
+
+@api_router.get("/relatorios/pdf")
+async def gerar_relatorio_pdf(
+    empresa_id: Optional[str] = None,
+    data_inicio: Optional[datetime] = None,
+    data_fim: Optional[datetime] = None,
+    itens: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    parametros = RelatorioParametros(empresa_id=empresa_id, data_inicio=data_inicio, data_fim=data_fim, itens=itens)
+    job = await obter_ou_criar_job('pdf', current_user['usuario_id'], parametros)
+    return await responder_relatorio(job)
+
+@api_router.get("/relatorios/excel")
+async def gerar_relatorio_excel(
+    empresa_id: Optional[str] = None,
+    data_inicio: Optional[datetime] = None,
+    data_fim: Optional[datetime] = None,
+    itens: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    parametros = RelatorioParametros(empresa_id=empresa_id, data_inicio=data_inicio, data_fim=data_fim, itens=itens)
+    job = await obter_ou_criar_job('excel', current_user['usuario_id'], parametros)
+    return await responder_relatorio(job)
+
+@api_router.get("/relatorios/exportacao")
+async def exportar_notas_colunar(
+    formato: str = Query('parquet', pattern='^(parquet|arrow)$'),
+    empresa_id: Optional[str] = None,
+    data_inicio: Optional[datetime] = None,
+    data_fim: Optional[datetime] = None,
+    desde: Optional[datetime] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Exportação analítica: ZIP com Parquet/Arrow de notas e itens por empresa e mês.
+
+    Passe em `desde` a marca d'água do _manifesto.json anterior para exportar
+    só as notas criadas depois dela.
+    """
+    parametros = RelatorioParametros(
+        empresa_id=empresa_id, data_inicio=data_inicio, data_fim=data_fim, itens=True, desde=desde
+    )
+    job = await obter_ou_criar_job(formato, current_user['usuario_id'], parametros)
+    return await responder_relatorio(job)
+
+# ============= ROUTES - RELATÓRIOS DE IMPOSTOS =============
+
+AGRUPAMENTOS_IMPOSTOS = ('empresa', 'mes', 'categoria', 'regime')
+# Valores de cada item somados quando o agrupamento exige abrir as notas
+VALORES_ITEM = {
+    'total_valor': 'total_item', 'total_icms': 'icms', 'total_pis': 'pis', 'total_cofins': 'cofins', 'total_ipi': 'ipi'
+}
+
+def _inicio_mes(data: datetime) -> datetime:
+    return data.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def _proximo_mes(data: datetime) -> datetime:
+    return (_inicio_mes(data) + timedelta(days=32)).replace(day=1)
+
+def dividir_periodo(data_inicio: Optional[datetime], data_fim: Optional[datetime]) -> tuple:
+    """Separa o período em meses inteiros e bordas parciais.
+
+    Retorna (meses, bordas): `meses` é o filtro de `mes` nos resumos (None se
+    nenhum mês é coberto por inteiro) e `bordas` são os filtros de
+    `data_emissao` que precisam ser somados a partir das notas.
+    """
+    inicio = data_para_filtro(data_inicio) if data_inicio else None
+    fim = data_para_filtro(data_fim) if data_fim else None
+    # Primeiro mês coberto desde o início e primeiro mês não coberto até o fim (inclusivo)
+    primeiro = None if inicio is None else (inicio if inicio == _inicio_mes(inicio) else _proximo_mes(inicio))
+    limite = None if fim is None else _inicio_mes(fim + timedelta(milliseconds=1))
+    if primeiro is not None and limite is not None and primeiro >= limite:
+        return None, [{"$gte": inicio, "$lte": fim}]
+
+    meses, bordas = {}, []
+    if primeiro is not None:
+        meses["$gte"] = primeiro.strftime('%Y-%m')
+        if inicio < primeiro:
+            bordas.append({"$gte": inicio, "$lt": primeiro})
+    if limite is not None:
+        meses["$lt"] = limite.strftime('%Y-%m')
+        if fim >= limite:
+            bordas.append({"$gte": limite, "$lte": fim})
+    return meses, bordas
+
+def pipeline_impostos(match: dict, agrupar_por: List[str], fonte: str) -> List[dict]:
+    """Agregação de impostos sobre `fonte`: 'resumos', 'notas', 'itens' (itens_nf),
+    'itens_embutidos' (notas antigas, com $unwind dos itens) ou 'itens_arquivados'
+    (notas_arquivo, com $unwind dos itens já somados por produto).
+
+    Agrupa pelo empresa_id (também quando o agrupamento é por regime, que é
+    resolvido depois), pelo mês e, para categoria, primeiro pelo produto_id:
+    a categoria é buscada com $lookup só depois de o grupo já ter reduzido
+    os itens a um documento por produto.
+    """
+    desmembrar = {'itens_embutidos': 'itens', 'itens_arquivados': 'itens_produto'}.get(fonte)
+    prefixo = f"${desmembrar}." if desmembrar else '$'
+    if fonte in ('itens', 'itens_embutidos', 'itens_arquivados'):
+        valores = {c: prefixo + v for c, v in VALORES_ITEM.items()}
+        contagem = ('total_itens', {"$sum": prefixo + "qtd_itens" if fonte == 'itens_arquivados' else 1})
+    else:
+        valores = {c: f"${c}" for c in CAMPOS_RESUMO}
+        contagem = ('total_notas', {"$sum": "$total_notas" if fonte == 'resumos' else 1})
+
+    chave = {}
+    if 'empresa' in agrupar_por or 'regime' in agrupar_por:
+        chave['empresa_id'] = "$empresa_id"
+    if 'mes' in agrupar_por:
+        chave['mes'] = "$mes" if fonte == 'resumos' else \
+            {"$dateToString": {"format": "%Y-%m", "date": {"$toDate": "$data_emissao"}}}
+    if 'categoria' in agrupar_por:
+        chave['produto_id'] = prefixo + "produto_id"
+
+    somas = {contagem[0]: contagem[1], **{c: {"$sum": v} for c, v in valores.items()}}
+    pipeline = [{"$match": match}]
+    if desmembrar:
+        pipeline[0]["$match"] = {**match, desmembrar: {"$exists": True}}
+        pipeline.append({"$unwind": f"${desmembrar}"})
+    pipeline.append({"$group": {"_id": chave or None, **somas}})
+    if 'categoria' in agrupar_por:
+        chave_categoria = {k: f"$_id.{k}" for k in chave if k != 'produto_id'}
+        chave_categoria['categoria'] = {"$ifNull": [{"$arrayElemAt": ["$produto.categoria", 0]}, "Sem categoria"]}
+        pipeline += [
+            {"$lookup": {"from": "produtos", "localField": "_id.produto_id", "foreignField": "id", "as": "produto"}},
+            {"$group": {"_id": chave_categoria, **{c: {"$sum": f"${c}"} for c in somas}}}
+        ]
+    return pipeline
+
+async def agregar_impostos(usuario_id: str, empresa_ids: List[str], data_inicio: Optional[datetime],
+                           data_fim: Optional[datetime], agrupar_por: List[str]) -> List[dict]:
+    """Totais de impostos por grupo, combinando resumos mensais e notas.
+
+    Sem categoria, os meses inteiros do período saem dos resumos e só as
+    bordas parciais são agregadas a partir das notas; com categoria, os itens
+    do período inteiro vêm de itens_nf (e de notas antigas, com $unwind). Nas
+    duas formas as notas arquivadas entram como nos resumos.
+    """
+    base = {"usuario_id": usuario_id}
+    if empresa_ids:
+        base["empresa_id"] = {"$in": empresa_ids}
+
+    consultas = []
+    if 'categoria' in agrupar_por:
+        match = dict(base)
+        if data_inicio or data_fim:
+            match["data_emissao"] = {"$gte": data_para_filtro(data_inicio)} if data_inicio else {}
+            if data_fim:
+                match["data_emissao"]["$lte"] = data_para_filtro(data_fim)
+        consultas.append(db.itens_nf.aggregate(pipeline_impostos(match, agrupar_por, 'itens')))
+        consultas.append(db.notas_fiscais.aggregate(pipeline_impostos(match, agrupar_por, 'itens_embutidos')))
+        consultas.append(db.notas_arquivo.aggregate(pipeline_impostos(match, agrupar_por, 'itens_arquivados')))
+        contagem = 'total_itens'
+    else:
+        meses, bordas = dividir_periodo(data_inicio, data_fim)
+        if meses is not None:
+            match = {**base, "mes": meses} if meses else base
+            consultas.append(db.resumos.aggregate(pipeline_impostos(match, agrupar_por, 'resumos')))
+        for borda in bordas:
+            pipeline = pipeline_impostos({**base, "data_emissao": borda}, agrupar_por, 'notas')
+            consultas.append(db.notas_fiscais.aggregate(pipeline))
+            consultas.append(db.notas_arquivo.aggregate(pipeline))
+        contagem = 'total_notas'
+
+    resultados = await asyncio.gather(*[consulta.to_list(None) for consulta in consultas])
+    empresas = {}
+    if 'empresa' in agrupar_por or 'regime' in agrupar_por:
+        empresas = {
+            e['id']: e async for e in db.empresas.find(
+                {"usuario_id": usuario_id}, {"_id": 0, "id": 1, "nome": 1, "regime_tributario": 1}
+            )
+        }
+
+    grupos = {}
+    for grupo in (g for resultado in resultados for g in resultado):
+        chave = grupo['_id'] or {}
+        linha = {}
+        if 'empresa' in agrupar_por:
+            linha['empresa_id'] = chave.get('empresa_id')
+            linha['empresa_nome'] = empresas.get(chave.get('empresa_id'), {}).get('nome')
+        if 'mes' in agrupar_por:
+            linha['mes'] = chave.get('mes')
+        if 'categoria' in agrupar_por:
+            linha['categoria'] = chave.get('categoria')
+        if 'regime' in agrupar_por:
+            linha['regime_tributario'] = empresas.get(chave.get('empresa_id'), {}).get('regime_tributario')
+        acumulado = grupos.setdefault(
+            tuple(linha.values()), {**linha, contagem: 0, **dict.fromkeys(CAMPOS_RESUMO, 0)}
+        )
+        acumulado[contagem] += grupo[contagem]
+        for campo in CAMPOS_RESUMO:
+            acumulado[campo] += grupo.get(campo) or 0
+
+    linhas = []
+    for chave in sorted(grupos, key=lambda k: tuple(str(v) for v in k)):
+        linha = grupos[chave]
+        for campo in CAMPOS_RESUMO:
+            linha[campo] = round(linha[campo], 2)
+        linha['total_impostos'] = round(sum(linha[c] for c in CAMPOS_RESUMO if c != 'total_valor'), 2)
+        linhas.append(linha)
+    return linhas
+
+@api_router.get("/relatorios/impostos", response_model=dict)
+async def relatorio_impostos(
+    data_inicio: Optional[datetime] = None,
+    data_fim: Optional[datetime] = None,
+    empresa_id: Optional[List[str]] = Query(None),
+    agrupar_por: str = 'empresa',
+    current_user: dict = Depends(get_current_user)
+):
+    """ICMS/PIS/COFINS/IPI do período agrupados por empresa, mes, categoria e/ou regime.
+
+    `agrupar_por` aceita combinações separadas por vírgula (ex.: empresa,mes)
+    e `empresa_id` pode ser repetido para filtrar várias empresas.
+    """
+    dimensoes = [d.strip() for d in agrupar_por.split(',') if d.strip()]
+    invalidas = [d for d in dimensoes if d not in AGRUPAMENTOS_IMPOSTOS]
+    if invalidas:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Agrupamento inválido: {', '.join(invalidas)}. Use {', '.join(AGRUPAMENTOS_IMPOSTOS)}"
+        )
+    dimensoes = list(dict.fromkeys(dimensoes))
+
+    grupos = await agregar_impostos(current_user['usuario_id'], empresa_id or [], data_inicio, data_fim, dimensoes)
+    contagem = 'total_itens' if 'categoria' in dimensoes else 'total_notas'
+    totais = {contagem: sum(g[contagem] for g in grupos)}
+    for campo in CAMPOS_RESUMO + ['total_impostos']:
+        totais[campo] = round(sum(g[campo] for g in grupos), 2)
+    return resposta_leitura({
+        "data_inicio": data_para_filtro(data_inicio) if data_inicio else None,
+        "data_fim": data_para_filtro(data_fim) if data_fim else None,
+        "agrupar_por": dimensoes,
+        "totais": totais,
+        "grupos": grupos
     })
 
+# ============= EXCLUSÃO EM CASCATA =============
+
+class ExclusaoJob(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    empresa_id: str
+    status: str  # pendente, processando, concluido, erro
+    progresso: int = 0
+    total: int = 0
+    removidos: dict = {}
+    erro: Optional[str] = None
+    criado_em: datetime
+
+# Coleção -> coleção versionada das leituras afetadas. Os resumos saem primeiro para
+# o dashboard deixar de contar a empresa logo no início. `catalogo_versoes` fica:
+# a versão precisa continuar crescendo para invalidar catálogos em outros workers.
+COLECOES_CASCATA = {
+    "resumos": "notas",
+    "produtos": "produtos",
+    "notas_fiscais": "notas",
+    "itens_nf": "notas",
+    "notas_arquivo": "notas",
+}
+
+_exclusoes_locais = {}
+
+async def agendar_exclusao(usuario_id: str, empresa_id: str) -> dict:
+    agora = datetime.now(timezone.utc)
+    job = {
+        "id": str(uuid.uuid4()),
+        "usuario_id": usuario_id,
+        "empresa_id": empresa_id,
+        "status": "pendente",
+        "progresso": 0,
+        "total": 0,
+        "removidos": {colecao: 0 for colecao in COLECOES_CASCATA},
+        "erro": None,
+        "criado_em": agora,
+        "heartbeat": agora,
+    }
+    await db.exclusoes_jobs.insert_one(job)
+    job.pop('_id', None)
+    _iniciar_exclusao(job)
+    return job
+
+def _iniciar_exclusao(job: dict):
+    _exclusoes_locais[job['id']] = asyncio.ensure_future(executar_exclusao(job))
+
+async def executar_exclusao(job: dict):
+    """Remove os dados da empresa em lotes de EXCLUSAO_BATCH_SIZE, registrando o progresso.
+
+    Cada lote é um delete_many por _id, então o job pode ser retomado do ponto
+    em que parou (ver `retomar_exclusoes`) sem repetir trabalho.
+    """
+    job_id, usuario_id, empresa_id = job['id'], job['usuario_id'], job['empresa_id']
+    filtro = {"usuario_id": usuario_id, "empresa_id": empresa_id}
+    removidos = dict(job['removidos'])
+    try:
+        restantes = await asyncio.gather(*(db[c].count_documents(filtro) for c in COLECOES_CASCATA))
+        total = sum(removidos.values()) + sum(restantes)
+        await db.exclusoes_jobs.update_one({"id": job_id}, {"$set": {
+            "status": "processando", "total": total, "heartbeat": datetime.now(timezone.utc)
+        }})
+        for colecao, leitura in COLECOES_CASCATA.items():
+            while True:
+                ids = [d['_id'] for d in await db[colecao].find(filtro, {"_id": 1})
+                       .limit(EXCLUSAO_BATCH_SIZE).to_list(EXCLUSAO_BATCH_SIZE)]
+                if not ids:
+                    break
+                resultado = await db[colecao].delete_many({"_id": {"$in": ids}})
+                removidos[colecao] += resultado.deleted_count
+                if colecao == "produtos":
+                    await invalidar_catalogo(usuario_id, empresa_id)
+                await invalidar_leituras(usuario_id, leitura)
+                await db.exclusoes_jobs.update_one({"id": job_id}, {"$set": {
+                    "removidos": removidos,
+                    "progresso": min(99, int(100 * sum(removidos.values()) / max(total, 1))),
+                    "heartbeat": datetime.now(timezone.utc)
+                }})
+        await db.exclusoes_jobs.update_one({"id": job_id}, {"$set": {"status": "concluido", "progresso": 100}})
+    except Exception as e:
+        logger.exception(f"Falha na exclusão em cascata {job_id}")
+        await db.exclusoes_jobs.update_one({"id": job_id}, {"$set": {"status": "erro", "erro": str(e)}})
+    finally:
+        _exclusoes_locais.pop(job_id, None)
+
+async def retomar_exclusoes() -> int:
+    """Assume jobs sem heartbeat há EXCLUSAO_LEASE_SECONDS (worker reiniciado no meio)"""
+    retomados = 0
+    while True:
+        agora = datetime.now(timezone.utc)
+        job = await db.exclusoes_jobs.find_one_and_update(
+            {"status": {"$in": ["pendente", "processando"]},
+             "heartbeat": {"$lt": agora - timedelta(seconds=EXCLUSAO_LEASE_SECONDS)}},
+            {"$set": {"heartbeat": agora}},
+            projection={"_id": 0}, return_document=ReturnDocument.AFTER
+        )
+        if job is None:
+            return retomados
+        _iniciar_exclusao(job)
+        retomados += 1
+
+async def excluir_orfaos() -> List[dict]:
+    """Agenda a exclusão dos dados de empresas removidas antes da cascata existir"""
+    pares = set()
+    for colecao in ("produtos", "notas_fiscais"):
+        async for grupo in db[colecao].aggregate([
+            {"$group": {"_id": {"usuario_id": "$usuario_id", "empresa_id": "$empresa_id"}}}
+        ]):
+            pares.add((grupo['_id']['usuario_id'], grupo['_id']['empresa_id']))
+    existentes = {
+        e['id'] async for e in db.empresas.find({"id": {"$in": [e for _, e in pares]}}, {"_id": 0, "id": 1})
+    }
+    return [await agendar_exclusao(u, e) for u, e in sorted(pares) if e not in existentes]
+
+@api_router.get("/exclusoes/{exclusao_id}", response_model=ExclusaoJob)
+async def get_exclusao(exclusao_id: str, current_user: dict = Depends(get_current_user)):
+    job = await db.exclusoes_jobs.find_one({"id": exclusao_id, "usuario_id": current_user['usuario_id']}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Exclusão não encontrada")
+    return job
+
+# ============= ARQUIVAMENTO DE NOTAS =============
+
+# As notas arquivadas mantêm o cabeçalho (filtros e paginação iguais aos de
+# notas_fiscais) e guardam os itens como JSON comprimido com zlib em `itens_z`.
+# Para o relatório por categoria, `itens_produto` traz os valores dos itens
+# somados por produto, sem precisar descomprimir nada.
+
+def _itens_por_produto(itens: List[dict]) -> List[dict]:
+    produtos = {}
+    for item in itens:
+        soma = produtos.setdefault(item.get('produto_id'), {
+            'produto_id': item.get('produto_id'), 'qtd_itens': 0, **dict.fromkeys(VALORES_ITEM.values(), 0)
+        })
+        soma['qtd_itens'] += 1
+        for campo in VALORES_ITEM.values():
+            soma[campo] += item.get(campo) or 0
+    return list(produtos.values())
+
+def _nota_para_arquivo(nota: dict, arquivada_em: datetime) -> dict:
+    nota = dict(nota)
+    nota.pop('qtd_itens', None)
+    itens = nota.pop('itens', [])
+    nota['itens_z'] = zlib.compress(orjson.dumps(itens), 6)
+    nota['itens_produto'] = _itens_por_produto(itens)
+    nota['arquivada_em'] = arquivada_em
+    return nota
+
+async def buscar_nota_arquivada(nota_id: str, usuario_id: str) -> Optional[dict]:
+    projecao = {campo: v for campo, v in NOTA_PROJECTION.items() if campo != 'itens'}
+    nota = await db.notas_arquivo.find_one({"id": nota_id, "usuario_id": usuario_id}, {**projecao, "itens_z": 1})
+    return _descomprimir_itens(nota) if nota else None
+
+async def arquivar_notas(dias: int, lote: int = ARQUIVO_BATCH_SIZE, continuar=None) -> dict:
+    """Move notas emitidas há mais de `dias` dias de notas_fiscais para notas_arquivo.
+
+    Cada lote é inserido no arquivo antes de sair de notas_fiscais; se uma
+    execução for interrompida entre os dois passos, a seguinte ignora as
+    duplicatas e conclui a remoção. Os resumos não mudam: as notas continuam
+    do usuário, só deixam o conjunto quente. `continuar`, se dado, é
+    aguardado antes de cada lote; quando devolve False a execução para.
+    """
+    corte = datetime.now(timezone.utc) - timedelta(days=dias)
+    arquivadas, usuarios = 0, set()
+    while continuar is None or await continuar():
+        notas = await db.notas_fiscais.find({"data_emissao": {"$lt": corte}}, {"_id": 0}) \
+            .sort("data_emissao", ASCENDING).limit(lote).to_list(lote)
+        if not notas:
+            break
+        await anexar_itens(notas)
+        agora = datetime.now(timezone.utc)
+        docs = await asyncio.to_thread(lambda: [_nota_para_arquivo(n, agora) for n in notas])
+        try:
+            await db.notas_arquivo.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            if any(erro.get('code') != 11000 for erro in e.details.get('writeErrors', [])):
+                raise
+        ids = [n['id'] for n in notas]
+        await db.notas_fiscais.delete_many({"id": {"$in": ids}})
+        await db.itens_nf.delete_many({"nota_id": {"$in": ids}})
+        arquivadas += len(notas)
+        usuarios.update(n['usuario_id'] for n in notas)
+    for usuario_id in usuarios:
+        await invalidar_leituras(usuario_id, 'notas')
+    return {"corte": corte, "arquivadas": arquivadas}
+
+async def renovar_lease(nome: str, dono: str, duracao: float) -> bool:
+    """Assume ou renova o lease `nome` em tarefas_fundo; False se outro dono o mantém vivo"""
+    agora = datetime.now(timezone.utc)
+    try:
+        await db.tarefas_fundo.update_one(
+            {"_id": nome, "$or": [{"dono": dono}, {"heartbeat": {"$lt": agora - timedelta(seconds=duracao)}}]},
+            {"$set": {"dono": dono, "heartbeat": agora}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # O documento existe e não casou: lease de outro worker ainda válido
+        return False
+    return True
+
+async def executar_arquivamento(dono: str) -> Optional[dict]:
+    """Uma rodada do ciclo: arquiva se este worker tem o lease e o intervalo já passou"""
+    if not await renovar_lease("arquivamento", dono, ARQUIVO_LEASE_SECONDS):
+        return None
+    controle = await db.tarefas_fundo.find_one({"_id": "arquivamento"})
+    proxima = controle.get('proxima_em')
+    if proxima and datetime.now(timezone.utc) < _utc(proxima):
+        return None
+    resultado = await arquivar_notas(
+        NOTAS_ARQUIVO_DIAS, continuar=lambda: renovar_lease("arquivamento", dono, ARQUIVO_LEASE_SECONDS)
+    )
+    await db.tarefas_fundo.update_one({"_id": "arquivamento", "dono": dono}, {"$set": {
+        "proxima_em": datetime.now(timezone.utc) + timedelta(seconds=NOTAS_ARQUIVO_INTERVALO)
+    }})
+    return resultado
+
+async def ciclo_arquivamento():
+    """Roda em todos os workers, mas só o dono do lease "arquivamento" arquiva.
+
+    O dono renova o heartbeat a cada ARQUIVO_LEASE_SECONDS / 3 (e a cada lote
+    arquivado); se ele cair, outro worker assume depois de
+    ARQUIVO_LEASE_SECONDS. O intervalo entre execuções fica no documento do
+    lease, então vale para o conjunto dos workers.
+    """
+    dono = str(uuid.uuid4())
+    while True:
+        try:
+            resultado = await executar_arquivamento(dono)
+            if resultado and resultado['arquivadas']:
+                logger.info(f"{resultado['arquivadas']} notas arquivadas (emitidas antes de {resultado['corte']})")
+        except Exception:
+            logger.exception("Falha no arquivamento de notas")
+        await asyncio.sleep(ARQUIVO_LEASE_SECONDS / 3)
+
+# ============= MIGRAÇÕES =============
+
+# Campos que versões anteriores gravavam como texto ISO 8601
+CAMPOS_DATA = {
+    "usuarios": ["created_at"],
+    "empresas": ["created_at"],
+    "produtos": ["created_at"],
+    "notas_fiscais": ["data_emissao", "created_at"],
+}
+# Coleção migrada -> versão em dados_versoes das leituras que expõem essas datas
+VERSOES_DATA = {"empresas": "empresas", "produtos": "produtos", "notas_fiscais": "notas"}
+
+async def migrar_datas(lote: int = 1000, pausa: float = 0.0) -> dict:
+    """Converte datas gravadas como texto em datas BSON nativas.
+
+    Cada coleção é percorrida em ordem de _id, em lotes de `lote` documentos,
+    e o último _id processado fica em `migracoes`: uma execução interrompida
+    continua de onde parou. Só documentos com datas em texto são alterados,
+    então a migração pode rodar com a aplicação no ar; `pausa` (segundos)
+    alivia a carga entre lotes. A cada lote a versão dos usuários afetados
+    sobe, para ETags e respostas em cache não continuarem servindo o texto.
+    """
+    relatorio = {}
+    for colecao, campos in CAMPOS_DATA.items():
+        controle_id = f"datas_bson:{colecao}"
+        controle = await db.migracoes.find_one({"_id": controle_id}) or {}
+        ultimo_id = controle.get('ultimo_id')
+        convertidos = controle.get('convertidos', 0)
+        invalidos = controle.get('invalidos', 0)
+        com_texto = {"$or": [{campo: {"$type": "string"}} for campo in campos]}
+        
+        while True:
+            query = com_texto if ultimo_id is None else {"$and": [{"_id": {"$gt": ultimo_id}}, com_texto]}
+            docs = await db[colecao].find(query, {"usuario_id": 1, **{campo: 1 for campo in campos}}) \
+                .sort("_id", ASCENDING).limit(lote).to_list(lote)
+            if not docs:
+                break
+            operacoes, usuarios = [], set()
+            for doc in docs:
+                novos = {}
+                for campo in campos:
+                    if isinstance(doc.get(campo), str):
+                        try:
+                            novos[campo] = data_para_filtro(datetime.fromisoformat(doc[campo]))
+                        except ValueError:
+                            logger.warning(f"{colecao} {doc['_id']}: {campo} inválido ({doc[campo]!r})")
+                            invalidos += 1
+                if novos:
+                    operacoes.append(UpdateOne({"_id": doc['_id']}, {"$set": novos}))
+                    usuarios.add(doc.get('usuario_id'))
+            if operacoes:
+                await db[colecao].bulk_write(operacoes, ordered=False)
+                if colecao in VERSOES_DATA:
+                    await invalidar_leituras_usuarios(usuarios - {None}, VERSOES_DATA[colecao])
+            ultimo_id = docs[-1]['_id']
+            convertidos += len(operacoes)
+            await db.migracoes.update_one({"_id": controle_id}, {"$set": {
+                "ultimo_id": ultimo_id,
+                "convertidos": convertidos,
+                "invalidos": invalidos,
+                "atualizado_em": datetime.now(timezone.utc)
+            }}, upsert=True)
+            if pausa:
+                await asyncio.sleep(pausa)
+        
+        # Concluída: uma nova execução volta a varrer a coleção desde o início
+        await db.migracoes.delete_one({"_id": controle_id})
+        relatorio[colecao] = {"convertidos": convertidos, "invalidos": invalidos}
+    return relatorio
+
+async def migrar_itens(lote: int = 1000, pausa: float = 0.0) -> dict:
+    """Move os itens embutidos em notas_fiscais para itens_nf.
+
+    Cada lote grava as linhas em itens_nf (duplicatas de uma execução
+    interrompida são ignoradas pelo índice único (nota_id, seq)) e só depois
+    remove `itens` do cabeçalho, então a migração é retomável e pode rodar
+    com a aplicação no ar. A versão de notas dos usuários do lote sobe, o
+    que invalida GETs em cache e as chaves dos jobs de relatório.
+    """
+    migradas = linhas = 0
+    ultimo_id = None
+    while True:
+        query = {"itens": {"$exists": True}}
+        if ultimo_id is not None:
+            query["_id"] = {"$gt": ultimo_id}
+        notas = await db.notas_fiscais.find(
+            query, {"_id": 1, "id": 1, "usuario_id": 1, "empresa_id": 1, "data_emissao": 1, "itens": 1}
+        ).sort("_id", ASCENDING).limit(lote).to_list(lote)
+        if not notas:
+            break
+        novas = separar_itens(notas)
+        if novas:
+            try:
+                await db.itens_nf.insert_many(novas, ordered=False)
+            except BulkWriteError as e:
+                if any(erro.get('code') != 11000 for erro in e.details.get('writeErrors', [])):
+                    raise
+        await db.notas_fiscais.bulk_write([
+            UpdateOne({"_id": n['_id']}, {"$unset": {"itens": ""}, "$set": {"qtd_itens": n['qtd_itens']}})
+            for n in notas
+        ], ordered=False)
+        await invalidar_leituras_usuarios([n['usuario_id'] for n in notas], 'notas')
+        ultimo_id = notas[-1]['_id']
+        migradas += len(notas)
+        linhas += len(novas)
+        if pausa:
+            await asyncio.sleep(pausa)
+    return {"notas": migradas, "itens": linhas}
+
+# ============= INDEXES =============
+
+# Declared indexes per collection; reconciled against the database on startup
+INDEXES = {
+    "usuarios": [
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+    ],
+    "empresas": [
+        IndexModel([("usuario_id", ASCENDING), ("cnpj", ASCENDING)], unique=True, name="usuario_cnpj_unique"),
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("usuario_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)], name="usuario_criacao"),
+    ],
+    "produtos": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel(
+            [("usuario_id", ASCENDING), ("empresa_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)],
+            name="usuario_empresa"
+        ),
+        IndexModel([("usuario_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)], name="usuario_criacao"),
+        IndexModel([("usuario_id", ASCENDING), ("codigo", ASCENDING)], name="usuario_codigo"),
+        # Chave do upsert da importação; duplicatas antigas: ver produtos_duplicados()
+        IndexModel([("empresa_id", ASCENDING), ("codigo", ASCENDING)], unique=True, name="empresa_codigo_unique"),
+    ],
+    "notas_fiscais": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel(
+            [("usuario_id", ASCENDING), ("empresa_id", ASCENDING), ("data_emissao", DESCENDING), ("id", DESCENDING)],
+            name="usuario_empresa_data"
+        ),
+        IndexModel([("usuario_id", ASCENDING), ("data_emissao", DESCENDING), ("id", DESCENDING)], name="usuario_data"),
+        IndexModel([("usuario_id", ASCENDING), ("numero_nf", ASCENDING)], name="usuario_numero"),
+        IndexModel([("usuario_id", ASCENDING), ("created_at", ASCENDING)], name="usuario_criacao"),
+        IndexModel([("data_emissao", ASCENDING)], name="data_emissao"),  # varredura do arquivamento
+        IndexModel(
+            [("usuario_id", ASCENDING), ("empresa_id", ASCENDING), ("chave_idempotencia", ASCENDING)],
+            unique=True, name="usuario_empresa_idempotencia_unique",
+            partialFilterExpression={"chave_idempotencia": {"$exists": True}}
+        ),
+    ],
+    "relatorios_jobs": [
+        IndexModel([("chave", ASCENDING)], unique=True, name="chave_unique"),
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("expira_em", ASCENDING)], expireAfterSeconds=0, name="expira_em_ttl"),
+    ],
+    "itens_nf": [
+        IndexModel([("nota_id", ASCENDING), ("seq", ASCENDING)], unique=True, name="nota_seq_unique"),
+        IndexModel(
+            [("usuario_id", ASCENDING), ("empresa_id", ASCENDING), ("data_emissao", DESCENDING)],
+            name="usuario_empresa_data"
+        ),
+        IndexModel([("usuario_id", ASCENDING), ("data_emissao", DESCENDING)], name="usuario_data"),
+    ],
+    "notas_arquivo": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel(
+            [("usuario_id", ASCENDING), ("empresa_id", ASCENDING), ("data_emissao", DESCENDING), ("id", DESCENDING)],
+            name="usuario_empresa_data"
+        ),
+        IndexModel([("usuario_id", ASCENDING), ("data_emissao", DESCENDING), ("id", DESCENDING)], name="usuario_data"),
+    ],
+    "exclusoes_jobs": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("status", ASCENDING), ("heartbeat", ASCENDING)], name="status_heartbeat"),
+    ],
+    "dados_versoes": [
+        IndexModel([("usuario_id", ASCENDING)], unique=True, name="usuario_unique"),
+    ],
+    "catalogo_versoes": [
+        IndexModel([("usuario_id", ASCENDING), ("empresa_id", ASCENDING)], unique=True, name="usuario_empresa_unique"),
+    ],
+    "resumos": [
+        IndexModel(
+            [("usuario_id", ASCENDING), ("empresa_id", ASCENDING), ("mes", ASCENDING)],
+            unique=True, name="usuario_empresa_mes_unique"
+        ),
+    ],
+}
+
+def _mesma_definicao(existente: dict, declarado: dict) -> bool:
+    """Compara chaves e opções que mudam o comportamento do índice (unicidade, filtro parcial, TTL)"""
+    def ttl(indice):
+        return None if indice.get('expireAfterSeconds') is None else int(indice['expireAfterSeconds'])
+    return (
+        [(k, int(v)) for k, v in existente['key']] == [(k, int(v)) for k, v in declarado['key'].items()]
+        and bool(existente.get('unique')) == bool(declarado.get('unique'))
+        and bool(existente.get('sparse')) == bool(declarado.get('sparse'))
+        and existente.get('partialFilterExpression') == declarado.get('partialFilterExpression')
+        and ttl(existente) == ttl(declarado)
+    )
+
+async def reconciliar_indices(database=None) -> dict:
+    """Cria índices ausentes e recria os que divergem da declaração.
+
+    Índices não declarados são apenas reportados, nunca removidos. Falhas
+    (ex.: duplicatas impedindo um índice único) são registradas no log e
+    devolvidas no relatório sem interromper a inicialização.
+    """
+    database = db if database is None else database
+    relatorio = {}
+    for colecao, modelos in INDEXES.items():
+        existentes = await database[colecao].index_information()
+        criados, recriados, erros = [], [], []
+        for modelo in modelos:
+            declarado = modelo.document
+            nome = declarado['name']
+            try:
+                if nome in existentes:
+                    if _mesma_definicao(existentes[nome], declarado):
+                        continue
+                    await database[colecao].drop_index(nome)
+                    await database[colecao].create_indexes([modelo])
+                    recriados.append(nome)
+                else:
+                    await database[colecao].create_indexes([modelo])
+                    criados.append(nome)
+            except OperationFailure as e:
+                logger.error(f"Falha ao criar índice {colecao}.{nome}: {e}")
+                erros.append({"indice": nome, "erro": str(e)})
+        relatorio[colecao] = {"criados": criados, "recriados": recriados, "erros": erros}
+    return relatorio
+
+async def relatorio_indices(database=None) -> dict:
+    """Reporta uso ($indexStats), índices declarados ausentes e não declarados"""
+    database = db if database is None else database
+    relatorio = {}
+    for colecao, modelos in INDEXES.items():
+        declarados = {m.document['name'] for m in modelos}
+        existentes = await database[colecao].index_information()
+        uso = {}
+        try:
+            async for stat in database[colecao].aggregate([{"$indexStats": {}}]):
+                uso[stat['name']] = {
+                    "acessos": stat['accesses']['ops'],
+                    "desde": stat['accesses']['since'].isoformat()
+                }
+        except OperationFailure as e:
+            logger.warning(f"$indexStats indisponível para {colecao}: {e}")
+        relatorio[colecao] = {
+            "uso": uso,
+            "ausentes": sorted(declarados - set(existentes)),
+            "nao_declarados": sorted(set(existentes) - declarados - {"_id_"})
+        }
+    return relatorio
+
+async def produtos_duplicados(database=None) -> List[dict]:
+    """Produtos que repetem (empresa_id, codigo) e impedem o índice empresa_codigo_unique.
+
+    Só reporta: as notas guardam o produto_id, então escolher qual cadastro
+    manter (e remover os demais) fica a cargo do usuário.
+    """
+    database = db if database is None else database
+    pipeline = [
+        {"$sort": {"created_at": ASCENDING}},
+        {"$group": {
+            "_id": {"empresa_id": "$empresa_id", "codigo": "$codigo"},
+            "usuario_id": {"$first": "$usuario_id"},
+            "produto_ids": {"$push": "$id"},
+            "quantidade": {"$sum": 1}
+        }},
+        {"$match": {"quantidade": {"$gt": 1}}},
+        {"$sort": {"_id.empresa_id": ASCENDING, "_id.codigo": ASCENDING}}
+    ]
+    return [
+        {**grupo.pop('_id'), **grupo}
+        async for grupo in database.produtos.aggregate(pipeline, allowDiskUse=True)
+    ]
+
+# ============= ROUTES - ADMIN =============
+
+@api_router.get("/admin/indices", response_model=dict)
+async def get_indices(current_user: dict = Depends(get_admin_user)):
+    return await relatorio_indices()
+
+@api_router.post("/admin/indices/reconciliar", response_model=dict)
+async def post_reconciliar_indices(current_user: dict = Depends(get_admin_user)):
+    return await reconciliar_indices()
+
+@api_router.get("/admin/produtos/duplicados", response_model=List[dict])
+async def get_produtos_duplicados(current_user: dict = Depends(get_admin_user)):
+    return await produtos_duplicados()
+
+@api_router.post("/admin/resumos/reconciliar", response_model=dict)
+async def post_reconciliar_resumos(
+    usuario_id: Optional[str] = None,
+    corrigir: bool = False,
+    current_user: dict = Depends(get_admin_user)
+):
+    return await reconciliar_resumos(usuario_id, corrigir)
+
+@api_router.post("/admin/notas/arquivar", response_model=dict)
+async def post_arquivar_notas(dias: int = Query(..., ge=1), current_user: dict = Depends(get_admin_user)):
+    return await arquivar_notas(dias)
+
+@api_router.post("/admin/exclusoes/orfaos", response_model=dict)
+async def post_excluir_orfaos(current_user: dict = Depends(get_admin_user)):
+    jobs = await excluir_orfaos()
+    return {"agendadas": len(jobs), "exclusoes": [{"id": j['id'], "empresa_id": j['empresa_id']} for j in jobs]}
+
+# ============= ROUTES - METRICS =============
+
+def _profundidade_executores():
+    filas = [({"executor": "bcrypt"}, _hash_executor._work_queue.qsize() if _hash_executor is not None else 0)]
+    for nome, pool in (("nfe_import", _nfe_pool), ("relatorios", _relatorio_pool)):
+        filas.append(({"executor": nome}, len(pool._pending_work_items) if pool is not None else 0))
+    return filas
+
+registrar_metrica(Medidor(
+    'executor_queue_depth', 'Tarefas aguardando ou em execução em cada executor', _profundidade_executores
+))
+
+registrar_metrica(Medidor(
+    'worker_info', 'Processo que respondeu o scrape', lambda: [({"pid": os.getpid()}, 1)]
+))
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Métricas deste processo. Com vários workers (servidor.py) cada um tem
+    seus próprios registros e um scrape vê só o worker que o atendeu:
+    agregue no Prometheus por `worker_info`/instância, não some scrapes."""
+    return Response(exportar_metricas(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # ============= MIDDLEWARE & STARTUP =============
 
 app.include_router(api_router)
@@ -634,18 +4047,57 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "X-Next-Cursor"],
 )
 
+app.add_middleware(MetricasMiddleware)
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+_tarefas_fundo = []
+
+async def startup_metrics():
+    _tarefas_fundo.append(asyncio.create_task(monitorar_event_loop()))
+
+async def startup_indexes():
+    await reconciliar_indices()
+    # First run after the rollups were introduced: backfill them from existing notas
+    if not await db.resumos.find_one({}) and await db.notas_fiscais.find_one({}, {"_id": 1}):
+        logger.info("Coleção resumos vazia; reconstruindo a partir de notas_fiscais")
+        await reconciliar_resumos(corrigir=True)
+
+async def startup_tarefas():
+    await retomar_exclusoes()
+    if NOTAS_ARQUIVO_DIAS > 0:
+        _tarefas_fundo.append(asyncio.create_task(ciclo_arquivamento()))
+
+async def startup():
+    """Roda no lifespan de cada worker, depois do fork no modo multi-worker (servidor.py)"""
+    conectar_mongo()
+    await startup_metrics()
+    await startup_indexes()
+    await startup_tarefas()
+
+async def shutdown():
+    """Desfaz o que startup() e o uso criaram; um novo lifespan no mesmo processo recria tudo"""
+    global client, db, _hash_executor, _nfe_pool, _relatorio_pool
+    for tarefa in _tarefas_fundo:
+        tarefa.cancel()
+    _tarefas_fundo.clear()
+    if client is not None:
+        client.close()
+    client = db = None
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=False)
+    for pool in (_nfe_pool, _relatorio_pool):
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+    _hash_executor = _nfe_pool = _relatorio_pool = None
 
 @api_router.get("/")
 async def root():
-    return {"message": "FiscalManager Total API - v1.0"}
\ No newline at end of file
+    return {"message": "FiscalManager Total API - v1.0"}
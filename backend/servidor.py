@@ -0,0 +1,82 @@
+"""Processo principal do modo multi-worker: pré-carrega o app e cria os workers por fork.
+
+Uso:
+    python manage.py servir [--host 0.0.0.0] [--port 8001] [--workers 4]
+
+Fica fora de server.py para que o app nunca seja o processo que faz fork:
+este módulo só importa server.py (sem conexões, pools ou threads, que nascem
+no lifespan de cada worker), abre o socket e cria os workers. Métricas
+(/metrics) são por worker; ver `server.metrics`.
+"""
+import logging
+import os
+import signal
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def servir(host: str, port: int, workers: int = 1):
+    """Sobe a API com uvicorn em `workers` processos criados por fork deste.
+
+    O app já está importado aqui e o socket é aberto uma vez; cada worker
+    herda os dois sem reimportar server.py, ao contrário do `--workers` do
+    uvicorn. Este processo só repõe workers que morrem e repassa
+    SIGINT/SIGTERM.
+    """
+    import uvicorn
+    from server import app
+
+    config = uvicorn.Config(app, host=host, port=port, lifespan='on')
+    sock = config.bind_socket()
+    if workers <= 1:
+        uvicorn.Server(config).run(sockets=[sock])
+        return
+    if threading.active_count() > 1:
+        # fork copia só a thread atual; locks de outras threads ficariam presos nos workers
+        raise RuntimeError(f"{threading.active_count()} threads ativas antes do fork; nada deve iniciar threads no import")
+
+    def iniciar_worker() -> int:
+        pid = os.fork()
+        if pid == 0:
+            # O handler do processo principal não vale no worker; o uvicorn instala os seus
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            codigo = 1
+            try:
+                uvicorn.Server(config).run(sockets=[sock])
+                codigo = 0
+            finally:
+                os._exit(codigo)
+        return pid
+
+    filhos = {iniciar_worker(): time.monotonic() for _ in range(workers)}
+    encerrando = False
+
+    def encerrar(signum, frame):
+        nonlocal encerrando
+        encerrando = True
+        for pid in filhos:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, encerrar)
+    signal.signal(signal.SIGTERM, encerrar)
+    logger.info(f"Servindo em {host}:{port} com {workers} workers (pid {os.getpid()})")
+    while filhos:
+        try:
+            pid, estado = os.wait()
+        except ChildProcessError:
+            break
+        iniciado = filhos.pop(pid, None)
+        if iniciado is None or encerrando:
+            continue
+        logger.warning(f"Worker {pid} terminou (estado {estado}); iniciando outro")
+        # Evita laço de reinício quando o worker falha logo no startup (ex.: MongoDB fora do ar)
+        if time.monotonic() - iniciado < 5:
+            time.sleep(1)
+        filhos[iniciar_worker()] = time.monotonic()
+    sock.close()
@@ -0,0 +1,26 @@
+import axios from 'axios';
+
+export const PAGE_SIZE = 100;
+
+// A API pagina por cursor: X-Next-Cursor aponta a próxima página (ausente na
+// última) e X-Total-Count traz o total do filtro.
+export async function buscarPagina(url, { cursor, limit = PAGE_SIZE, ...params } = {}) {
+  const response = await axios.get(url, { params: { ...params, limit, ...(cursor ? { cursor } : {}) } });
+  return {
+    itens: response.data,
+    proximoCursor: response.headers['x-next-cursor'] || null,
+    total: Number(response.headers['x-total-count'] ?? response.data.length)
+  };
+}
+
+// Segue o cursor até a última página; para listas de seleção que precisam de todos os registros
+export async function buscarTodas(url, params = {}) {
+  const itens = [];
+  let cursor = null;
+  do {
+    const pagina = await buscarPagina(url, { ...params, limit: 1000, cursor });
+    itens.push(...pagina.itens);
+    cursor = pagina.proximoCursor;
+  } while (cursor);
+  return itens;
+}
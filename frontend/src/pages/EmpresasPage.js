@@ -9,10 +9,14 @@ import { Dialog, DialogContent, DialogDescription, DialogHeader, DialogTitle, Di
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@/components/ui/select';
 import { Building2, Plus, Edit, Trash2, MapPin } from 'lucide-react';
 import { toast } from 'sonner';
+import { buscarPagina } from '@/lib/paginacao';
 
 const EmpresasPage = () => {
   const [empresas, setEmpresas] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [proximoCursor, setProximoCursor] = useState(null);
+  const [total, setTotal] = useState(0);
+  const [carregandoMais, setCarregandoMais] = useState(false);
   const [dialogOpen, setDialogOpen] = useState(false);
   const [editingEmpresa, setEditingEmpresa] = useState(null);
   const [formData, setFormData] = useState({
@@ -33,8 +37,10 @@ const EmpresasPage = () => {
 
   const fetchEmpresas = async () => {
     try {
-      const response = await axios.get('/empresas');
-      setEmpresas(response.data);
+      const pagina = await buscarPagina('/empresas');
+      setEmpresas(pagina.itens);
+      setProximoCursor(pagina.proximoCursor);
+      setTotal(pagina.total);
     } catch (error) {
       toast.error('Erro ao carregar empresas');
     } finally {
@@ -42,6 +48,20 @@ const EmpresasPage = () => {
     }
   };
 
+  const carregarMais = async () => {
+    setCarregandoMais(true);
+    try {
+      const pagina = await buscarPagina('/empresas', { cursor: proximoCursor });
+      setEmpresas(atuais => [...atuais, ...pagina.itens]);
+      setProximoCursor(pagina.proximoCursor);
+      setTotal(pagina.total);
+    } catch (error) {
+      toast.error('Erro ao carregar empresas');
+    } finally {
+      setCarregandoMais(false);
+    }
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     
@@ -338,6 +358,15 @@ const EmpresasPage = () => {
             ))}
           </div>
         )}
+
+        {proximoCursor && (
+          <div className="flex flex-col items-center gap-2 pt-6">
+            <p className="text-sm text-slate-500">Exibindo {empresas.length} de {total}</p>
+            <Button variant="outline" onClick={carregarMais} disabled={carregandoMais} data-testid="empresas-load-more-btn">
+              {carregandoMais ? 'Carregando...' : 'Carregar mais'}
+            </Button>
+          </div>
+        )}
       </div>
     </Layout>
   );
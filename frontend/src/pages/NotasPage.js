@@ -9,12 +9,16 @@ import { Dialog, DialogContent, DialogDescription, DialogHeader, DialogTitle, Di
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@/components/ui/select';
 import { FileText, Plus, Trash2, Eye, Calculator } from 'lucide-react';
 import { toast } from 'sonner';
+import { buscarPagina, buscarTodas } from '@/lib/paginacao';
 
 const NotasPage = () => {
   const [notas, setNotas] = useState([]);
   const [empresas, setEmpresas] = useState([]);
   const [produtos, setProdutos] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [proximoCursor, setProximoCursor] = useState(null);
+  const [total, setTotal] = useState(0);
+  const [carregandoMais, setCarregandoMais] = useState(false);
   const [dialogOpen, setDialogOpen] = useState(false);
   const [detailDialogOpen, setDetailDialogOpen] = useState(false);
   const [selectedNota, setSelectedNota] = useState(null);
@@ -30,14 +34,16 @@ const NotasPage = () => {
 
   const fetchData = async () => {
     try {
-      const [notasRes, empresasRes, produtosRes] = await Promise.all([
-        axios.get('/notas'),
-        axios.get('/empresas'),
-        axios.get('/produtos')
+      const [pagina, todasEmpresas, todosProdutos] = await Promise.all([
+        buscarPagina('/notas'),
+        buscarTodas('/empresas'),
+        buscarTodas('/produtos')
       ]);
-      setNotas(notasRes.data);
-      setEmpresas(empresasRes.data);
-      setProdutos(produtosRes.data);
+      setNotas(pagina.itens);
+      setProximoCursor(pagina.proximoCursor);
+      setTotal(pagina.total);
+      setEmpresas(todasEmpresas);
+      setProdutos(todosProdutos);
     } catch (error) {
       toast.error('Erro ao carregar dados');
     } finally {
@@ -45,6 +51,20 @@ const NotasPage = () => {
     }
   };
 
+  const carregarMais = async () => {
+    setCarregandoMais(true);
+    try {
+      const pagina = await buscarPagina('/notas', { cursor: proximoCursor });
+      setNotas(atuais => [...atuais, ...pagina.itens]);
+      setProximoCursor(pagina.proximoCursor);
+      setTotal(pagina.total);
+    } catch (error) {
+      toast.error('Erro ao carregar notas fiscais');
+    } finally {
+      setCarregandoMais(false);
+    }
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     
@@ -116,9 +136,14 @@ const NotasPage = () => {
     return produto ? produto.nome : 'N/A';
   };
 
-  const viewDetails = (nota) => {
-    setSelectedNota(nota);
-    setDetailDialogOpen(true);
+  const viewDetails = async (nota) => {
+    try {
+      const response = await axios.get(`/notas/${nota.id}`);
+      setSelectedNota(response.data);
+      setDetailDialogOpen(true);
+    } catch (error) {
+      toast.error('Erro ao carregar nota fiscal');
+    }
   };
 
   if (loading) {
@@ -357,6 +382,15 @@ const NotasPage = () => {
             ))}
           </div>
         )}
+
+        {proximoCursor && (
+          <div className="flex flex-col items-center gap-2 pt-6">
+            <p className="text-sm text-slate-500">Exibindo {notas.length} de {total}</p>
+            <Button variant="outline" onClick={carregarMais} disabled={carregandoMais} data-testid="notas-load-more-btn">
+              {carregandoMais ? 'Carregando...' : 'Carregar mais'}
+            </Button>
+          </div>
+        )}
       </div>
 
       {/* Detail Dialog */}
@@ -9,11 +9,15 @@ import { Dialog, DialogContent, DialogDescription, DialogHeader, DialogTitle, Di
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@/components/ui/select';
 import { Package, Plus, Edit, Trash2, DollarSign, Percent } from 'lucide-react';
 import { toast } from 'sonner';
+import { buscarPagina, buscarTodas } from '@/lib/paginacao';
 
 const ProdutosPage = () => {
   const [produtos, setProdutos] = useState([]);
   const [empresas, setEmpresas] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [proximoCursor, setProximoCursor] = useState(null);
+  const [total, setTotal] = useState(0);
+  const [carregandoMais, setCarregandoMais] = useState(false);
   const [dialogOpen, setDialogOpen] = useState(false);
   const [editingProduto, setEditingProduto] = useState(null);
   const [formData, setFormData] = useState({
@@ -34,12 +38,14 @@ const ProdutosPage = () => {
 
   const fetchData = async () => {
     try {
-      const [produtosRes, empresasRes] = await Promise.all([
-        axios.get('/produtos'),
-        axios.get('/empresas')
+      const [pagina, todasEmpresas] = await Promise.all([
+        buscarPagina('/produtos'),
+        buscarTodas('/empresas')
       ]);
-      setProdutos(produtosRes.data);
-      setEmpresas(empresasRes.data);
+      setProdutos(pagina.itens);
+      setProximoCursor(pagina.proximoCursor);
+      setTotal(pagina.total);
+      setEmpresas(todasEmpresas);
     } catch (error) {
       toast.error('Erro ao carregar dados');
     } finally {
@@ -47,6 +53,20 @@ const ProdutosPage = () => {
     }
   };
 
+  const carregarMais = async () => {
+    setCarregandoMais(true);
+    try {
+      const pagina = await buscarPagina('/produtos', { cursor: proximoCursor });
+      setProdutos(atuais => [...atuais, ...pagina.itens]);
+      setProximoCursor(pagina.proximoCursor);
+      setTotal(pagina.total);
+    } catch (error) {
+      toast.error('Erro ao carregar produtos');
+    } finally {
+      setCarregandoMais(false);
+    }
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     
@@ -383,6 +403,15 @@ const ProdutosPage = () => {
             ))}
           </div>
         )}
+
+        {proximoCursor && (
+          <div className="flex flex-col items-center gap-2 pt-6">
+            <p className="text-sm text-slate-500">Exibindo {produtos.length} de {total}</p>
+            <Button variant="outline" onClick={carregarMais} disabled={carregandoMais} data-testid="produtos-load-more-btn">
+              {carregandoMais ? 'Carregando...' : 'Carregar mais'}
+            </Button>
+          </div>
+        )}
       </div>
     </Layout>
   );
@@ -0,0 +1,73 @@
+"""Atalhos para montar dados pela API nos testes"""
+import uuid
+
+XML_NFE = """<?xml version="1.0" encoding="UTF-8"?>
+<nfeProc xmlns="http://www.portalfiscal.inf.br/nfe" versao="4.00">
+  <NFe><infNFe Id="NFe35240112345678000199550010000{numero:05d}1000000010" versao="4.00">
+    <ide><nNF>{numero}</nNF><dhEmi>{data}</dhEmi></ide>
+    <emit><CNPJ>99.999.999/0001-99</CNPJ></emit>
+    <dest><CNPJ>{cnpj}</CNPJ></dest>
+    <det nItem="1">
+      <prod><cProd>{codigo}</cProd><xProd>Produto</xProd><qCom>2</qCom><vUnCom>10.00</vUnCom><vProd>20.00</vProd></prod>
+      <imposto>
+        <ICMS><ICMS00><vICMS>3.60</vICMS></ICMS00></ICMS>
+        <PIS><PISAliq><vPIS>0.33</vPIS></PISAliq></PIS>
+        <COFINS><COFINSAliq><vCOFINS>1.52</vCOFINS></COFINSAliq></COFINS>
+      </imposto>
+    </det>
+    <total><ICMSTot><vNF>20.00</vNF><vICMS>3.60</vICMS><vPIS>0.33</vPIS><vCOFINS>1.52</vCOFINS><vIPI>0</vIPI></ICMSTot></total>
+  </infNFe></NFe>
+</nfeProc>
+"""
+
+
+def xml_nfe(numero, cnpj: str, codigo: str = 'P1', data: str = '2024-03-15T10:00:00-03:00') -> bytes:
+    """NF-e de um item (2 x 10,00) para `cnpj`, com ICMS 3,60, PIS 0,33 e COFINS 1,52"""
+    return XML_NFE.format(numero=numero, cnpj=cnpj, codigo=codigo, data=data).encode()
+
+
+def registrar(api, email: str = None) -> dict:
+    """Cria um usuário e devolve os headers de autenticação"""
+    email = email or f"{uuid.uuid4().hex[:12]}@teste.example.com"
+    resposta = api.post('/api/auth/register', json={'nome': 'Teste', 'email': email, 'senha': 'senha-teste'})
+    assert resposta.status_code == 200, resposta.text
+    return {'Authorization': f"Bearer {resposta.json()['token']}"}
+
+
+def criar_empresa(api, headers: dict, **campos) -> dict:
+    dados = {
+        'nome': 'Empresa Teste', 'cnpj': f"{uuid.uuid4().int % 10 ** 14:014d}", 'rua': 'Rua A', 'numero': '1',
+        'bairro': 'Centro', 'cidade': 'São Paulo', 'estado': 'SP', 'cep': '01000-000',
+        'regime_tributario': 'Lucro Presumido', **campos
+    }
+    resposta = api.post('/api/empresas', headers=headers, json=dados)
+    assert resposta.status_code == 200, resposta.text
+    return resposta.json()
+
+
+def criar_produto(api, headers: dict, empresa_id: str, **campos) -> dict:
+    dados = {
+        'empresa_id': empresa_id, 'nome': 'Produto', 'codigo': uuid.uuid4().hex[:8], 'categoria': 'geral',
+        'valor_unitario': 10.0, **campos
+    }
+    resposta = api.post('/api/produtos', headers=headers, json=dados)
+    assert resposta.status_code == 200, resposta.text
+    return resposta.json()
+
+
+def criar_nota(api, headers: dict, empresa_id: str, itens: list, numero_nf: str = None) -> dict:
+    """Emite uma nota; `itens` é uma lista de (produto_id, quantidade)"""
+    dados = {
+        'empresa_id': empresa_id, 'numero_nf': numero_nf or uuid.uuid4().hex[:8],
+        'itens': [{'produto_id': produto_id, 'quantidade': quantidade} for produto_id, quantidade in itens]
+    }
+    resposta = api.post('/api/notas', headers=headers, json=dados)
+    assert resposta.status_code == 200, resposta.text
+    return resposta.json()
+
+
+def importar_xmls(api, headers: dict, *xmls: bytes) -> dict:
+    arquivos = [('arquivos', (f'{i}.xml', xml, 'application/xml')) for i, xml in enumerate(xmls)]
+    resposta = api.post('/api/notas/importar', headers=headers, files=arquivos)
+    assert resposta.status_code == 200, resposta.text
+    return resposta.json()
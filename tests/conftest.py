@@ -0,0 +1,56 @@
+"""Fixtures da API sobre mongomock-motor.
+
+Cada teste sobe o app real (lifespan incluso) contra um banco em memória
+novo. Relatórios e importação de NF-e rodam em threads em vez dos pools de
+processos, que não enxergariam o banco em memória.
+"""
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'fiscalmanager_test')
+os.environ.setdefault('BCRYPT_ROUNDS', '4')
+
+mongomock = pytest.importorskip('mongomock')
+mongomock_motor = pytest.importorskip('mongomock_motor')
+from fastapi.testclient import TestClient  # noqa: E402
+
+import server  # noqa: E402
+from tests.apoio import registrar  # noqa: E402
+
+NOME_BANCO = 'teste'
+
+
+@pytest.fixture
+def banco():
+    """Banco pymongo (mongomock) compartilhado com o cliente assíncrono do app"""
+    return mongomock.MongoClient(tz_aware=True)[NOME_BANCO]
+
+
+@pytest.fixture
+def api(banco, monkeypatch, tmp_path):
+    server.client = mongomock_motor.AsyncMongoMockClient(mock_mongo_client=banco.client)
+    server.db = server.client[NOME_BANCO]
+    pool = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(server, 'get_relatorio_pool', lambda: pool)
+    monkeypatch.setattr(server, 'get_nfe_pool', lambda: pool)
+    monkeypatch.setattr(server, '_worker_db', lambda: banco)
+    monkeypatch.setattr(server, 'RELATORIOS_DIR', tmp_path / 'relatorios')
+    with TestClient(server.app) as cliente:
+        # mongomock ignora partialFilterExpression e aplicaria a unicidade a todos os documentos
+        for colecao, indices in server.INDEXES.items():
+            for indice in indices:
+                if 'partialFilterExpression' in indice.document:
+                    banco[colecao].drop_index(indice.document['name'])
+        yield cliente
+    pool.shutdown(wait=True)
+
+
+@pytest.fixture
+def usuario(api):
+    return registrar(api)
@@ -0,0 +1,83 @@
+from datetime import datetime, timezone
+
+import server
+from tests.apoio import criar_empresa, criar_produto, importar_xmls, xml_nfe
+
+DATAS = ['2024-01-15T10:00:00Z', '2024-02-10T10:00:00Z', '2024-03-05T10:00:00Z']
+
+
+def _impostos(api, usuario, **params) -> dict:
+    resposta = api.get('/api/relatorios/impostos', headers=usuario, params=params)
+    assert resposta.status_code == 200, resposta.text
+    return resposta.json()
+
+
+def _relatorios(api, usuario, banco, usuario_id) -> list:
+    periodo = server.RelatorioParametros(
+        data_inicio=datetime(2024, 1, 10, tzinfo=timezone.utc), data_fim=datetime(2024, 3, 10, tzinfo=timezone.utc)
+    )
+    return [
+        _impostos(api, usuario, data_inicio='2024-01-10T00:00:00Z', data_fim='2024-03-10T23:59:59Z'),
+        _impostos(api, usuario, agrupar_por='categoria', data_inicio='2024-02-01T00:00:00Z'),
+        server.totais_relatorio(banco, usuario_id, periodo),
+        server.totais_por_empresa(banco, usuario_id, periodo),
+    ]
+
+
+def test_notas_arquivadas_continuam_nos_relatorios(api, usuario, banco):
+    empresa = criar_empresa(api, usuario, nome='Arquivo')
+    criar_produto(api, usuario, empresa['id'], codigo='P1', categoria='ferragens')
+    importar_xmls(api, usuario, *[xml_nfe(n, empresa['cnpj'], data=d) for n, d in enumerate(DATAS, 1)])
+    usuario_id = banco.usuarios.find_one()['id']
+    antes = _relatorios(api, usuario, banco, usuario_id)
+    versao = api.portal.call(server.versao_dados_relatorio, usuario_id)
+
+    resultado = api.portal.call(server.arquivar_notas, 1)
+
+    assert resultado['arquivadas'] == 3 and banco.notas_fiscais.count_documents({}) == 0
+    assert _relatorios(api, usuario, banco, usuario_id) == antes
+    periodo, categoria, totais, por_empresa = antes
+    assert periodo['totais']['total_notas'] == 3
+    assert [(g['categoria'], g['total_itens'], g['total_icms']) for g in categoria['grupos']] == [('ferragens', 2, 7.2)]
+    assert totais['total_notas'] == 3 and totais['total_valor'] == 60.0
+    assert por_empresa == [{'empresa_nome': 'Arquivo', **totais}]
+    # Arquivar sobe a versão de notas: artefatos gerados antes não são reaproveitados
+    assert api.portal.call(server.versao_dados_relatorio, usuario_id) != versao
+
+
+def test_reenvio_de_lote_reconhece_notas_arquivadas(api, usuario, banco):
+    empresa = criar_empresa(api, usuario)
+    produto = criar_produto(api, usuario, empresa['id'])
+    lote = {'notas': [{'empresa_id': empresa['id'], 'numero_nf': str(n),
+                       'itens': [{'produto_id': produto['id'], 'quantidade': n}]} for n in (1, 2)]}
+    primeira = api.post('/api/notas/lote', headers=usuario, json=lote).json()
+    banco.notas_fiscais.update_many({}, {'$set': {'data_emissao': datetime(2024, 1, 1, tzinfo=timezone.utc)}})
+    api.portal.call(server.arquivar_notas, 1)
+
+    segunda = api.post('/api/notas/lote', headers=usuario, json=lote).json()
+
+    assert (segunda['criadas'], segunda['existentes']) == (0, 2)
+    assert [n['nota_id'] for n in segunda['notas']] == [n['nota_id'] for n in primeira['notas']]
+    assert banco.notas_fiscais.count_documents({}) == 0
+
+
+def test_so_o_dono_do_lease_arquiva(api, usuario, banco, monkeypatch):
+    monkeypatch.setattr(server, 'NOTAS_ARQUIVO_DIAS', 1)
+    empresa = criar_empresa(api, usuario)
+    criar_produto(api, usuario, empresa['id'], codigo='P1')
+    importar_xmls(api, usuario, xml_nfe(1, empresa['cnpj'], data=DATAS[0]))
+
+    assert api.portal.call(server.executar_arquivamento, 'worker-a')['arquivadas'] == 1
+    importar_xmls(api, usuario, xml_nfe(2, empresa['cnpj'], data=DATAS[1]))
+    # Outro worker não assume um lease vivo; o dono espera o intervalo
+    assert api.portal.call(server.executar_arquivamento, 'worker-b') is None
+    assert api.portal.call(server.executar_arquivamento, 'worker-a') is None
+    assert banco.notas_fiscais.count_documents({}) == 1
+
+    # Dono parou de renovar o heartbeat: outro worker assume, respeitando o intervalo
+    banco.tarefas_fundo.update_one({'_id': 'arquivamento'}, {'$set': {
+        'heartbeat': datetime(2024, 1, 1, tzinfo=timezone.utc), 'proxima_em': datetime(2024, 1, 1, tzinfo=timezone.utc)
+    }})
+    assert api.portal.call(server.executar_arquivamento, 'worker-b')['arquivadas'] == 1
+    assert banco.tarefas_fundo.find_one({'_id': 'arquivamento'})['dono'] == 'worker-b'
+    assert api.portal.call(server.renovar_lease, 'arquivamento', 'worker-a', 120) is False
@@ -0,0 +1,37 @@
+import bcrypt
+import mongomock_motor
+from fastapi.testclient import TestClient
+
+import server
+from tests.apoio import registrar
+
+
+def test_registro_e_login(api):
+    registrar(api, 'login@teste.example.com')
+    resposta = api.post('/api/auth/login', json={'email': 'login@teste.example.com', 'senha': 'senha-teste'})
+    assert resposta.status_code == 200
+    assert resposta.json()['usuario']['email'] == 'login@teste.example.com'
+
+    resposta = api.post('/api/auth/login', json={'email': 'login@teste.example.com', 'senha': 'errada'})
+    assert resposta.status_code == 401
+
+
+def test_login_regrava_hash_com_custo_diferente(api, banco):
+    registrar(api, 'rehash@teste.example.com')
+    antigo = bcrypt.hashpw(b'senha-teste', bcrypt.gensalt(rounds=server.BCRYPT_ROUNDS + 1)).decode()
+    banco.usuarios.update_one({'email': 'rehash@teste.example.com'}, {'$set': {'senha_hash': antigo}})
+
+    resposta = api.post('/api/auth/login', json={'email': 'rehash@teste.example.com', 'senha': 'senha-teste'})
+
+    assert resposta.status_code == 200
+    novo = banco.usuarios.find_one({'email': 'rehash@teste.example.com'})['senha_hash']
+    assert novo != antigo and not server.precisa_rehash(novo)
+
+
+def test_hash_funciona_depois_de_reiniciar_o_lifespan(banco):
+    """O executor do bcrypt é descartado no shutdown e recriado no próximo uso"""
+    for _ in range(2):
+        server.client = mongomock_motor.AsyncMongoMockClient(mock_mongo_client=banco.client)
+        server.db = server.client[banco.name]
+        with TestClient(server.app) as cliente:
+            registrar(cliente)
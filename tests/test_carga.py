@@ -0,0 +1,35 @@
+import json
+import sys
+from pathlib import Path
+
+import server
+
+sys.path.insert(0, str(Path(server.__file__).resolve().parent / 'benchmarks'))
+import carga  # noqa: E402
+
+
+def _resultado(pasta, nome, throughput=100.0, p95=20.0, importacao=0.5, carregadas=()):
+    cenario = {'throughput_rps': throughput, 'p50_ms': 10.0, 'p95_ms': p95, 'p99_ms': 30.0}
+    caminho = pasta / f'{nome}.json'
+    caminho.write_text(json.dumps({
+        'commit': nome, 'cenarios': {'dashboard': cenario},
+        'importacao': {'server_s': importacao, 'carregadas': list(carregadas)}
+    }))
+    return caminho
+
+
+def test_comparar_aponta_regressoes_acima_do_limite(tmp_path, capsys):
+    base = _resultado(tmp_path, 'base')
+
+    assert carga.comparar(base, _resultado(tmp_path, 'igual', throughput=95.0, p95=21.0), 10) == 0
+    assert carga.comparar(base, _resultado(tmp_path, 'lento', p95=25.0), 10) == 1
+    assert carga.comparar(base, _resultado(tmp_path, 'vazao', throughput=80.0), 10) == 1
+    assert carga.comparar(base, _resultado(tmp_path, 'import', importacao=0.7), 10) == 1
+    assert carga.comparar(base, _resultado(tmp_path, 'pesadas', carregadas=['pandas']), 10) == 1
+    assert 'REGRESSÃO' in capsys.readouterr().out
+
+
+def test_percentil():
+    valores = list(range(1, 101))
+    assert (carga.percentil(valores, 50), carga.percentil(valores, 95), carga.percentil(valores, 99)) == (51, 95, 99)
+    assert carga.percentil([7.0], 99) == 7.0
@@ -0,0 +1,63 @@
+import server
+from tests.apoio import criar_empresa, criar_nota, criar_produto
+
+
+def _consultas(resultado: str) -> float:
+    return sum(v for _, chave, v in server.CATALOGO_CONSULTAS.amostras() if dict(chave) == {'resultado': resultado})
+
+
+def test_catalogo_em_cache_e_invalidado_na_escrita(api, usuario):
+    empresa = criar_empresa(api, usuario)
+    produto = criar_produto(api, usuario, empresa['id'], valor_unitario=10.0)
+    criar_nota(api, usuario, empresa['id'], [(produto['id'], 1)])
+
+    hits = _consultas('hit')
+    assert criar_nota(api, usuario, empresa['id'], [(produto['id'], 1)])['total_valor'] == 10.0
+    assert _consultas('hit') == hits + 1
+
+    alterado = {**produto, 'valor_unitario': 12.5}
+    assert api.put(f"/api/produtos/{produto['id']}", headers=usuario, json=alterado).status_code == 200
+    assert criar_nota(api, usuario, empresa['id'], [(produto['id'], 2)])['total_valor'] == 25.0
+
+    novo = criar_produto(api, usuario, empresa['id'], valor_unitario=1.0)
+    assert criar_nota(api, usuario, empresa['id'], [(novo['id'], 3)])['total_valor'] == 3.0
+
+
+def test_escrita_em_outro_worker_descarta_a_copia_local(api, usuario, banco):
+    empresa = criar_empresa(api, usuario)
+    produto = criar_produto(api, usuario, empresa['id'], valor_unitario=10.0)
+    criar_nota(api, usuario, empresa['id'], [(produto['id'], 1)])
+
+    # Outro worker grava o produto e incrementa a versão sem passar por este cache
+    banco.produtos.update_one({'id': produto['id']}, {'$set': {'valor_unitario': 20.0}})
+    banco.catalogo_versoes.update_one({'empresa_id': empresa['id']}, {'$inc': {'versao': 1}})
+
+    stale = _consultas('stale')
+    assert criar_nota(api, usuario, empresa['id'], [(produto['id'], 1)])['total_valor'] == 20.0
+    assert _consultas('stale') == stale + 1
+
+
+def test_cache_limitado_pelo_total_de_produtos(api, usuario, monkeypatch):
+    monkeypatch.setattr(server, '_catalogos', server.CacheLRU(100, max_peso=3))
+    primeira, segunda = criar_empresa(api, usuario), criar_empresa(api, usuario)
+    produtos = {e['id']: [criar_produto(api, usuario, e['id']) for _ in range(2)] for e in (primeira, segunda)}
+
+    for empresa_id, (produto, _) in produtos.items():
+        criar_nota(api, usuario, empresa_id, [(produto['id'], 1)])
+
+    # Só cabem 3 produtos: o catálogo da primeira empresa saiu para dar lugar ao da segunda
+    assert len(server._catalogos) == 1 and server._catalogos.peso == 2
+
+
+def test_catalogo_grande_usa_consulta_por_id(api, usuario, monkeypatch):
+    monkeypatch.setattr(server, 'CATALOGO_MAX_PRODUTOS', 2)
+    monkeypatch.setattr(server, '_catalogos', server.CacheLRU(100, max_peso=100))
+    empresa = criar_empresa(api, usuario)
+    produtos = [criar_produto(api, usuario, empresa['id'], valor_unitario=v) for v in (1.0, 2.0, 4.0)]
+
+    for _ in range(2):
+        nota = criar_nota(api, usuario, empresa['id'], [(produtos[2]['id'], 1), (produtos[0]['id'], 1)])
+        assert nota['total_valor'] == 5.0
+
+    # Só a marcação de catálogo grande fica no cache, não os produtos
+    assert len(server._catalogos) == 1 and server._catalogos.peso == 1
@@ -0,0 +1,71 @@
+import io
+import json
+import zipfile
+from datetime import datetime, timezone
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import server
+from tests.apoio import criar_empresa, criar_produto, importar_xmls, xml_nfe
+
+
+def _exportar(api, headers, **params):
+    resposta = api.get('/api/relatorios/exportacao', headers=headers, params=params)
+    assert resposta.status_code == 200, resposta.text
+    return zipfile.ZipFile(io.BytesIO(resposta.content))
+
+
+def test_exportacao_parquet_particionada_e_incremental(api, usuario):
+    empresa = criar_empresa(api, usuario)
+    produto = criar_produto(api, usuario, empresa['id'], codigo='P1')
+    importar_xmls(api, usuario,
+                  xml_nfe(1, empresa['cnpj'], data='2024-03-05T10:00:00-03:00'),
+                  xml_nfe(2, empresa['cnpj'], data='2024-03-20T10:00:00-03:00'),
+                  xml_nfe(3, empresa['cnpj'], data='2024-04-02T10:00:00-03:00'))
+
+    arquivo = _exportar(api, usuario, formato='parquet')
+    manifesto = json.loads(arquivo.read('_manifesto.json'))
+    assert (manifesto['notas'], manifesto['linhas']) == (3, 3)
+    assert sorted(p['arquivo'] for p in manifesto['particoes']) == [
+        f"empresa_id={empresa['id']}/mes=2024-03/part-0.parquet",
+        f"empresa_id={empresa['id']}/mes=2024-04/part-0.parquet",
+    ]
+    marco = pq.read_table(io.BytesIO(arquivo.read(f"empresa_id={empresa['id']}/mes=2024-03/part-0.parquet")))
+    assert sorted(marco.column('numero_nf').to_pylist()) == ['1', '2']
+    assert set(marco.column('produto_id').to_pylist()) == {produto['id']}
+    assert marco.column('item_total_item').to_pylist() == [20.0, 20.0]
+    assert marco.schema.field('data_emissao').type == pa.timestamp('ms', tz='UTC')
+
+    importar_xmls(api, usuario, xml_nfe(4, empresa['cnpj'], data='2024-03-25T10:00:00-03:00'))
+    incremental = json.loads(_exportar(api, usuario, desde=manifesto['marca_dagua']).read('_manifesto.json'))
+    assert (incremental['notas'], incremental['desde']) == (1, manifesto['marca_dagua'])
+
+
+def test_exportacao_arrow(api, usuario):
+    empresa = criar_empresa(api, usuario)
+    importar_xmls(api, usuario, xml_nfe(1, empresa['cnpj']))
+
+    arquivo = _exportar(api, usuario, formato='arrow')
+    (particao,) = json.loads(arquivo.read('_manifesto.json'))['particoes']
+    tabela = pa.ipc.open_file(pa.BufferReader(arquivo.read(particao['arquivo']))).read_all()
+    assert tabela.num_rows == 1 and tabela.column('total_icms').to_pylist() == [3.6]
+    assert api.get('/api/relatorios/exportacao', headers=usuario, params={'formato': 'csv'}).status_code == 422
+
+
+def test_exportacao_inclui_notas_arquivadas(api, usuario, banco):
+    empresa = criar_empresa(api, usuario)
+    criar_produto(api, usuario, empresa['id'], codigo='P1')
+    importar_xmls(api, usuario,
+                  xml_nfe(1, empresa['cnpj'], data='2024-03-05T10:00:00-03:00'),
+                  xml_nfe(2, empresa['cnpj'], data='2024-03-20T10:00:00-03:00'))
+    banco.notas_fiscais.update_one({'numero_nf': '1'}, {'$set': {'data_emissao': datetime(2020, 3, 5, tzinfo=timezone.utc)}})
+    api.portal.call(server.arquivar_notas, 365 * 3)
+    assert banco.notas_arquivo.count_documents({}) == 1
+
+    arquivo = _exportar(api, usuario, formato='parquet')
+    manifesto = json.loads(arquivo.read('_manifesto.json'))
+    assert (manifesto['notas'], manifesto['linhas']) == (2, 2)
+    antiga = pq.read_table(io.BytesIO(arquivo.read(f"empresa_id={empresa['id']}/mes=2020-03/part-0.parquet")))
+    assert antiga.column('numero_nf').to_pylist() == ['1']
+    assert antiga.column('item_total_item').to_pylist() == [20.0]
@@ -0,0 +1,47 @@
+from tests.apoio import criar_empresa, criar_produto
+
+
+def _excluir_em_outro_worker(banco, empresa_id):
+    """Exclusão feita por outro worker: banco e dados_versoes mudam, o cache local não"""
+    usuario_id = banco.empresas.find_one({'id': empresa_id})['usuario_id']
+    banco.empresas.delete_one({'id': empresa_id})
+    banco.dados_versoes.update_one({'usuario_id': usuario_id}, {'$inc': {'empresas': 1}}, upsert=True)
+
+
+def test_empresa_excluida_em_outro_worker_recusa_escritas(api, usuario, banco):
+    empresa = criar_empresa(api, usuario)
+    produto = criar_produto(api, usuario, empresa['id'])
+    _excluir_em_outro_worker(banco, empresa['id'])
+
+    resposta = api.post('/api/produtos', headers=usuario, json={
+        'empresa_id': empresa['id'], 'nome': 'Órfão', 'codigo': 'X1', 'categoria': 'geral', 'valor_unitario': 1.0
+    })
+    assert resposta.status_code == 404
+
+    resposta = api.post('/api/notas', headers=usuario, json={
+        'empresa_id': empresa['id'], 'numero_nf': '1', 'itens': [{'produto_id': produto['id'], 'quantidade': 1}]
+    })
+    assert resposta.status_code == 404
+
+    resposta = api.post('/api/notas/lote', headers=usuario, json={'notas': [
+        {'empresa_id': empresa['id'], 'numero_nf': '2', 'itens': [{'produto_id': produto['id'], 'quantidade': 1}]}
+    ]})
+    assert resposta.json()['notas'][0] == {
+        'indice': 0, 'empresa_id': empresa['id'], 'numero_nf': '2', 'status': 'erro', 'erro': 'Empresa não encontrada'
+    }
+    assert banco.produtos.count_documents({'codigo': 'X1'}) == 0
+    assert banco.notas_fiscais.count_documents({}) == 0
+
+
+def test_empresa_criada_em_outro_worker_aceita_escritas(api, usuario, banco):
+    existente = criar_empresa(api, usuario)
+    # Carrega o contexto antes da empresa nova existir
+    assert api.get(f"/api/empresas/{existente['id']}", headers=usuario).status_code == 200
+    nova = dict(banco.empresas.find_one({'id': existente['id']}), id='outra-empresa', cnpj='11222333000181')
+    nova.pop('_id')
+    banco.empresas.insert_one(nova)
+    banco.dados_versoes.update_one({'usuario_id': nova['usuario_id']}, {'$inc': {'empresas': 1}}, upsert=True)
+
+    produto = criar_produto(api, usuario, 'outra-empresa')
+
+    assert produto['empresa_id'] == 'outra-empresa'
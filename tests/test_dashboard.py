@@ -0,0 +1,28 @@
+from tests.apoio import criar_empresa, criar_nota, criar_produto, importar_xmls, registrar, xml_nfe
+
+
+def test_dashboard_soma_notas_e_lista_as_recentes(api, usuario):
+    empresa = criar_empresa(api, usuario)
+    produto = criar_produto(api, usuario, empresa['id'], valor_unitario=10.0)
+    emitida = criar_nota(api, usuario, empresa['id'], [(produto['id'], 3)])
+    importadas = importar_xmls(api, usuario, *[
+        xml_nfe(n, empresa['cnpj'], data=f'2024-0{n}-10T10:00:00-03:00') for n in range(1, 8)
+    ])['arquivos']
+    # Dados de outro usuário não aparecem
+    outro = registrar(api)
+    criar_produto(api, outro, criar_empresa(api, outro)['id'])
+
+    dashboard = api.get('/api/dashboard', headers=usuario).json()
+
+    assert (dashboard['total_empresas'], dashboard['total_produtos'], dashboard['total_notas']) == (1, 1, 8)
+    assert dashboard['total_valor_notas'] == emitida['total_valor'] + 7 * 20.0
+    assert dashboard['total_impostos']['icms'] == round(emitida['total_icms'] + 7 * 3.6, 2)
+    assert dashboard['total_impostos']['pis'] == round(emitida['total_pis'] + 7 * 0.33, 2)
+    recentes = [emitida['id']] + [a['nota_id'] for a in importadas[::-1][:4]]
+    assert [n['id'] for n in dashboard['notas_recentes']] == recentes
+
+
+def test_dashboard_vazio(api, usuario):
+    dashboard = api.get('/api/dashboard', headers=usuario).json()
+    assert dashboard['total_notas'] == 0 and dashboard['total_valor_notas'] == 0
+    assert dashboard['notas_recentes'] == []
@@ -0,0 +1,53 @@
+from datetime import datetime, timezone
+
+import server
+from tests.apoio import criar_empresa, criar_nota, criar_produto, importar_xmls, xml_nfe
+
+
+def test_datas_gravadas_como_datetime(api, usuario, banco):
+    empresa = criar_empresa(api, usuario)
+    produto = criar_produto(api, usuario, empresa['id'])
+    nota = criar_nota(api, usuario, empresa['id'], [(produto['id'], 1)])
+
+    for documento in (banco.empresas.find_one(), banco.produtos.find_one(), banco.notas_fiscais.find_one()):
+        assert isinstance(documento['created_at'], datetime)
+    gravada = banco.notas_fiscais.find_one({'id': nota['id']})
+    assert isinstance(gravada['data_emissao'], datetime)
+    assert isinstance(banco.itens_nf.find_one({'nota_id': nota['id']})['data_emissao'], datetime)
+    assert datetime.fromisoformat(nota['data_emissao']).tzinfo is not None
+
+
+def test_filtro_de_periodo_respeita_o_fuso(api, usuario, banco):
+    empresa = criar_empresa(api, usuario)
+    importar_xmls(api, usuario,
+                  xml_nfe(1, empresa['cnpj'], data='2024-03-31T20:00:00-03:00'),
+                  xml_nfe(2, empresa['cnpj'], data='2024-03-31T22:00:00-03:00'))
+    assert banco.notas_fiscais.find_one({'numero_nf': '2'})['data_emissao'] == \
+        datetime(2024, 4, 1, 1, tzinfo=timezone.utc)
+
+    def numeros(**params):
+        return sorted(n['numero_nf'] for n in api.get('/api/notas', headers=usuario, params=params).json())
+
+    assert numeros(data_fim='2024-03-31T23:59:59-03:00') == ['1', '2']
+    assert numeros(data_fim='2024-03-31T23:59:59Z') == ['1']
+    assert numeros(data_inicio='2024-04-01T00:00:00Z') == ['2']
+    # Datas sem fuso são consideradas UTC
+    assert numeros(data_inicio='2024-04-01T00:00:00') == ['2']
+
+
+def test_migracao_de_datas_invalida_leituras_em_cache(api, usuario, banco):
+    empresa = criar_empresa(api, usuario)
+    produto = criar_produto(api, usuario, empresa['id'])
+    nota = criar_nota(api, usuario, empresa['id'], [(produto['id'], 1)])
+    # Nota gravada por uma versão anterior, com datas em texto
+    banco.notas_fiscais.update_one({'id': nota['id']}, {'$set': {
+        'data_emissao': '2024-03-15T10:00:00+00:00', 'created_at': '2024-03-15T10:00:00+00:00'
+    }})
+    antes = api.get(f"/api/notas/{nota['id']}", headers=usuario)
+
+    resultado = api.portal.call(server.migrar_datas)
+
+    assert resultado['notas_fiscais']['convertidos'] == 1
+    depois = api.get(f"/api/notas/{nota['id']}", headers={**usuario, 'If-None-Match': antes.headers['ETag']})
+    assert depois.status_code == 200
+    assert depois.json()['data_emissao'] == '2024-03-15T10:00:00Z'
@@ -0,0 +1,75 @@
+import io
+from datetime import timedelta
+
+import openpyxl
+import pytest
+
+import server
+from tests.apoio import criar_empresa, criar_nota, criar_produto
+
+
+@pytest.fixture
+def larguras_sem_strlencp(monkeypatch):
+    """mongomock não implementa $strLenCP: as larguras de texto viram um valor fixo"""
+    def sem_strlencp(pipeline):
+        def trocar(expr):
+            if isinstance(expr, dict):
+                if '$strLenCP' in expr:
+                    return 30
+                return {k: trocar(v) for k, v in expr.items()}
+            if isinstance(expr, list):
+                return [trocar(v) for v in expr]
+            return expr
+        return trocar(pipeline)
+    excel, itens = server.pipeline_larguras_excel, server.pipeline_larguras_itens
+    monkeypatch.setattr(server, 'pipeline_larguras_excel', lambda q, i: sem_strlencp(excel(q, i)))
+    monkeypatch.setattr(server, 'pipeline_larguras_itens', lambda q: sem_strlencp(itens(q)))
+
+
+def test_excel_com_notas_e_itens(api, usuario, larguras_sem_strlencp):
+    empresa = criar_empresa(api, usuario, nome='Comércio Exemplo')
+    a = criar_produto(api, usuario, empresa['id'], nome='Parafuso', valor_unitario=2.0)
+    b = criar_produto(api, usuario, empresa['id'], nome='Porca', valor_unitario=1.5)
+    for n in (1, 2):
+        criar_nota(api, usuario, empresa['id'], [(a['id'], 3), (b['id'], 2)], numero_nf=str(n))
+
+    resposta = api.get('/api/relatorios/excel', headers=usuario, params={'itens': True})
+
+    assert resposta.status_code == 200
+    wb = openpyxl.load_workbook(io.BytesIO(resposta.content))
+    assert wb.sheetnames == ['Relatório Fiscal', 'Itens']
+    linhas = list(wb['Relatório Fiscal'].iter_rows(values_only=True))
+    assert list(linhas[0]) == server.EXCEL_COLUNAS_NOTAS
+    assert sorted(l[0] for l in linhas[1:]) == ['1', '2']
+    assert all(l[1] == 'Comércio Exemplo' and l[3] == 9.0 for l in linhas[1:])
+    itens = list(wb['Itens'].iter_rows(values_only=True))[1:]
+    assert len(itens) == 4
+    assert sorted((l[2], l[3], l[5]) for l in itens) == [('Parafuso', 3, 6.0)] * 2 + [('Porca', 2, 3.0)] * 2
+    assert wb['Relatório Fiscal'].column_dimensions['B'].width == 32
+
+
+def test_excel_sem_notas(api, usuario, larguras_sem_strlencp):
+    resposta = api.get('/api/relatorios/excel', headers=usuario)
+
+    assert resposta.status_code == 200
+    linhas = list(openpyxl.load_workbook(io.BytesIO(resposta.content))['Relatório Fiscal'].iter_rows(values_only=True))
+    assert len(linhas) == 1
+
+
+def test_excel_inclui_notas_arquivadas(api, usuario, banco, larguras_sem_strlencp):
+    empresa = criar_empresa(api, usuario)
+    produto = criar_produto(api, usuario, empresa['id'], nome='Arruela', valor_unitario=1.0)
+    criar_nota(api, usuario, empresa['id'], [(produto['id'], 7)], numero_nf='1')
+    criar_nota(api, usuario, empresa['id'], [(produto['id'], 1)], numero_nf='2')
+    emissao = banco.notas_fiscais.find_one({'numero_nf': '2'})['data_emissao']
+    banco.notas_fiscais.update_one({'numero_nf': '1'}, {'$set': {'data_emissao': emissao - timedelta(days=400)}})
+    api.portal.call(server.arquivar_notas, 365)
+    assert banco.notas_arquivo.count_documents({}) == 1
+
+    resposta = api.get('/api/relatorios/excel', headers=usuario, params={'itens': True})
+
+    assert resposta.status_code == 200
+    wb = openpyxl.load_workbook(io.BytesIO(resposta.content))
+    assert [l[0] for l in list(wb['Relatório Fiscal'].iter_rows(values_only=True))[1:]] == ['2', '1']
+    itens = list(wb['Itens'].iter_rows(values_only=True))[1:]
+    assert [(l[0], l[2], l[3]) for l in itens] == [('2', 'Arruela', 1), ('1', 'Arruela', 7)]
@@ -0,0 +1,83 @@
+import random
+import sys
+from decimal import Decimal
+from pathlib import Path
+
+import pytest
+
+import server
+from tests.apoio import criar_empresa, criar_nota, criar_produto
+
+sys.path.insert(0, str(Path(server.__file__).resolve().parent / 'benchmarks'))
+from bench_impostos import REGIMES, calcular_impostos_float, gerar_itens  # noqa: E402
+
+
+def _valor_exato(item: dict, regime: str, campo: str) -> Decimal:
+    """Valor antes do arredondamento, em aritmética decimal exata"""
+    total = Decimal(repr(item['valor_unitario'])) * Decimal(repr(item['quantidade']))
+    if campo == 'total_item':
+        return total
+    for imposto, campo_aliquota, padrao, fator in server.motor_impostos.avaliador(regime).regras:
+        if imposto == campo:
+            aliquota = item.get(campo_aliquota)
+            mantissa, expoente = padrao if aliquota is None else server._decimal(aliquota)
+            return total * Decimal(mantissa).scaleb(expoente) * Decimal(fator[0]).scaleb(fator[1])
+    raise KeyError(campo)
+
+
+def _empate_meio_centavo(valor: Decimal) -> bool:
+    milesimos = valor * 1000
+    return milesimos == milesimos.to_integral_value() and milesimos % 10 == 5
+
+
+@pytest.mark.parametrize('regime', REGIMES)
+def test_motor_igual_ao_calculo_float_exceto_empates(regime):
+    """Só empates exatos de meio centavo podem divergir: o float arredondava
+    pelo valor binário (2.675 -> 2.67), o motor pelo decimal exato."""
+    itens = gerar_itens(10000, random.Random(42))
+    for item, novo in zip(itens, server.calcular_impostos_lote(itens, regime)):
+        antigo = calcular_impostos_float(item, regime)
+        for campo, valor in novo.items():
+            if valor != antigo[campo]:
+                exato = _valor_exato(item, regime, campo)
+                assert abs(valor - antigo[campo]) < 0.0100001 and _empate_meio_centavo(exato), (item, campo)
+
+
+def test_cache_de_taxas_limitado(api, usuario, monkeypatch):
+    monkeypatch.setattr(server, 'TAXAS_CACHE_MAX', 2)
+    monkeypatch.setattr(server, 'motor_impostos', server.MotorImpostos(server.carregar_regras()))
+    empresa = criar_empresa(api, usuario, regime_tributario='Lucro Real')
+    aliquotas = [4.0, 7.0, 12.0, 17.5, 19.25]
+    produtos = [criar_produto(api, usuario, empresa['id'], valor_unitario=10.0, aliquota_icms=a) for a in aliquotas]
+
+    for _ in range(2):
+        nota = criar_nota(api, usuario, empresa['id'], [(p['id'], 1) for p in produtos])
+        assert [i['icms'] for i in nota['itens']] == [0.4, 0.7, 1.2, 1.75, 1.92]
+
+    # LRU: ficam as duas alíquotas usadas por último
+    taxas_icms = server.motor_impostos.avaliador('Lucro Real')._taxas[0]
+    assert len(taxas_icms) == 2 and taxas_icms.obter(19.25) and taxas_icms.obter(4.0) is None
+
+
+def test_valores_nao_finitos_sao_recusados(api, usuario, banco):
+    empresa = criar_empresa(api, usuario)
+    resposta = api.post('/api/produtos', headers={**usuario, 'Content-Type': 'application/json'}, content=(
+        '{"empresa_id": "%s", "nome": "X", "codigo": "NAN", "categoria": "geral", '
+        '"valor_unitario": 10, "aliquota_icms": NaN}' % empresa['id']
+    ))
+    assert resposta.status_code == 400 and 'aliquota_icms' in resposta.json()['detail']
+
+    # Produto gravado antes da validação, com alíquota NaN
+    produto = criar_produto(api, usuario, empresa['id'])
+    banco.produtos.update_one({'id': produto['id']}, {'$set': {'aliquota_icms': float('nan')}})
+    item = [{'produto_id': produto['id'], 'quantidade': 1}]
+
+    resposta = api.post('/api/notas', headers=usuario, json={'empresa_id': empresa['id'], 'numero_nf': '1', 'itens': item})
+    assert resposta.status_code == 400
+
+    resposta = api.post('/api/notas/lote', headers=usuario, json={'notas': [
+        {'empresa_id': empresa['id'], 'numero_nf': '2', 'itens': item}
+    ]})
+    assert resposta.status_code == 200
+    assert 'aliquota_icms inválido' in resposta.json()['notas'][0]['erro']
+    assert banco.notas_fiscais.count_documents({}) == 0
@@ -0,0 +1,43 @@
+import asyncio
+
+import mongomock_motor
+
+import server
+
+
+def _reconciliar(banco):
+    database = mongomock_motor.AsyncMongoMockClient(mock_mongo_client=banco.client)[banco.name]
+    return asyncio.run(server.reconciliar_indices(database))
+
+
+def test_reconciliar_cria_indices_declarados(banco):
+    relatorio = _reconciliar(banco)
+
+    assert 'expira_em_ttl' in relatorio['relatorios_jobs']['criados']
+    assert banco.relatorios_jobs.index_information()['expira_em_ttl']['expireAfterSeconds'] == 0
+    # mongomock descarta partialFilterExpression ao criar índices a partir de IndexModel
+    segunda = _reconciliar(banco)
+    assert all(not r['recriados'] for colecao, r in segunda.items() if colecao != 'notas_fiscais')
+
+
+def test_reconciliar_recria_indice_com_opcoes_divergentes(banco):
+    banco.relatorios_jobs.create_index([('expira_em', 1)], name='expira_em_ttl', expireAfterSeconds=3600)
+    banco.produtos.create_index([('usuario_id', 1), ('empresa_id', 1)], name='usuario_empresa', sparse=True)
+
+    relatorio = _reconciliar(banco)
+
+    assert relatorio['relatorios_jobs']['recriados'] == ['expira_em_ttl']
+    assert relatorio['produtos']['recriados'] == ['usuario_empresa']
+    assert banco.relatorios_jobs.index_information()['expira_em_ttl']['expireAfterSeconds'] == 0
+    assert 'sparse' not in banco.produtos.index_information()['usuario_empresa']
+
+
+def test_mesma_definicao_compara_opcoes():
+    declarado = {'key': {'a': 1}, 'name': 'a', 'expireAfterSeconds': 0}
+    assert server._mesma_definicao({'key': [('a', 1.0)], 'expireAfterSeconds': 0.0}, declarado)
+    assert not server._mesma_definicao({'key': [('a', 1)]}, declarado)
+    assert not server._mesma_definicao({'key': [('a', 1)], 'expireAfterSeconds': 0, 'sparse': True}, declarado)
+
+    parcial = {'key': {'a': 1}, 'name': 'a', 'unique': True, 'partialFilterExpression': {'a': {'$exists': True}}}
+    assert server._mesma_definicao({**parcial, 'key': [('a', 1)]}, parcial)
+    assert not server._mesma_definicao({'key': [('a', 1)], 'unique': True}, parcial)
@@ -0,0 +1,69 @@
+import json
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import mongomock_motor
+from fastapi.testclient import TestClient
+
+import server
+from tests.apoio import registrar
+
+BACKEND = Path(server.__file__).resolve().parent
+
+
+def test_importar_server_nao_carrega_bibliotecas_pesadas():
+    modulos = ['pandas', 'numpy', 'pyarrow', 'openpyxl', 'reportlab', 'xmltodict']
+    codigo = f"import json, sys, server; print(json.dumps([m for m in {modulos!r} if m in sys.modules]))"
+    saida = subprocess.run([sys.executable, '-c', codigo], cwd=BACKEND, capture_output=True, text=True, check=True)
+    assert json.loads(saida.stdout.strip().splitlines()[-1]) == []
+
+
+def test_shutdown_descarta_cliente_e_executores(banco):
+    server.client = mongomock_motor.AsyncMongoMockClient(mock_mongo_client=banco.client)
+    server.db = server.client[banco.name]
+    with TestClient(server.app) as cliente:
+        registrar(cliente)
+        server._nfe_pool = ThreadPoolExecutor(max_workers=1)
+        server._relatorio_pool = ThreadPoolExecutor(max_workers=1)
+        assert server._hash_executor is not None
+
+    assert server.client is None and server.db is None
+    assert server._hash_executor is None and server._nfe_pool is None and server._relatorio_pool is None
+
+    server.client = mongomock_motor.AsyncMongoMockClient(mock_mongo_client=banco.client)
+    server.db = server.client[banco.name]
+    with TestClient(server.app) as cliente:
+        registrar(cliente)
+
+
+def test_conectar_mongo_usa_tamanhos_de_pool_configurados(monkeypatch):
+    monkeypatch.setattr(server, 'client', None)
+    monkeypatch.setattr(server, 'db', None)
+    monkeypatch.setattr(server, 'MONGO_MAX_POOL_SIZE', 7)
+    monkeypatch.setattr(server, 'MONGO_MIN_POOL_SIZE', 2)
+    database = server.conectar_mongo()
+    try:
+        assert server.conectar_mongo() is database
+        opcoes = server.client.delegate.options.pool_options
+        assert (opcoes.max_pool_size, opcoes.min_pool_size) == (7, 2)
+    finally:
+        server.client.close()
+
+
+def test_pools_de_processos_usam_spawn(monkeypatch):
+    monkeypatch.setattr(server, '_nfe_pool', None)
+    monkeypatch.setattr(server, 'NFE_IMPORT_WORKERS', 1)
+    pool = server.get_nfe_pool()
+    try:
+        assert pool._mp_context.get_start_method() == 'spawn'
+        assert pool.submit(server._somente_digitos, '12.345/0001-99').result(timeout=60) == '12345000199'
+    finally:
+        pool.shutdown()
+
+
+def test_processo_principal_nao_tem_threads_antes_do_fork():
+    codigo = "import threading, servidor, server; print(threading.active_count())"
+    saida = subprocess.run([sys.executable, '-c', codigo], cwd=BACKEND, capture_output=True, text=True, check=True)
+    assert saida.stdout.strip().splitlines()[-1] == '1'
@@ -0,0 +1,52 @@
+import server
+from tests.apoio import criar_empresa, criar_nota, criar_produto
+
+
+def test_itens_ficam_em_itens_nf_e_voltam_no_detalhe(api, usuario, banco):
+    empresa = criar_empresa(api, usuario)
+    a = criar_produto(api, usuario, empresa['id'], valor_unitario=10.0)
+    b = criar_produto(api, usuario, empresa['id'], valor_unitario=2.5)
+    nota = criar_nota(api, usuario, empresa['id'], [(a['id'], 2), (b['id'], 4), (a['id'], 1)])
+
+    cabecalho = banco.notas_fiscais.find_one({'id': nota['id']})
+    assert 'itens' not in cabecalho and cabecalho['qtd_itens'] == 3
+    linhas = list(banco.itens_nf.find({'nota_id': nota['id']}).sort('seq', 1))
+    assert [(linha['produto_id'], linha['quantidade']) for linha in linhas] == [(a['id'], 2), (b['id'], 4), (a['id'], 1)]
+    assert {linha['empresa_id'] for linha in linhas} == {empresa['id']}
+
+    detalhe = api.get(f"/api/notas/{nota['id']}", headers=usuario).json()
+    assert detalhe['itens'] == nota['itens']
+
+    assert api.delete(f"/api/notas/{nota['id']}", headers=usuario).status_code == 200
+    assert banco.itens_nf.count_documents({}) == 0
+
+
+def _usuario_id(banco) -> str:
+    return banco.usuarios.find_one()['id']
+
+
+def test_notas_com_itens_embutidos_sao_lidas_e_migradas(api, usuario, banco):
+    empresa = criar_empresa(api, usuario)
+    produto = criar_produto(api, usuario, empresa['id'])
+    nota = criar_nota(api, usuario, empresa['id'], [(produto['id'], 2), (produto['id'], 3)])
+    # Formato anterior: itens dentro do cabeçalho
+    itens = [{k: v for k, v in linha.items() if k in server.ItemNF.model_fields}
+             for linha in banco.itens_nf.find({'nota_id': nota['id']}).sort('seq', 1)]
+    banco.itens_nf.delete_many({})
+    banco.notas_fiscais.update_one({'id': nota['id']}, {'$set': {'itens': itens}, '$unset': {'qtd_itens': ''}})
+
+    antes = api.get(f"/api/notas/{nota['id']}", headers=usuario)
+    assert antes.json()['itens'] == nota['itens']
+    versao = api.portal.call(server.versao_dados_relatorio, _usuario_id(banco))
+
+    api.portal.call(server.migrar_itens, 1)
+
+    # Migrar muda o armazenamento: respostas em cache e artefatos de relatório são refeitos
+    assert api.get(f"/api/notas/{nota['id']}", headers={**usuario, 'If-None-Match': antes.headers['ETag']}) \
+        .status_code == 200
+    assert api.portal.call(server.versao_dados_relatorio, _usuario_id(banco)) != versao
+
+    cabecalho = banco.notas_fiscais.find_one({'id': nota['id']})
+    assert 'itens' not in cabecalho and cabecalho['qtd_itens'] == 2
+    assert banco.itens_nf.count_documents({'nota_id': nota['id']}) == 2
+    assert api.get(f"/api/notas/{nota['id']}", headers=usuario).json()['itens'] == nota['itens']
@@ -0,0 +1,44 @@
+import server
+from tests.apoio import criar_empresa, criar_nota, criar_produto, registrar
+
+
+def _hits() -> float:
+    return sum(v for _, chave, v in server.RESPOSTAS_CONSULTAS.amostras() if chave == (('resultado', 'hit'),))
+
+
+def test_etag_devolve_304_ate_a_proxima_escrita(api, usuario):
+    empresa = criar_empresa(api, usuario)
+    primeira = api.get('/api/empresas', headers=usuario)
+    etag = primeira.headers['ETag']
+    assert primeira.headers['Cache-Control'] == 'private, no-cache'
+
+    repetida = api.get('/api/empresas', headers={**usuario, 'If-None-Match': etag})
+    assert repetida.status_code == 304 and repetida.headers['ETag'] == etag
+
+    api.put(f"/api/empresas/{empresa['id']}", headers=usuario, json={**empresa, 'nome': 'Renomeada'})
+    depois = api.get('/api/empresas', headers={**usuario, 'If-None-Match': etag})
+    assert depois.status_code == 200 and depois.headers['ETag'] != etag
+    assert [e['nome'] for e in depois.json()] == ['Renomeada']
+
+
+def test_cache_de_respostas_separado_por_colecao_e_usuario(api, usuario, monkeypatch):
+    monkeypatch.setattr(server, '_respostas', server.CacheLRU(server.RESPOSTA_CACHE_MAX))
+    empresa = criar_empresa(api, usuario)
+    produto = criar_produto(api, usuario, empresa['id'])
+    empresas = api.get('/api/empresas', headers=usuario).headers['ETag']
+    dashboard = api.get('/api/dashboard', headers=usuario)
+    antes = _hits()
+
+    criar_nota(api, usuario, empresa['id'], [(produto['id'], 1)])
+
+    # Nota nova não muda a lista de empresas, mas muda o dashboard
+    assert api.get('/api/empresas', headers={**usuario, 'If-None-Match': empresas}).status_code == 304
+    atual = api.get('/api/dashboard', headers=usuario)
+    assert atual.headers['ETag'] != dashboard.headers['ETag']
+    assert atual.json()['total_notas'] == dashboard.json()['total_notas'] + 1
+    assert api.get('/api/dashboard', headers=usuario).json() == atual.json()
+    assert _hits() == antes + 1
+
+    outro = registrar(api, 'outro@teste.example.com')
+    resposta = api.get('/api/empresas', headers={**outro, 'If-None-Match': empresas})
+    assert resposta.status_code == 200 and resposta.json() == []
@@ -0,0 +1,69 @@
+import logging
+import re
+from types import SimpleNamespace
+
+import server
+from tests.apoio import criar_empresa
+
+
+def _amostra(texto: str, nome: str, **labels) -> float:
+    rotulos = ','.join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+    correspondencia = re.search(rf'^{re.escape(nome)}\{{{re.escape(rotulos)}\}} (\S+)$', texto, re.M)
+    return float(correspondencia.group(1)) if correspondencia else 0.0
+
+
+def test_metrics_agrupa_latencia_pelo_template_da_rota(api, usuario):
+    empresa = criar_empresa(api, usuario)
+    rota = dict(method='GET', route='/api/empresas/{empresa_id}', status=200)
+    antes = _amostra(api.get('/metrics').text, 'http_request_duration_seconds_count', **rota)
+
+    for _ in range(3):
+        assert api.get(f"/api/empresas/{empresa['id']}", headers=usuario).status_code == 200
+    resposta = api.get('/metrics')
+
+    assert resposta.status_code == 200
+    assert resposta.headers['content-type'].startswith('text/plain; version=0.0.4')
+    assert '# TYPE http_request_duration_seconds histogram' in resposta.text
+    assert _amostra(resposta.text, 'http_request_duration_seconds_count', **rota) == antes + 3
+    assert f"/api/empresas/{empresa['id']}" not in resposta.text
+
+
+def _evento(comando: str, micros: int, reply: dict = None, **campos):
+    return SimpleNamespace(
+        command_name=comando, command={comando: 'notas_fiscais', **campos}, connection_id=('h', 1), request_id=1,
+        duration_micros=micros, reply=reply or {}, database_name='teste'
+    )
+
+
+def test_listener_mongo_conta_documentos_e_comandos_lentos(caplog):
+    listener = server.MongoMetricasListener()
+    labels = dict(collection='notas_fiscais', command='find')
+    documentos = server.MONGO_DOCUMENTOS.amostras()
+    lentos = server.MONGO_LENTOS.amostras()
+
+    def valor(amostras):
+        return sum(v for _, chave, v in amostras if dict(chave) == labels)
+
+    rapido = _evento('find', 1_000, {'cursor': {'firstBatch': [{}, {}, {}]}}, filter={'usuario_id': 'u'})
+    listener.started(rapido)
+    listener.succeeded(rapido)
+    lento = _evento('find', int((server.SLOW_QUERY_MS + 50) * 1000), {'cursor': {'firstBatch': []}}, filter={'x': 1})
+    with caplog.at_level(logging.WARNING):
+        listener.started(lento)
+        listener.succeeded(lento)
+
+    assert valor(server.MONGO_DOCUMENTOS.amostras()) == valor(documentos) + 3
+    assert valor(server.MONGO_LENTOS.amostras()) == valor(lentos) + 1
+    assert "Comando lento" in caplog.text and "teste.notas_fiscais" in caplog.text
+
+
+def test_log_de_comando_lento_nao_traz_valores_do_filtro(caplog):
+    listener = server.MongoMetricasListener()
+    lento = _evento('find', int((server.SLOW_QUERY_MS + 50) * 1000),
+                    filter={'email': 'fulano@teste.example.com', 'cnpj': {'$in': ['11222333000181']}})
+    with caplog.at_level(logging.WARNING):
+        listener.started(lento)
+        listener.succeeded(lento)
+
+    assert "'email': 'str'" in caplog.text and "'cnpj': {'$in': ['str']}" in caplog.text
+    assert 'fulano' not in caplog.text and '11222333000181' not in caplog.text
@@ -0,0 +1,76 @@
+import io
+import zipfile
+
+import server
+from tests.apoio import criar_empresa, criar_produto, importar_xmls, xml_nfe as _xml
+
+
+def _zip(membros):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for nome, conteudo in membros.items():
+            zf.writestr(nome, conteudo)
+    return buffer.getvalue()
+
+
+def test_importar_xml_e_zip(api, usuario, banco):
+    empresa = criar_empresa(api, usuario)
+    produto = criar_produto(api, usuario, empresa['id'], codigo='P1')
+    arquivos = [
+        ('arquivos', ('1.xml', _xml(1, empresa['cnpj']), 'application/xml')),
+        ('arquivos', ('lote.zip', _zip({'2.xml': _xml(2, empresa['cnpj']), 'leia.txt': b'x'}), 'application/zip')),
+        ('arquivos', ('ruim.xml', b'<nada/>', 'application/xml')),
+    ]
+
+    resposta = api.post('/api/notas/importar', headers=usuario, files=arquivos)
+
+    assert resposta.status_code == 200
+    corpo = resposta.json()
+    assert (corpo['total'], corpo['importadas'], corpo['existentes'], corpo['erros']) == (3, 2, 0, 1)
+    assert [a['arquivo'] for a in corpo['arquivos']] == ['1.xml', 'lote.zip/2.xml', 'ruim.xml']
+    nota = banco.notas_fiscais.find_one({'numero_nf': '2'})
+    assert nota['empresa_id'] == empresa['id'] and nota['total_icms'] == 3.6
+    assert banco.itens_nf.find_one({'nota_id': nota['id']})['produto_id'] == produto['id']
+
+
+def test_reimportar_nfe_nao_duplica(api, usuario, banco):
+    empresa = criar_empresa(api, usuario)
+    xml = _xml(7, empresa['cnpj'])
+
+    primeira = api.post('/api/notas/importar', headers=usuario, files=[('arquivos', ('7.xml', xml))]).json()
+    segunda = api.post('/api/notas/importar', headers=usuario, files=[
+        ('arquivos', ('7.xml', xml)), ('arquivos', ('8.xml', _xml(8, empresa['cnpj']))),
+        ('arquivos', ('8-copia.xml', _xml(8, empresa['cnpj'])))
+    ]).json()
+
+    assert primeira['importadas'] == 1
+    assert (segunda['importadas'], segunda['existentes'], segunda['erros']) == (1, 2, 0)
+    assert segunda['arquivos'][0] == {
+        'arquivo': '7.xml', 'status': 'existente', 'numero_nf': '7', 'nota_id': primeira['arquivos'][0]['nota_id']
+    }
+    assert segunda['arquivos'][2]['nota_id'] == segunda['arquivos'][1]['nota_id']
+    assert banco.notas_fiscais.count_documents({'numero_nf': {'$in': ['7', '8']}}) == 2
+
+
+def test_importacao_concorrente_do_mesmo_xml_nao_duplica(api, usuario, banco, monkeypatch):
+    empresa = criar_empresa(api, usuario)
+    # O índice real é parcial (só notas com chave); aqui todas as notas são importadas e a têm
+    banco.notas_fiscais.create_index([('usuario_id', 1), ('empresa_id', 1), ('chave_idempotencia', 1)], unique=True)
+    inserir_notas = server.inserir_notas
+    concorrentes = {}
+
+    async def inserir_depois_de_outra_requisicao(notas, **kwargs):
+        # Outra importação grava a mesma nota depois da consulta desta e antes do insert
+        outra = {**notas[0], 'id': 'gravada-por-outra'}
+        banco.notas_fiscais.insert_one(outra)
+        concorrentes['id'] = outra['id']
+        monkeypatch.setattr(server, 'inserir_notas', inserir_notas)
+        await inserir_notas(notas, **kwargs)
+
+    monkeypatch.setattr(server, 'inserir_notas', inserir_depois_de_outra_requisicao)
+    resultado = importar_xmls(api, usuario, _xml(7, empresa['cnpj']))
+
+    assert (resultado['importadas'], resultado['existentes']) == (0, 1)
+    assert resultado['arquivos'][0]['nota_id'] == concorrentes['id']
+    assert banco.notas_fiscais.count_documents({}) == 1
+    assert banco.itens_nf.count_documents({}) == 0
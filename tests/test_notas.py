@@ -0,0 +1,40 @@
+from tests.apoio import criar_empresa, criar_produto
+
+
+def test_criar_nota_calcula_itens_e_totais(api, usuario):
+    empresa = criar_empresa(api, usuario, regime_tributario='Simples Nacional')
+    a = criar_produto(api, usuario, empresa['id'], valor_unitario=10.0)
+    b = criar_produto(api, usuario, empresa['id'], valor_unitario=2.5, aliquota_ipi=10.0)
+
+    resposta = api.post('/api/notas', headers=usuario, json={
+        'empresa_id': empresa['id'], 'numero_nf': '1',
+        'itens': [{'produto_id': a['id'], 'quantidade': 2}, {'produto_id': b['id'], 'quantidade': 4},
+                  {'produto_id': a['id'], 'quantidade': 1}]
+    })
+
+    assert resposta.status_code == 200
+    nota = resposta.json()
+    assert [i['total_item'] for i in nota['itens']] == [20.0, 10.0, 10.0]
+    # Simples Nacional: ICMS de 18% com redução de 30%
+    assert [i['icms'] for i in nota['itens']] == [2.52, 1.26, 1.26]
+    assert nota['itens'][1]['ipi'] == 1.0
+    assert nota['total_valor'] == 40.0
+    assert nota['total_icms'] == 5.04
+    # PIS de 10,00 é 0,165: meio centavo arredonda para o par
+    assert [i['pis'] for i in nota['itens']] == [0.33, 0.16, 0.16]
+    assert nota['total_pis'] == 0.65
+    assert nota['total_cofins'] == 3.04
+
+
+def test_criar_nota_com_produto_inexistente(api, usuario, banco):
+    empresa = criar_empresa(api, usuario)
+    a = criar_produto(api, usuario, empresa['id'])
+
+    resposta = api.post('/api/notas', headers=usuario, json={
+        'empresa_id': empresa['id'], 'numero_nf': '1',
+        'itens': [{'produto_id': a['id'], 'quantidade': 1}, {'produto_id': 'nao-existe', 'quantidade': 1}]
+    })
+
+    assert resposta.status_code == 404
+    assert 'nao-existe' in resposta.json()['detail']
+    assert banco.notas_fiscais.count_documents({}) == 0
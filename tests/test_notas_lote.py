@@ -0,0 +1,56 @@
+import server
+from tests.apoio import criar_empresa, criar_nota, criar_produto
+
+
+def _nota(empresa_id, numero, itens):
+    return {'empresa_id': empresa_id, 'numero_nf': numero,
+            'itens': [{'produto_id': p, 'quantidade': q} for p, q in itens]}
+
+
+def test_lote_com_status_por_nota(api, usuario, banco):
+    empresa = criar_empresa(api, usuario, regime_tributario='Simples Nacional')
+    produto = criar_produto(api, usuario, empresa['id'], valor_unitario=10.0)
+    avulsa = criar_nota(api, usuario, empresa['id'], [(produto['id'], 1)], numero_nf='100')
+
+    resposta = api.post('/api/notas/lote', headers=usuario, json={'notas': [
+        _nota(empresa['id'], '1', [(produto['id'], 2)]),
+        _nota(empresa['id'], '100', [(produto['id'], 1)]),
+        _nota(empresa['id'], '1', [(produto['id'], 5)]),
+        _nota('nao-existe', '2', [(produto['id'], 1)]),
+        _nota(empresa['id'], '3', [(produto['id'], 1), ('sumiu', 1)]),
+        _nota(empresa['id'], '4', [(produto['id'], 'muitos')]),
+    ]})
+
+    assert resposta.status_code == 200
+    corpo = resposta.json()
+    assert (corpo['total'], corpo['criadas'], corpo['existentes'], corpo['erros']) == (6, 1, 1, 4)
+    status = [n['status'] for n in corpo['notas']]
+    assert status == ['criada', 'existente', 'erro', 'erro', 'erro', 'erro']
+    assert corpo['notas'][1]['nota_id'] == avulsa['id']
+    assert 'sumiu' in corpo['notas'][4]['erro'] and 'quantidade' in corpo['notas'][5]['erro']
+
+    criada = banco.notas_fiscais.find_one({'id': corpo['notas'][0]['nota_id']})
+    # Mesmo cálculo de POST /notas: Simples Nacional, 2 x 10,00
+    assert (criada['total_valor'], criada['total_icms'], criada['total_pis']) == (20.0, 2.52, 0.33)
+
+
+def test_reenvio_do_lote_e_idempotente(api, usuario, banco):
+    empresa = criar_empresa(api, usuario)
+    produto = criar_produto(api, usuario, empresa['id'])
+    lote = {'notas': [_nota(empresa['id'], str(n), [(produto['id'], n)]) for n in (1, 2, 3)]}
+
+    primeira = api.post('/api/notas/lote', headers=usuario, json=lote).json()
+    segunda = api.post('/api/notas/lote', headers=usuario, json=lote).json()
+
+    assert (primeira['criadas'], segunda['criadas'], segunda['existentes']) == (3, 0, 3)
+    assert [n['nota_id'] for n in segunda['notas']] == [n['nota_id'] for n in primeira['notas']]
+    assert banco.notas_fiscais.count_documents({}) == 3
+    assert banco.resumos.find_one()['total_notas'] == 3
+
+
+def test_lote_acima_do_maximo(api, usuario, monkeypatch):
+    monkeypatch.setattr(server, 'NOTAS_LOTE_MAX', 2)
+    empresa = criar_empresa(api, usuario)
+    resposta = api.post('/api/notas/lote', headers=usuario,
+                        json={'notas': [_nota(empresa['id'], str(n), []) for n in range(3)]})
+    assert resposta.status_code == 400
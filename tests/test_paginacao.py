@@ -0,0 +1,24 @@
+from tests.apoio import criar_empresa
+
+
+def test_listagem_segue_o_cursor_ate_a_ultima_pagina(api, usuario):
+    criadas = [criar_empresa(api, usuario, nome=f'Empresa {i}')['id'] for i in range(5)]
+
+    vistas, paginas, params = [], 0, {'limit': 2}
+    while True:
+        resposta = api.get('/api/empresas', headers=usuario, params=params)
+        assert resposta.status_code == 200
+        assert resposta.headers['X-Total-Count'] == '5'
+        vistas += [e['id'] for e in resposta.json()]
+        paginas += 1
+        if 'X-Next-Cursor' not in resposta.headers:
+            break
+        params = {'limit': 2, 'cursor': resposta.headers['X-Next-Cursor']}
+
+    assert paginas == 3
+    assert vistas == criadas
+
+
+def test_cursor_invalido(api, usuario):
+    resposta = api.get('/api/empresas', headers=usuario, params={'cursor': 'nao-e-um-cursor'})
+    assert resposta.status_code == 400
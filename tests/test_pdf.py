@@ -0,0 +1,78 @@
+from datetime import timedelta
+
+import server
+from tests.apoio import criar_empresa, criar_nota, criar_produto
+
+
+class PdfGravado(server.PaginadorPdf):
+    """Guarda o texto de cada linha desenhada, além de gerar o PDF"""
+    instancias = []
+
+    def __init__(self, *args, **kwargs):
+        self.linhas, self.destaques = [], []
+        super().__init__(*args, **kwargs)
+        PdfGravado.instancias.append(self)
+
+    def linha(self, valores, negrito=False):
+        self.linhas.append([str(v) for v in valores])
+        super().linha(valores, negrito)
+
+    def destaque(self, esquerda, direita=''):
+        self.destaques.append(esquerda)
+        super().destaque(esquerda, direita)
+
+
+def test_pdf_com_itens_em_varias_paginas(api, usuario, banco, tmp_path, monkeypatch):
+    monkeypatch.setattr(server, 'PaginadorPdf', PdfGravado)
+    PdfGravado.instancias.clear()
+    empresa = criar_empresa(api, usuario, nome='Loja Exemplo')
+    produto = criar_produto(api, usuario, empresa['id'], nome='Caneta azul', valor_unitario=2.0)
+    criar_nota(api, usuario, empresa['id'], [(produto['id'], 1)] * 150, numero_nf='77')
+    criar_nota(api, usuario, empresa['id'], [(produto['id'], 3)], numero_nf='78')
+    # Emissões distintas: a ordem das notas no PDF não depende do desempate por id
+    emissao = banco.notas_fiscais.find_one({'numero_nf': '77'})['data_emissao']
+    banco.notas_fiscais.update_one({'numero_nf': '78'}, {'$set': {'data_emissao': emissao + timedelta(days=1)}})
+    usuario_id = banco.usuarios.find_one()['id']
+    progresso = []
+
+    caminho = tmp_path / 'relatorio.pdf'
+    server.gerar_pdf(banco, usuario_id, server.RelatorioParametros(itens=True), str(caminho), progresso.append)
+
+    assert caminho.read_bytes().startswith(b'%PDF')
+    (pdf,) = PdfGravado.instancias
+    assert pdf.pagina >= 3
+    assert ['Total de Notas', '2'] in pdf.linhas
+    assert ['Valor Total', 'R$ 306.00'] in pdf.linhas
+    assert pdf.linhas[-1][0] == 'Caneta azul' and pdf.linhas[-1][1] == '3'
+    assert sum(1 for linha in pdf.linhas if linha[0] == 'Caneta azul') == 151
+    assert [d.split(' · ')[0] for d in pdf.destaques] == ['NF 77', 'NF 78']
+    assert progresso[0] == 5
+
+
+def test_pdf_pelo_endpoint(api, usuario):
+    resposta = api.get('/api/relatorios/pdf', headers=usuario)
+    assert resposta.status_code == 200
+    assert resposta.headers['content-type'] == 'application/pdf'
+    assert resposta.content.startswith(b'%PDF')
+
+
+def test_pdf_inclui_itens_das_notas_arquivadas(api, usuario, banco, tmp_path, monkeypatch):
+    monkeypatch.setattr(server, 'PaginadorPdf', PdfGravado)
+    PdfGravado.instancias.clear()
+    empresa = criar_empresa(api, usuario)
+    produto = criar_produto(api, usuario, empresa['id'], nome='Grampo', valor_unitario=5.0)
+    criar_nota(api, usuario, empresa['id'], [(produto['id'], 1), (produto['id'], 2)], numero_nf='10')
+    criar_nota(api, usuario, empresa['id'], [(produto['id'], 4)], numero_nf='11')
+    emissao = banco.notas_fiscais.find_one({'numero_nf': '11'})['data_emissao']
+    banco.notas_fiscais.update_one({'numero_nf': '10'}, {'$set': {'data_emissao': emissao - timedelta(days=400)}})
+    api.portal.call(server.arquivar_notas, 365)
+    assert banco.notas_arquivo.count_documents({}) == 1
+    usuario_id = banco.usuarios.find_one()['id']
+
+    caminho = tmp_path / 'relatorio.pdf'
+    server.gerar_pdf(banco, usuario_id, server.RelatorioParametros(itens=True), str(caminho), lambda _: None)
+
+    (pdf,) = PdfGravado.instancias
+    assert ['Total de Notas', '2'] in pdf.linhas
+    assert [d.split(' · ')[0] for d in pdf.destaques] == ['NF 10', 'NF 11']
+    assert [linha[1] for linha in pdf.linhas if linha[0] == 'Grampo'] == ['1', '2', '4']
@@ -0,0 +1,79 @@
+import asyncio
+
+import mongomock_motor
+
+import server
+from tests.apoio import criar_empresa, criar_produto
+
+CSV = (
+    "nome;codigo;categoria;valor_unitario;aliquota_icms\n"
+    "Parafuso;P1;ferragens;1,50;12\n"
+    "Porca;P2;ferragens;0,75;\n"
+    ";P3;ferragens;abc;200\n"
+)
+
+
+def _importar(api, headers, conteudo: bytes, **params):
+    return api.post('/api/produtos/importar', headers=headers, params=params,
+                    files={'arquivo': ('produtos.csv', conteudo, 'text/csv')})
+
+
+def test_importacao_csv_faz_upsert_por_empresa_e_codigo(api, usuario, banco):
+    empresa = criar_empresa(api, usuario)
+
+    primeira = _importar(api, usuario, CSV.encode(), empresa_id=empresa['id']).json()
+    assert (primeira['total'], primeira['inseridos'], primeira['atualizados'], primeira['erros']) == (3, 2, 0, 1)
+    assert primeira['linhas_com_erro'][0]['linha'] == 4
+    assert sorted(primeira['linhas_com_erro'][0]['erros']) == sorted([
+        "Campo nome obrigatório", "valor_unitario inválido", "aliquota_icms deve estar entre 0 e 100"
+    ])
+    p1 = banco.produtos.find_one({'codigo': 'P1'})
+    assert (p1['valor_unitario'], p1['aliquota_icms']) == (1.5, 12.0)
+    assert banco.produtos.find_one({'codigo': 'P2'})['aliquota_icms'] == 18.0
+
+    segunda = _importar(api, usuario, "nome,codigo,categoria,valor_unitario\nParafuso M6,P1,ferragens,2.00\n".encode(),
+                        empresa_id=empresa['id']).json()
+    assert (segunda['inseridos'], segunda['atualizados']) == (0, 1)
+    assert banco.produtos.count_documents({'codigo': 'P1'}) == 1
+    assert banco.produtos.find_one({'codigo': 'P1'})['id'] == p1['id']
+
+
+def test_importacao_com_encoding(api, usuario, banco):
+    empresa = criar_empresa(api, usuario)
+    conteudo = "nome;codigo;categoria;valor_unitario\nAção;A1;geral;1\n".encode('latin-1')
+
+    assert _importar(api, usuario, conteudo, empresa_id=empresa['id'], encoding='latin-1').json()['inseridos'] == 1
+    assert banco.produtos.find_one({'codigo': 'A1'})['nome'] == 'Ação'
+
+    resposta = _importar(api, usuario, conteudo, empresa_id=empresa['id'], encoding='nao-existe')
+    assert resposta.status_code == 400 and 'nao-existe' in resposta.json()['detail']
+
+
+def test_codigo_repetido_na_mesma_empresa(api, usuario):
+    empresa = criar_empresa(api, usuario)
+    outra = criar_empresa(api, usuario)
+    produto = criar_produto(api, usuario, empresa['id'], codigo='X1')
+    criar_produto(api, usuario, outra['id'], codigo='X1')
+    segundo = criar_produto(api, usuario, empresa['id'], codigo='X2')
+
+    dados = {**produto, 'codigo': 'X1'}
+    assert api.post('/api/produtos', headers=usuario, json=dados).status_code == 400
+    resposta = api.put(f"/api/produtos/{segundo['id']}", headers=usuario, json={**segundo, 'codigo': 'X1'})
+    assert resposta.status_code == 400
+
+
+def test_relatorio_de_produtos_duplicados(banco):
+    """Bases anteriores ao índice único podem ter duplicatas; elas são só reportadas"""
+    banco.produtos.insert_many([
+        {'id': 'a', 'usuario_id': 'u', 'empresa_id': 'e', 'codigo': 'C', 'created_at': 1},
+        {'id': 'b', 'usuario_id': 'u', 'empresa_id': 'e', 'codigo': 'C', 'created_at': 2},
+        {'id': 'c', 'usuario_id': 'u', 'empresa_id': 'e', 'codigo': 'D', 'created_at': 3},
+        {'id': 'd', 'usuario_id': 'u', 'empresa_id': 'f', 'codigo': 'C', 'created_at': 4},
+    ])
+    database = mongomock_motor.AsyncMongoMockClient(mock_mongo_client=banco.client)[banco.name]
+
+    assert asyncio.run(server.produtos_duplicados(database)) == [
+        {'empresa_id': 'e', 'codigo': 'C', 'usuario_id': 'u', 'produto_ids': ['a', 'b'], 'quantidade': 2}
+    ]
+    relatorio = asyncio.run(server.reconciliar_indices(database))
+    assert [e['indice'] for e in relatorio['produtos']['erros']] == ['empresa_codigo_unique']
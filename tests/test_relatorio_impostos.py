@@ -0,0 +1,57 @@
+from tests.apoio import criar_empresa, criar_produto, importar_xmls, xml_nfe
+
+DATAS = ['2024-01-15T10:00:00Z', '2024-02-01T00:00:00Z', '2024-02-28T10:00:00Z', '2024-03-05T10:00:00Z']
+
+
+def _popular(api, usuario):
+    simples = criar_empresa(api, usuario, nome='A Simples', regime_tributario='Simples Nacional')
+    real = criar_empresa(api, usuario, nome='B Real', regime_tributario='Lucro Real')
+    criar_produto(api, usuario, simples['id'], codigo='P1', categoria='ferragens')
+    criar_produto(api, usuario, real['id'], codigo='P1', categoria='papelaria')
+    numeros = iter(range(1, 100))
+    importar_xmls(api, usuario, *[xml_nfe(next(numeros), e['cnpj'], data=d) for d in DATAS for e in (simples, real)])
+    return simples, real
+
+
+def _relatorio(api, usuario, **params):
+    resposta = api.get('/api/relatorios/impostos', headers=usuario, params=params)
+    assert resposta.status_code == 200, resposta.text
+    return resposta.json()
+
+
+def test_periodo_com_bordas_parciais_soma_resumos_e_notas(api, usuario):
+    simples, real = _popular(api, usuario)
+
+    # Janeiro parcial (vazio), fevereiro inteiro pelos resumos e 1 a 10 de março pelas notas
+    relatorio = _relatorio(api, usuario, data_inicio='2024-01-20T00:00:00Z', data_fim='2024-03-10T23:59:59Z')
+
+    assert relatorio['totais']['total_notas'] == 6
+    assert relatorio['totais']['total_valor'] == 120.0
+    assert relatorio['totais']['total_impostos'] == round(6 * (3.6 + 0.33 + 1.52), 2)
+    assert sorted((g['empresa_nome'], g['total_notas']) for g in relatorio['grupos']) == [('A Simples', 3), ('B Real', 3)]
+
+    inteiro = _relatorio(api, usuario, data_inicio='2024-02-01T00:00:00Z', data_fim='2024-02-29T23:59:59.999Z')
+    borda = _relatorio(api, usuario, data_inicio='2024-02-01T00:00:00.001Z', data_fim='2024-02-29T23:59:59.999Z')
+    assert inteiro['totais']['total_notas'] == 4 and borda['totais']['total_notas'] == 2
+
+
+def test_agrupamentos_por_regime_categoria_e_mes(api, usuario):
+    _popular(api, usuario)
+
+    regime = _relatorio(api, usuario, agrupar_por='regime')
+    assert [(g['regime_tributario'], g['total_notas']) for g in regime['grupos']] == \
+        [('Lucro Real', 4), ('Simples Nacional', 4)]
+
+    categoria = _relatorio(api, usuario, agrupar_por='categoria', data_inicio='2024-02-15T00:00:00Z')
+    assert [(g['categoria'], g['total_itens'], g['total_icms']) for g in categoria['grupos']] == \
+        [('ferragens', 2, 7.2), ('papelaria', 2, 7.2)]
+
+    meses = _relatorio(api, usuario, agrupar_por='mes,empresa')
+    assert sorted((g['empresa_nome'], g['mes'], g['total_notas']) for g in meses['grupos'])[:3] == \
+        [('A Simples', '2024-01', 1), ('A Simples', '2024-02', 2), ('A Simples', '2024-03', 1)]
+    assert meses['totais']['total_notas'] == 8
+
+
+def test_agrupamento_invalido(api, usuario):
+    resposta = api.get('/api/relatorios/impostos', headers=usuario, params={'agrupar_por': 'empresa,cidade'})
+    assert resposta.status_code == 400 and 'cidade' in resposta.json()['detail']
@@ -0,0 +1,76 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import server
+from tests.apoio import criar_empresa, criar_nota, criar_produto, registrar
+
+
+def _aguardar(api, headers, job_id):
+    for _ in range(200):
+        job = api.get(f'/api/relatorios/jobs/{job_id}', headers=headers).json()
+        if job['status'] in ('concluido', 'erro'):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} não terminou")
+
+
+def test_job_de_relatorio_gera_e_reaproveita_o_artefato(api, usuario):
+    empresa = criar_empresa(api, usuario)
+    produto = criar_produto(api, usuario, empresa['id'])
+    criar_nota(api, usuario, empresa['id'], [(produto['id'], 2)])
+
+    job = api.post('/api/relatorios/jobs', headers=usuario, json={'tipo': 'pdf'}).json()
+    assert job['status'] in ('pendente', 'processando', 'concluido')
+    assert _aguardar(api, usuario, job['id'])['status'] == 'concluido'
+
+    download = api.get(f"/api/relatorios/jobs/{job['id']}/download", headers=usuario)
+    assert download.status_code == 200 and download.content.startswith(b'%PDF')
+    # Mesmo pedido sobre os mesmos dados reaproveita o job; dados novos geram outro
+    assert api.post('/api/relatorios/jobs', headers=usuario, json={'tipo': 'pdf'}).json()['id'] == job['id']
+    criar_nota(api, usuario, empresa['id'], [(produto['id'], 1)])
+    assert api.post('/api/relatorios/jobs', headers=usuario, json={'tipo': 'pdf'}).json()['id'] != job['id']
+
+
+def test_job_de_outro_usuario_e_tipo_invalido(api, usuario):
+    job = api.post('/api/relatorios/jobs', headers=usuario, json={'tipo': 'pdf'}).json()
+    outro = registrar(api)
+
+    assert api.get(f"/api/relatorios/jobs/{job['id']}", headers=outro).status_code == 404
+    assert api.get(f"/api/relatorios/jobs/{job['id']}/download", headers=outro).status_code == 404
+    assert api.post('/api/relatorios/jobs', headers=usuario, json={'tipo': 'docx'}).status_code == 400
+    _aguardar(api, usuario, job['id'])
+
+
+def test_job_orfao_e_recriado(api, usuario, banco):
+    job = api.post('/api/relatorios/jobs', headers=usuario, json={'tipo': 'pdf'}).json()
+    _aguardar(api, usuario, job['id'])
+    # Simula um worker que morreu no meio da geração
+    banco.relatorios_jobs.update_one({'id': job['id']}, {'$set': {
+        'status': 'processando', 'heartbeat': datetime.now(timezone.utc) - timedelta(hours=1)
+    }})
+
+    resposta = api.get('/api/relatorios/pdf', headers=usuario)
+    assert resposta.status_code == 200 and resposta.content.startswith(b'%PDF')
+    assert banco.relatorios_jobs.count_documents({'id': job['id']}) == 0
+
+
+def test_rota_sincrona_devolve_202_quando_o_job_demora(api, usuario, monkeypatch):
+    liberar = threading.Event()
+    executar = server.executar_relatorio
+
+    def lento(*args):
+        liberar.wait(5)
+        executar(*args)
+
+    monkeypatch.setattr(server, 'executar_relatorio', lento)
+    monkeypatch.setattr(server, 'RELATORIO_ESPERA_SECONDS', 0.2)
+    try:
+        resposta = api.get('/api/relatorios/excel', headers=usuario)
+        assert resposta.status_code == 202
+        job = resposta.json()
+        assert job['status'] in ('pendente', 'processando')
+        assert resposta.headers['Location'] == f"/api/relatorios/jobs/{job['id']}"
+    finally:
+        liberar.set()
+    assert _aguardar(api, usuario, job['id'])['status'] == 'concluido'
@@ -0,0 +1,40 @@
+from tests.apoio import criar_empresa, criar_produto, importar_xmls, xml_nfe
+
+
+def _resumos(banco):
+    return {r['mes']: r for r in banco.resumos.find({}, {'_id': 0})}
+
+
+def test_resumos_acompanham_inclusao_e_exclusao_de_notas(api, usuario, banco):
+    empresa = criar_empresa(api, usuario)
+    arquivos = importar_xmls(api, usuario,
+                             xml_nfe(1, empresa['cnpj'], data='2024-03-05T10:00:00-03:00'),
+                             xml_nfe(2, empresa['cnpj'], data='2024-03-20T10:00:00-03:00'),
+                             # 22h em Brasília já é abril em UTC, o mês de referência dos resumos
+                             xml_nfe(3, empresa['cnpj'], data='2024-03-31T22:00:00-03:00'))['arquivos']
+
+    resumos = _resumos(banco)
+    assert sorted(resumos) == ['2024-03', '2024-04']
+    assert resumos['2024-03']['total_notas'] == 2 and resumos['2024-03']['total_valor'] == 40.0
+    assert resumos['2024-03']['total_icms'] == 7.2
+    assert resumos['2024-04']['total_notas'] == 1 and resumos['2024-04']['empresa_id'] == empresa['id']
+
+    assert api.delete(f"/api/notas/{arquivos[0]['nota_id']}", headers=usuario).status_code == 200
+
+    resumos = _resumos(banco)
+    assert resumos['2024-03']['total_notas'] == 1 and resumos['2024-03']['total_valor'] == 20.0
+    assert resumos['2024-04']['total_notas'] == 1
+
+
+def test_lote_atualiza_resumos(api, usuario, banco):
+    empresa = criar_empresa(api, usuario)
+    produto = criar_produto(api, usuario, empresa['id'], valor_unitario=5.0)
+
+    resposta = api.post('/api/notas/lote', headers=usuario, json={'notas': [
+        {'empresa_id': empresa['id'], 'numero_nf': str(n), 'itens': [{'produto_id': produto['id'], 'quantidade': n}]}
+        for n in (1, 2, 3)
+    ]})
+
+    assert resposta.status_code == 200
+    (resumo,) = _resumos(banco).values()
+    assert resumo['total_notas'] == 3 and resumo['total_valor'] == 30.0
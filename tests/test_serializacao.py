@@ -0,0 +1,22 @@
+import server
+from tests.apoio import criar_empresa, criar_nota, criar_produto
+
+
+def test_caminho_orjson_igual_ao_do_fastapi(api, usuario, monkeypatch):
+    empresa = criar_empresa(api, usuario)
+    produto = criar_produto(api, usuario, empresa['id'])
+    nota = criar_nota(api, usuario, empresa['id'], [(produto['id'], 2)])
+    caminhos = ['/api/empresas', f"/api/empresas/{empresa['id']}", '/api/produtos', f"/api/produtos/{produto['id']}",
+                '/api/notas', f"/api/notas/{nota['id']}", '/api/dashboard']
+
+    rapidas = {caminho: api.get(caminho, headers=usuario) for caminho in caminhos}
+    monkeypatch.setattr(server, 'FAST_JSON_RESPONSES', False)
+    monkeypatch.setattr(server, '_respostas', server.CacheLRU(server.RESPOSTA_CACHE_MAX))
+    validadas = {caminho: api.get(caminho, headers=usuario) for caminho in caminhos}
+
+    for caminho in caminhos:
+        assert rapidas[caminho].status_code == validadas[caminho].status_code == 200
+        assert rapidas[caminho].json() == validadas[caminho].json(), caminho
+    assert rapidas['/api/notas'].headers['X-Total-Count'] == '1'
+    # Datas UTC com sufixo Z, como o Pydantic
+    assert rapidas[f"/api/notas/{nota['id']}"].json()['data_emissao'].endswith('Z')